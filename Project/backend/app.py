@@ -10,7 +10,7 @@ from flask_cors import CORS
 
 import config
 from repository import init_database
-from models import Session
+from models import Session, SessionFactory
 from core import SoloQuizGeneratorLocal as SoloQuizGenerator
 from services.sparql_service import sparql_service
 from services.chatbot_service import chatbot_service
@@ -27,7 +27,8 @@ def _bootstrap_services():
     SoloQuizGenerator()
 
     sparql_service.load_ontology()
-    chatbot_service.set_db_session(Session())
+    # Long-lived and used from request threads, so not a thread-local session
+    chatbot_service.set_db_session(SessionFactory())
 
 
 def create_app():
@@ -35,6 +36,7 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
 
+    config.configure_logging()
     config.ensure_folders()
     config.apply_to(app)
 
@@ -43,6 +45,11 @@ def create_app():
     _bootstrap_services()
     register_routes(app)
 
+    @app.teardown_appcontext
+    def _remove_db_session(exception=None):
+        # Drop the request thread's scoped session (see models.Session)
+        Session.remove()
+
     print("[STARTUP] Starting SOLO Quiz Generator API...")
     return app
 
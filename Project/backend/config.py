@@ -1,5 +1,6 @@
 """Application configuration constants and folder bootstrapping."""
 
+import logging
 import os
 
 from dotenv import load_dotenv
@@ -14,6 +15,10 @@ LESSON_FOLDER = os.path.join(BACKEND_DIR, 'lessons')
 DOWNLOAD_FOLDER = os.path.join(BACKEND_DIR, '..', 'downloaded_quizzes')
 
 ALLOWED_EXTENSIONS = {'pdf'}
+
+# Root log level for modules that use `logging` (DEBUG shows per-call
+# ContentParser progress, INFO only per-lesson milestones).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 MAX_FILE_SIZE = 30 * 1024 * 1024  # 30 MB
 
 # ----- Ollama (single source of truth for every backend module) -----
@@ -26,6 +31,74 @@ OLLAMA_BASE_URL = (
 )
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'qwen2.5:14b-instruct-q4_K_M')
 
+# Smaller model for simple triage passes (enrichment / gap-fill), e.g.
+# qwen2.5:7b-instruct-q4_K_M. Defaults to OLLAMA_MODEL so nothing changes
+# until the smaller model has been pulled.
+OLLAMA_TRIAGE_MODEL = os.getenv('OLLAMA_TRIAGE_MODEL') or OLLAMA_MODEL
+
+# Model for quiz question generation. Defaults to OLLAMA_MODEL; a smaller
+# tag such as qwen2.5:7b-instruct-q4_K_M roughly halves question latency at
+# some quality cost (both models then stay loaded, see OLLAMA_QUIZ_KEEP_ALIVE).
+OLLAMA_QUIZ_MODEL = os.getenv('OLLAMA_QUIZ_MODEL') or OLLAMA_MODEL
+
+# How long Ollama keeps a model loaded after a request. Keeping both the
+# primary and triage model warm avoids a cold load on every switch.
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '10m')
+
+# Keep-alive for the quiz model. -1 pins it in memory for as long as the
+# backend runs (the quiz generator unloads it at exit), so sporadic quiz
+# requests never pay a reload. Ollama takes seconds as a number, or a
+# duration string such as '30m'.
+_quiz_keep_alive = os.getenv('OLLAMA_QUIZ_KEEP_ALIVE', '-1')
+OLLAMA_QUIZ_KEEP_ALIVE = (
+    int(_quiz_keep_alive) if _quiz_keep_alive.lstrip('-').isdigit() else _quiz_keep_alive
+)
+# The pin only holds for a quiz model ContentParser doesn't also use: every
+# parser request sends OLLAMA_KEEP_ALIVE, which would reset a shared model's
+# timer, and unloading it at exit would pull it from under the parser. A
+# shared model (the default, OLLAMA_QUIZ_MODEL unset) uses OLLAMA_KEEP_ALIVE
+# on both sides.
+OLLAMA_QUIZ_MODEL_SHARED = OLLAMA_QUIZ_MODEL in (OLLAMA_MODEL, OLLAMA_TRIAGE_MODEL)
+if OLLAMA_QUIZ_MODEL_SHARED:
+    OLLAMA_QUIZ_KEEP_ALIVE = OLLAMA_KEEP_ALIVE
+
+# Fixed sampling seed for deterministic (temperature=0) extraction calls.
+OLLAMA_SEED = int(os.getenv('OLLAMA_SEED', '42'))
+
+# Context window requested for ContentParser calls. Large enough for a
+# chunk + instructions + JSON output; smaller windows load and prefill faster.
+OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', '4096'))
+
+# Max concurrent requests ContentParser and the quiz generator each send to
+# Ollama. Match the server's own OLLAMA_NUM_PARALLEL (start it with
+# OLLAMA_NUM_PARALLEL=4 OLLAMA_MAX_LOADED_MODELS=1) so parallel calls batch
+# instead of queueing.
+OLLAMA_NUM_PARALLEL = max(1, int(os.getenv('OLLAMA_NUM_PARALLEL', '4')))
+
+# Exact-match prompt -> response cache. Deterministic calls with the same
+# model, options and prompt are answered from disk instead of the LLM.
+OLLAMA_CACHE_ENABLED = os.getenv('OLLAMA_CACHE_ENABLED', '1') == '1'
+OLLAMA_CACHE_PATH = os.getenv(
+    'OLLAMA_CACHE_PATH',
+    os.path.join(BACKEND_DIR, '.cache', 'ollama_responses.sqlite3')
+)
+# Entries also kept in memory (LRU) in front of the SQLite file; 0 disables.
+OLLAMA_CACHE_MEMORY_SIZE = int(os.getenv('OLLAMA_CACHE_MEMORY_SIZE', '256'))
+# Seconds a cached response stays valid (0 = forever). Only deterministic
+# ContentParser calls are persisted; sampled quiz replies are never stored.
+OLLAMA_CACHE_TTL = int(os.getenv('OLLAMA_CACHE_TTL', '0'))
+
+# ContentParser runs one consolidated LLM call per chunk/section by default.
+# Set to 1 to restore the older separate identify/enrich/gap-fill passes
+# (three round-trips each) for A/B comparison.
+QUALITY_MODE_EXTRA_PASSES = os.getenv('QUALITY_MODE_EXTRA_PASSES', '0') == '1'
+
+# How ContentParser finds section boundaries:
+#   'llm'        - ask the model to list sections per chunk (default)
+#   'texttiling' - detect topic shifts lexically, then only ask the model
+#                  for a title per segment (far fewer/lighter LLM calls)
+SECTION_SEGMENTATION = os.getenv('SECTION_SEGMENTATION', 'llm').lower()
+
 
 def ensure_folders():
     """Create upload/lesson/download folders if they don't already exist."""
@@ -33,6 +106,14 @@ def ensure_folders():
         os.makedirs(folder, exist_ok=True)
 
 
+def configure_logging():
+    """Send `logging` output to stderr at LOG_LEVEL."""
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s',
+    )
+
+
 def apply_to(app):
     """Apply config values to a Flask app instance."""
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
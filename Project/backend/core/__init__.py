@@ -5,9 +5,12 @@ Contains content parsing and quiz generation using local Ollama models
 
 from .content_parser import ContentParser, content_parser
 from .quiz_generator import SoloQuizGeneratorLocal
+from .response_cache import ResponseCache, response_cache
 
 __all__ = [
     'ContentParser',
     'content_parser',
-    'SoloQuizGeneratorLocal'
+    'SoloQuizGeneratorLocal',
+    'ResponseCache',
+    'response_cache'
 ]
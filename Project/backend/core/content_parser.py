@@ -9,15 +9,174 @@ MAXIMUM QUALITY VERSION:
 - Extracts MORE sections and learning objects
 """
 
+import hashlib
 import json
+import logging
 import re
+import sys
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
 from PyPDF2 import PdfReader
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib parser
+    orjson = None
 
 # Single source of truth for Ollama URL/model lives in backend/config.py
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
+from config import (
+    OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_TRIAGE_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_SEED, OLLAMA_NUM_CTX, OLLAMA_NUM_PARALLEL,
+    QUALITY_MODE_EXTRA_PASSES, SECTION_SEGMENTATION
+)
+from .json_utils import JsonArrayItemParser, JsonCompletionTracker
+from .response_cache import ResponseCache, response_cache
+
+logger = logging.getLogger(__name__)
+# Library-style default: the application decides where (and whether) logs go
+logger.addHandler(logging.NullHandler())
+
+# Candidate start of a JSON value in free-form model output
+_JSON_START = re.compile(r'[\[{]')
+_JSON_DECODER = json.JSONDecoder()
+# Whole-payload parser for JSON-mode responses (orjson raises a ValueError subclass too)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Approximate tokenizer: one token per word or punctuation mark. Close enough
+# to BPE counts for budgeting chunks without pulling in a model tokenizer.
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+# Sentence / paragraph boundaries; the separator stays with the sentence
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+_WORD_RE = re.compile(r'\S+\s*')
+_INDEX_WORD_RE = re.compile(r'\w+')
+# Trailing type annotation the model sometimes appends, e.g. "Tuple (concept)"
+_TYPE_SUFFIX_RE = re.compile(r'\s*\([^)]*\)\s*$')
+
+
+@lru_cache(maxsize=4096)
+def _clean_title(title: str) -> str:
+    """Drop a trailing type annotation; relationships repeat the same few titles"""
+    return _TYPE_SUFFIX_RE.sub('', title).strip()
+
+
+# Default relationship extraction: every relation type in one JSON-mode call
+# (takes {lo_context} and {n}). Meta-relationships are derived in Python.
+_RELATIONSHIP_CONSOLIDATED_TEMPLATE = """TASK: Find ALL meaningful relationships between these learning objects.
+
+LEARNING OBJECTS ({n}):
+{lo_context}
+
+Use these relationship types:
+Hierarchy (one concept is a type, part or category of another):
+- part_of: A is component/part of B
+- is_type_of: A is a type/kind of B
+- is_example_of: A exemplifies B
+- specialization_of: A is more specific than B
+Learning order (what must come first, what builds on what):
+- prerequisite: A must be learned before B
+- builds_upon: B extends/elaborates A
+- enables: A makes B possible or easier
+- foundation_for: A is foundational for B
+Semantic and cross-topic links:
+- relates_to: Concepts that naturally go together
+- contrasts_with: Opposite or different approaches
+- implements: How a concept is used/applied
+- uses: What a concept depends on
+- defines: Relationship to terminology
+- is_mechanism_of: How it works in broader context
+
+Use the exact learning object titles for source and target.
+Be EXHAUSTIVE, but list each pair only once with its most specific type.
+
+JSON ONLY:
+{{"relationships": [{{"source": "...", "target": "...", "type": "part_of", "description": "..."}}]}}"""
+
+# Types that imply a learning order; chains of them become leads_into edges
+_ORDERING_RELATIONSHIP_TYPES = frozenset({"prerequisite", "builds_upon", "enables", "foundation_for"})
+
+# Relationship-extraction pass prompts, formatted with str.format.
+# Passes 1-3 take {lo_context} (and {n}, the learning object count);
+# pass 4 takes {sample_str}. Literal JSON braces are doubled.
+_RELATIONSHIP_PASS_TEMPLATES = {
+    # Pass 1: hierarchy / taxonomy
+    1: """SPECIALIST TASK: Find HIERARCHICAL and TAXONOMIC relationships ONLY.
+
+LEARNING OBJECTS ({n}):
+{lo_context}
+
+Find relationships where one concept is TYPE, PART, or CATEGORY of another:
+- part_of: A is component/part of B
+- is_type_of: A is a type/kind of B  
+- is_example_of: A exemplifies B
+- specialization_of: A is more specific than B
+
+For EACH pair with hierarchy, output: source, target, type, description
+Be EXHAUSTIVE. Find ALL hierarchical links.
+
+JSON ONLY:
+{{"relationships": [{{"source": "...", "target": "...", "type": "part_of", "description": "..."}}]}}""",
+    # Pass 2: prerequisites & enabling
+    2: """SPECIALIST TASK: Find PREREQUISITE, ENABLING, and BUILDING relationships.
+
+LEARNING OBJECTS:
+{lo_context}
+
+Find dependencies showing learning order:
+- prerequisite: A must be learned before B
+- builds_upon: B extends/elaborates A
+- enables: A makes B possible or easier
+- foundation_for: A is foundational for B
+
+Think: What knowledge comes first? What builds on what? What enables what?
+
+JSON ONLY:
+{{"relationships": [{{"source": "...", "target": "...", "type": "prerequisite", "description": "..."}}]}}""",
+    # Pass 3: semantic, functional and cross-topic links (formerly two passes
+    # that both produced mostly relates_to edges)
+    3: """SPECIALIST TASK: Find SEMANTIC, FUNCTIONAL and CROSS-TOPIC relationships.
+
+LEARNING OBJECTS:
+{lo_context}
+
+Find connections:
+- relates_to: Concepts that naturally go together
+- contrasts_with: Opposite or different approaches
+- implements: How a concept is used/applied
+- uses: What a concept depends on
+- defines: Relationship to terminology
+- is_mechanism_of: How it works in broader context
+
+Also find connections between distant concepts (integration points):
+- How general concepts apply in specific domains
+- Concepts appearing in multiple contexts
+- Integration points spanning topics
+- Applied uses of theoretical concepts
+
+Be creative finding semantic links and bridges between all concepts.
+
+JSON ONLY:
+{{"relationships": [{{"source": "...", "target": "...", "type": "relates_to", "description": "..."}}]}}""",
+    # Pass 4: meta-relationships over a sample of passes 1-3
+    4: """SPECIALIST TASK: Find META-RELATIONSHIPS (relationships between relationships).
+
+Sample relationships found:
+{sample_str}
+
+Find patterns like:
+- If A "prerequisite" B AND B "enables" C → create: prerequisite "leads_into" enables
+- Concept HUBS (connect many others)
+- Relationship chains and dependencies
+- Conceptual bridges
+
+JSON ONLY:
+{{"relationships": [{{"source": "...", "target": "...", "type": "meta_relationship", "description": "..."}}]}}""",
+}
 
 
 class ContentParser:
@@ -33,70 +192,213 @@ class ContentParser:
     - No concern for time - quality is the priority
     """
     
+    # Shared by every instance/thread: caps in-flight Ollama requests at the
+    # server's parallel slot count
+    _ollama_slots = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+    
+    # Last connection probe result, shared across instances for a short TTL
+    _conn_probe = {"ok": None, "at": 0.0}
+    _CONN_PROBE_TTL = 30.0
+    
+    # Bump whenever the section extraction prompts change so per-chunk
+    # cached sections from older prompts are not reused
+    _SECTION_PROMPT_VERSION = 1
+    
     def __init__(self):
         """Initialize the content parser with Ollama configuration"""
         self.ollama_base_url = OLLAMA_BASE_URL
         self.ollama_model = OLLAMA_MODEL
+        # Simpler passes (enrichment, gap-fill) can run on a smaller model
+        self.ollama_model_triage = OLLAMA_TRIAGE_MODEL
         self.provider = "ollama"
+        # Multi-pass relationship extraction skips its prerequisite and meta
+        # passes once pass 1 finds this many relationships per learning
+        # object (and at least 20)
+        self.relation_density_threshold = 2.0
         
-        print(f"[ContentParser] Initialized with Ollama (14B model)")
-        print(f"[ContentParser] Mode: MAXIMUM QUALITY - multi-pass extraction")
+        # One keep-alive connection pool for every Ollama call, sized so each
+        # concurrent request slot has a reusable connection
+        self._http = requests.Session()
+        pool_size = max(8, OLLAMA_NUM_PARALLEL)
+        self._http.mount("http://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self._http.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        
+        logger.info("Initialized with Ollama (14B model)")
+        logger.info("Mode: MAXIMUM QUALITY - multi-pass extraction")
         
         # Test connection
         if not self._test_ollama_connection():
-            print("[ContentParser] WARNING: Could not connect to Ollama server!")
-            print(f"[ContentParser] Make sure Ollama is running on {self.ollama_base_url}")
+            logger.warning("Could not connect to Ollama server!")
+            logger.warning("Make sure Ollama is running on %s", self.ollama_base_url)
     
     def _test_ollama_connection(self) -> bool:
-        """Test if Ollama server is responding"""
+        """Test if Ollama server is responding (result reused for 30s across instances)"""
+        probe = ContentParser._conn_probe
+        if probe["ok"] is not None and time.monotonic() - probe["at"] < self._CONN_PROBE_TTL:
+            return probe["ok"]
+        
         try:
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=5)
-            return response.status_code == 200
+            response = self._http.get(f"{self.ollama_base_url}/api/tags", timeout=2)
+            ok = response.status_code == 200
         except Exception as e:
-            print(f"[ContentParser] Connection test failed: {e}")
-            return False
+            logger.warning("Connection test failed: %s", e)
+            ok = False
+        
+        probe["ok"] = ok
+        probe["at"] = time.monotonic()
+        return ok
     
-    def _call_ollama(self, prompt: str, timeout: int = 300) -> Optional[str]:
+    def _call_ollama(self, prompt: str, timeout: int = 300, json_mode: bool = False,
+                     num_predict: Optional[int] = None, model: Optional[str] = None,
+                     on_item: Optional[Callable[[Any], None]] = None, retries: int = 0,
+                     max_duration: Optional[float] = None) -> Optional[str]:
         """
         Call Ollama API with the 14B model
         
         Args:
             prompt: The prompt to send to the model
-            timeout: Timeout in seconds (default: 300 for quality)
+            timeout: Timeout in seconds (default: 300 for quality) for the
+                connection and for each gap between streamed tokens
+            json_mode: Ask Ollama to constrain output to valid JSON ("format": "json")
+            num_predict: Optional cap on generated tokens
+            model: Model override (defaults to the primary model)
+            on_item: Called with each object of the response's first JSON array
+                as soon as it has fully arrived (also replayed on cache hits)
+            retries: Extra attempts after a timeout, with exponential backoff
+            max_duration: Optional cap in seconds on the whole call, retries
+                and backoff included; no attempt is started or kept running
+                past it
         
         Returns:
             Generated text or None on error
+        
+        Extraction output is made deterministic (temperature 0 + fixed seed)
+        so identical prompts can be answered from the response cache.
+        
+        The response is streamed. For JSON calls the stream is closed as soon
+        as the top-level value is complete, so trailing commentary is never
+        generated (Ollama stops when the client disconnects).
         """
-        try:
-            url = f"{self.ollama_base_url}/api/generate"
-            payload = {
-                "model": self.ollama_model,
-                "prompt": prompt,
-                "stream": False,
-                "temperature": 0.7,
-            }
-            
-            print(f"[ContentParser] Calling Ollama ({len(prompt)} chars prompt)...")
-            response = requests.post(url, json=payload, timeout=timeout)
+        # Options must be nested under "options" - Ollama ignores top-level sampling keys
+        options = {
+            "temperature": 0,
+            "seed": OLLAMA_SEED,
+            "num_ctx": OLLAMA_NUM_CTX,
+        }
+        if num_predict:
+            options["num_predict"] = num_predict
+        if json_mode:
+            # Nothing useful follows the JSON value
+            options["stop"] = ["\n\n\n"]
+        model = model or self.ollama_model
+        cache_key = ResponseCache.make_key(
+            model, prompt, {**options, "format": "json"} if json_mode else options
+        )
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Cache hit (%s chars)", len(cached))
+            if on_item is not None:
+                for item in JsonArrayItemParser().feed(cached):
+                    on_item(item)
+            return cached
+        
+        url = f"{self.ollama_base_url}/api/generate"
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": options,
+        }
+        if json_mode:
+            payload["format"] = "json"
+        
+        deadline = time.monotonic() + max_duration if max_duration else None
+        for attempt in range(retries + 1):
+            if attempt:
+                backoff = 2 ** (attempt - 1)
+                if deadline is not None and time.monotonic() + backoff >= deadline:
+                    logger.error("Ollama call exceeded %ss, not retrying", max_duration)
+                    return None
+                logger.warning("Retrying Ollama call in %ss (attempt %s of %s)", backoff, attempt + 1, retries + 1)
+                time.sleep(backoff)
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            # A silent stall must not outlast the deadline either
+            attempt_timeout = min(timeout, remaining) if remaining is not None else timeout
+            try:
+                result = self._stream_ollama(url, payload, attempt_timeout, json_mode, on_item, remaining)
+            except TimeoutError:
+                logger.error("Ollama call exceeded %ss", max_duration)
+                return None
+            except (requests.Timeout, requests.ConnectionError) as e:
+                # A stalled stream surfaces as ConnectionError(ReadTimeoutError)
+                logger.error("Ollama request failed or timed out after %ss: %s", attempt_timeout, e)
+                continue
+            except Exception as e:
+                logger.error("Ollama error: %s", e)
+                return None
             
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get("response", "")
-                print(f"[ContentParser] Ollama returned {len(result)} chars")
-                if len(result) < 50:
-                    print(f"[ContentParser] WARNING: Very short response: {result}")
-                return result
-            else:
-                print(f"[ContentParser] Ollama error: {response.status_code}")
-                print(f"[ContentParser] Response: {response.text[:200]}")
+            if result is not None:
+                response_cache.set(cache_key, result)
+            return result
+        
+        return None
+    
+    def _stream_ollama(self, url: str, payload: Dict[str, Any], timeout: int, json_mode: bool,
+                       on_item: Optional[Callable[[Any], None]],
+                       max_duration: Optional[float]) -> Optional[str]:
+        """
+        Send one streaming /api/generate request and collect the response text.
+        
+        Returns None on an Ollama error. Timeouts and connection failures
+        propagate so the caller can retry; TimeoutError means `max_duration`
+        (the caller's remaining time) has run out.
+        """
+        logger.debug("Calling Ollama %s (%s chars prompt)...", payload["model"], len(payload["prompt"]))
+        deadline = time.monotonic() + max_duration if max_duration else None
+        with self._ollama_slots, \
+                self._http.post(url, json=payload, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                logger.error("Ollama error: %s - %s", response.status_code, response.text[:200])
                 return None
-                
-        except requests.Timeout:
-            print(f"[ContentParser] Ollama request timed out after {timeout}s")
-            return None
-        except Exception as e:
-            print(f"[ContentParser] Ollama error: {e}")
-            return None
+            
+            tracker = JsonCompletionTracker() if json_mode else None
+            item_parser = JsonArrayItemParser() if on_item is not None else None
+            parts = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    logger.error("Ollama error: %s", chunk['error'])
+                    return None
+                token = chunk.get("response", "")
+                parts.append(token)
+                if item_parser is not None:
+                    for item in item_parser.feed(token):
+                        on_item(item)
+                if tracker is not None and tracker.feed(token):
+                    logger.debug("JSON complete, closing stream early")
+                    break
+                if chunk.get("done"):
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError
+        
+        result = "".join(parts)
+        logger.debug("Ollama returned %s chars", len(result))
+        if len(result) < 50:
+            logger.warning("Very short response: %s", result)
+        return result
+    
+    @staticmethod
+    def _join_pdf_pages(pdf_reader: PdfReader) -> str:
+        """Concatenate page texts with page markers in a single join"""
+        parts = []
+        for page_num, page in enumerate(pdf_reader.pages):
+            parts.append(f"\n--- Page {page_num + 1} ---\n")
+            parts.append(page.extract_text())
+        return "".join(parts)
     
     def extract_pdf_text(self, filepath: str) -> Dict[str, Any]:
         """
@@ -111,11 +413,7 @@ class ContentParser:
         try:
             with open(filepath, 'rb') as file:
                 pdf_reader = PdfReader(file)
-                text_content = ""
-                
-                for page_num, page in enumerate(pdf_reader.pages):
-                    text = page.extract_text()
-                    text_content += f"\n--- Page {page_num + 1} ---\n{text}"
+                text_content = self._join_pdf_pages(pdf_reader)
             
             return {
                 "success": True,
@@ -126,7 +424,7 @@ class ContentParser:
             }
             
         except Exception as e:
-            print(f"[ContentParser] PDF extraction error: {e}")
+            logger.error("PDF extraction error: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -145,11 +443,7 @@ class ContentParser:
         """
         try:
             pdf_reader = PdfReader(stream)
-            text_content = ""
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                text = page.extract_text()
-                text_content += f"\n--- Page {page_num + 1} ---\n{text}"
+            text_content = self._join_pdf_pages(pdf_reader)
             
             return {
                 "success": True,
@@ -160,7 +454,7 @@ class ContentParser:
             }
             
         except Exception as e:
-            print(f"[ContentParser] PDF extraction error: {e}")
+            logger.error("PDF extraction error: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -180,107 +474,398 @@ class ContentParser:
         Returns:
             List of section dictionaries with learning objects
         """
-        print(f"\n[ContentParser] === MEMORY-OPTIMIZED PARSING ===")
-        print(f"[ContentParser] Content length: {len(content)} characters")
-        
-        # Split content into smaller chunks (reduced from 3000 to 2000 chars per chunk)
-        chunks = self._split_content_into_chunks(content, chunk_size=2000, overlap=200)
-        print(f"[ContentParser] Split into {len(chunks)} chunks (smaller chunks for memory efficiency)")
+        logger.info("=== MEMORY-OPTIMIZED PARSING ===")
+        logger.info("Content length: %s characters", len(content))
         
         all_sections = []
         
-        # Single pass: Analyze each chunk for sections
-        for i, chunk in enumerate(chunks):
-            print(f"\n[ContentParser] --- Analyzing chunk {i+1}/{len(chunks)} ---")
-            chunk_sections = self._extract_sections_from_chunk(chunk, lesson_title, i+1, len(chunks))
-            if chunk_sections:
-                all_sections.extend(chunk_sections)
-                print(f"[ContentParser] Chunk {i+1}: Found {len(chunk_sections)} sections")
+        # Optional: find boundaries lexically and only ask the LLM for titles
+        if SECTION_SEGMENTATION == 'texttiling':
+            all_sections = self._extract_sections_by_segmentation(content, lesson_title)
+        
+        if not all_sections:
+            # Pack whole sentences into ~1024-token chunks with ~128 tokens of overlap
+            chunks = self._split_content_into_chunks(content, max_tokens=1024, overlap_tokens=128)
+            logger.debug("Split into %s chunks (sentence-packed, token budgeted)", len(chunks))
+            
+            # Single pass: Analyze each chunk for sections. Identical chunk text
+            # (repeated pages, overlap-only tails) is only sent once.
+            seen_chunks = set()
+            for i, chunk in enumerate(chunks):
+                chunk_hash = hashlib.sha256(chunk.encode('utf-8')).digest()
+                if chunk_hash in seen_chunks:
+                    logger.debug("Chunk %s/%s duplicates an earlier chunk, skipping", i + 1, len(chunks))
+                    continue
+                seen_chunks.add(chunk_hash)
+                
+                logger.debug("--- Analyzing chunk %s/%s ---", i + 1, len(chunks))
+                chunk_sections = self._extract_sections_from_chunk_cached(chunk, lesson_title, i+1, len(chunks))
+                if chunk_sections:
+                    all_sections.extend(chunk_sections)
+                    logger.debug("Chunk %s: Found %s sections", i + 1, len(chunk_sections))
         
         # Merge and deduplicate sections
-        print(f"\n[ContentParser] Merging {len(all_sections)} sections...")
+        logger.info("Merging %s sections...", len(all_sections))
         merged_sections = self._merge_similar_sections(all_sections)
-        print(f"[ContentParser] After merge: {len(merged_sections)} unique sections")
+        logger.info("After merge: %s unique sections", len(merged_sections))
         
         # Limit sections to reasonable amount (allow natural number, max 15 to prevent excessive sections)
         if len(merged_sections) > 15:
-            print(f"[ContentParser] Limiting to 15 sections (was {len(merged_sections)}) - too many redundant sections")
+            logger.info("Limiting to 15 sections (was %s) - too many redundant sections", len(merged_sections))
             merged_sections = merged_sections[:15]
         
         # If too few sections, extract from full content once
         if len(merged_sections) < 2:
-            print(f"[ContentParser] Too few sections, extracting from full content...")
-            merged_sections = self._extract_comprehensive_sections(content[:5000], lesson_title)
+            logger.info("Too few sections, extracting from full content...")
+            merged_sections = self._extract_comprehensive_sections(self._truncate_to_tokens(content, 1300), lesson_title)
         
         # Assign section numbers
         for i, section in enumerate(merged_sections):
             section['section_number'] = i + 1
             section['id'] = i + 1
         
-        # Extract learning objects for each section
-        print(f"\n[ContentParser] Extracting learning objects for {len(merged_sections)} sections...")
+        # Line -> word index built once, shared by every section lookup
+        line_index = self._build_line_index(content)
+        
+        # Extract learning objects for each section. Sections are independent,
+        # so they run concurrently; _call_ollama bounds in-flight requests.
+        logger.info("Extracting learning objects for %s sections...", len(merged_sections))
+        
+        jobs = []
         for section in merged_sections:
             section_title = section.get('title', f"Section {section.get('section_number', 1)}")
             key_topics = section.get('key_topics', [])
             
             # Get content relevant to this section
-            section_content = self._extract_section_content(content, " ".join(key_topics), section_title)
-            
-            # Extract learning objects (reduced from 5-12 to 3-6)
-            learning_objects = self._extract_learning_objects(
-                section_content,
-                section_title,
-                lesson_title
+            section_content = self._extract_section_content(
+                content, " ".join(key_topics), section_title, line_index=line_index
             )
-            
+            jobs.append((section_content, section_title))
+        
+        results = self.extract_learning_objects_batch(jobs, lesson_title)
+        for section, (_, section_title), learning_objects in zip(merged_sections, jobs, results):
             section['learning_objects'] = learning_objects
-            print(f"[ContentParser] Section '{section_title}': {len(learning_objects)} learning objects")
+            logger.debug("Section '%s': %s learning objects", section_title, len(learning_objects))
         
-        print(f"\n[ContentParser] === PARSING COMPLETE ===")
-        print(f"[ContentParser] Total sections: {len(merged_sections)}")
+        logger.info("=== PARSING COMPLETE ===")
+        logger.info("Total sections: %s", len(merged_sections))
         total_los = sum(len(s.get('learning_objects', [])) for s in merged_sections)
-        print(f"[ContentParser] Total learning objects: {total_los}")
+        logger.info("Total learning objects: %s", total_los)
         
         return merged_sections
     
-    def _split_content_into_chunks(self, content: str, chunk_size: int = 3000, overlap: int = 400) -> List[str]:
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Approximate the token count of `text` (words + punctuation marks)"""
+        return len(_TOKEN_RE.findall(text))
+    
+    @staticmethod
+    def _truncate_to_tokens(text: str, max_tokens: int) -> str:
         """
-        Split content into overlapping chunks for analysis.
-        BALANCED: Larger chunks (3000 chars) for better extraction while avoiding huge frontload.
+        Cut `text` after its first `max_tokens` tokens (same estimate as
+        _estimate_tokens), so prompts are bounded by token budget and never
+        end in the middle of a word.
         """
-        chunks = []
-        content_len = len(content)
+        end = None
+        for count, match in enumerate(_TOKEN_RE.finditer(text), 1):
+            if count == max_tokens:
+                end = match.end()
+                break
+        return text if end is None else text[:end]
+    
+    def _split_into_sentences(self, content: str, max_tokens: int) -> List[str]:
+        """
+        Split content at sentence/paragraph boundaries, keeping separators.
+        Sentences longer than `max_tokens` (e.g. PDF text without punctuation)
+        are cut at word boundaries.
+        """
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(content):
+            sentences.append(content[start:match.end()])
+            start = match.end()
+        if start < len(content):
+            sentences.append(content[start:])
+        
+        result = []
+        for sentence in sentences:
+            if self._estimate_tokens(sentence) <= max_tokens:
+                result.append(sentence)
+                continue
+            piece = []
+            piece_tokens = 0
+            for word in _WORD_RE.findall(sentence):
+                word_tokens = self._estimate_tokens(word)
+                if piece and piece_tokens + word_tokens > max_tokens:
+                    result.append("".join(piece))
+                    piece = []
+                    piece_tokens = 0
+                piece.append(word)
+                piece_tokens += word_tokens
+            if piece:
+                result.append("".join(piece))
+        return result
+    
+    def _split_content_into_chunks(self, content: str, max_tokens: int = 1024, overlap_tokens: int = 128,
+                                   max_chunks: int = 10) -> List[str]:
+        """
+        Split content into overlapping, token-budgeted chunks for analysis.
         
-        if content_len <= chunk_size:
+        Whole sentences are packed greedily until the next one would exceed
+        `max_tokens`; the next chunk then backs up whole sentences until it
+        repeats roughly `overlap_tokens` of context.
+        """
+        if self._estimate_tokens(content) <= max_tokens:
             return [content]
         
-        # Allow more chunks for better extraction
-        max_chunks = 10
+        sentences = self._split_into_sentences(content, max_tokens)
+        token_counts = [self._estimate_tokens(sentence) for sentence in sentences]
         
+        chunks = []
         start = 0
-        chunk_count = 0
-        while start < content_len and chunk_count < max_chunks:
-            end = min(start + chunk_size, content_len)
-            chunk = content[start:end]
-            
-            # Try to end at a paragraph break for cleaner chunks
-            if end < content_len:
-                last_break = chunk.rfind('\n\n')
-                if last_break > chunk_size // 2:
-                    chunk = chunk[:last_break]
-                    end = start + last_break
+        while start < len(sentences) and len(chunks) < max_chunks:
+            end = start
+            budget = 0
+            while end < len(sentences) and (end == start or budget + token_counts[end] <= max_tokens):
+                budget += token_counts[end]
+                end += 1
             
-            chunks.append(chunk)
-            start = end - overlap
-            chunk_count += 1
-            
-            if start >= content_len:
+            chunks.append("".join(sentences[start:end]).strip())
+            if end >= len(sentences):
                 break
+            
+            # Back up whole sentences for overlap, but always make progress
+            next_start = end
+            overlap = 0
+            while next_start - 1 > start and overlap + token_counts[next_start - 1] <= overlap_tokens:
+                next_start -= 1
+                overlap += token_counts[next_start]
+            start = next_start
         
         return chunks
     
+    def _segment_by_topic_shift(self, content: str, block_size: int = 5, min_gap: int = 10,
+                                min_depth: float = 0.1, max_segments: int = 15) -> List[str]:
+        """
+        Split content into topical segments with lexical TextTiling.
+        
+        Each gap between sentences is scored by the cosine similarity of the
+        word counts in the `block_size` sentences on either side. Gaps whose
+        similarity dips well below the surrounding peaks (depth score of at
+        least `min_depth`) are topic shifts. Boundaries are picked deepest
+        first, at least `min_gap` sentences apart.
+        """
+        sentences = self._split_into_sentences(content, max_tokens=1024)
+        if len(sentences) < 2 * min_gap:
+            return [content]
+        
+        # Words of 4+ letters: a cheap stopword filter that works for both
+        # English and Serbian lessons
+        bags = [
+            Counter(w for w in _INDEX_WORD_RE.findall(sentence.lower()) if len(w) >= 4)
+            for sentence in sentences
+        ]
+        
+        def cosine(a: Counter, b: Counter) -> float:
+            if not a or not b:
+                return 0.0
+            if len(a) > len(b):
+                a, b = b, a
+            dot = sum(count * b[word] for word, count in a.items() if word in b)
+            norm_a = sum(c * c for c in a.values()) ** 0.5
+            norm_b = sum(c * c for c in b.values()) ** 0.5
+            return dot / (norm_a * norm_b)
+        
+        # gap i sits between sentence i and i + 1
+        raw = []
+        for i in range(len(sentences) - 1):
+            left = Counter()
+            for bag in bags[max(0, i - block_size + 1):i + 1]:
+                left.update(bag)
+            right = Counter()
+            for bag in bags[i + 1:i + 1 + block_size]:
+                right.update(bag)
+            raw.append(cosine(left, right))
+        
+        # Light moving-average smoothing
+        sims = []
+        for i in range(len(raw)):
+            window = raw[max(0, i - 1):i + 2]
+            sims.append(sum(window) / len(window))
+        
+        # Depth score of every local minimum: climb to the nearest peak on each side
+        depths = []
+        for i in range(1, len(sims) - 1):
+            if sims[i] > sims[i - 1] or sims[i] > sims[i + 1]:
+                continue
+            left_peak = i
+            while left_peak > 0 and sims[left_peak - 1] >= sims[left_peak]:
+                left_peak -= 1
+            right_peak = i
+            while right_peak < len(sims) - 1 and sims[right_peak + 1] >= sims[right_peak]:
+                right_peak += 1
+            depth = (sims[left_peak] - sims[i]) + (sims[right_peak] - sims[i])
+            if depth >= min_depth:
+                depths.append((depth, i))
+        
+        boundaries = []
+        for depth, gap in sorted(depths, reverse=True):
+            if len(boundaries) >= max_segments - 1:
+                break
+            cut = gap + 1
+            if cut < min_gap or len(sentences) - cut < min_gap:
+                continue
+            if any(abs(cut - other) < min_gap for other in boundaries):
+                continue
+            boundaries.append(cut)
+        
+        segments = []
+        start = 0
+        for cut in sorted(boundaries) + [len(sentences)]:
+            segments.append("".join(sentences[start:cut]).strip())
+            start = cut
+        return [segment for segment in segments if segment]
+    
+    def _title_segment(self, segment: str, lesson_title: str) -> Optional[Dict]:
+        """Ask the (triage) model for a section title + key topics of one segment"""
+        prompt = f"""Give this part of the lesson "{lesson_title}" a section title.
+
+CONTENT (beginning of the section):
+{self._truncate_to_tokens(segment, 128)}
+
+Return ONLY JSON: {{"title": "Specific Topic Name (IN ENGLISH)", "key_topics": ["keyword1", "keyword2", "keyword3"]}}
+The title must be 3-8 words and IN ENGLISH (translate if needed)."""
+        
+        response = self._call_ollama(prompt, timeout=60, json_mode=True, num_predict=128,
+                                     model=self.ollama_model_triage)
+        result = self._extract_json_from_response(response) if response else None
+        if isinstance(result, dict) and result.get('title'):
+            topics = result.get('key_topics')
+            return {
+                'title': result['title'],
+                'key_topics': topics if isinstance(topics, list) else []
+            }
+        return None
+    
+    def _extract_sections_by_segmentation(self, content: str, lesson_title: str) -> List[Dict]:
+        """
+        Find sections without asking the LLM for boundaries: segment the text
+        by topic shifts, then title each segment with one short call.
+        Returns [] when the text has no clear topic structure so the caller
+        can fall back to LLM section extraction.
+        """
+        segments = self._segment_by_topic_shift(content)
+        logger.info("TextTiling found %s topical segments", len(segments))
+        if len(segments) < 2:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(OLLAMA_NUM_PARALLEL, len(segments))) as executor:
+            titled = list(executor.map(lambda seg: self._title_segment(seg, lesson_title), segments))
+        
+        return [section for section in titled if section]
+    
+    def _extract_sections_from_chunk_cached(self, chunk: str, lesson_title: str, chunk_num: int,
+                                            total_chunks: int) -> List[Dict]:
+        """
+        _extract_sections_from_chunk with results persisted per chunk text.
+        
+        The prompt embeds "PART i OF N", so the same text at another position
+        (or in a re-uploaded, re-chunked lesson) misses the exact prompt
+        cache. The parsed sections are therefore also stored under
+        (model(s), prompt version, lesson title, chunk) in the response cache.
+        """
+        key_options = {
+            "kind": "chunk_sections",
+            "version": self._SECTION_PROMPT_VERSION,
+            "multipass": QUALITY_MODE_EXTRA_PASSES,
+            "lesson": lesson_title,
+        }
+        if QUALITY_MODE_EXTRA_PASSES:
+            # Enrichment and gap-fill passes run on the triage model
+            key_options["triage_model"] = self.ollama_model_triage
+        cache_key = ResponseCache.make_key(self.ollama_model, chunk, key_options)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Reusing cached sections for chunk %s/%s", chunk_num, total_chunks)
+            return json.loads(cached)
+        
+        sections = self._extract_sections_from_chunk(chunk, lesson_title, chunk_num, total_chunks)
+        if sections:
+            response_cache.set(cache_key, json.dumps(sections))
+        return sections
+    
     def _extract_sections_from_chunk(self, chunk: str, lesson_title: str, chunk_num: int, total_chunks: int) -> List[Dict]:
-        """Extract sections from a single chunk with ENHANCED multi-level analysis"""
+        """
+        Extract sections from a single chunk.
+        
+        Identification, enrichment and gap detection are requested in ONE
+        JSON-mode call so the chunk is only prefilled once. The legacy
+        three-call path is kept behind QUALITY_MODE_EXTRA_PASSES.
+        """
+        if QUALITY_MODE_EXTRA_PASSES:
+            return self._extract_sections_from_chunk_multipass(chunk, lesson_title, chunk_num, total_chunks)
+        
+        prompt = f"""You are an expert educational content analyst. Analyze this PART of a lesson and identify ALL distinct topics and sections.
+
+LESSON: {lesson_title}
+PART {chunk_num} OF {total_chunks}
+
+CONTENT:
+{chunk}
+
+CRITICAL INSTRUCTIONS:
+1. Identify EVERY distinct topic, subtopic, and theme in this content
+2. Be thorough and granular - identify 5-12 sections
+3. Each section represents a specific concept, topic, or theme area
+4. Look for: definitions, processes, components, techniques, concepts, relationships, examples
+5. **ALL TITLES MUST BE IN ENGLISH** - translate from any other language
+6. Include implicit topics, not just explicitly stated section headers
+7. Look for patterns: "Introduction to X", "Types of Y", "Process of Z", "Characteristics of W"
+
+Return ONE JSON object with three keys:
+- "sections": every section found, each with "title" and "key_topics"
+- "enrichment": one entry per section (same title) with
+  "importance" (one of foundational, core, supporting, advanced),
+  "related_sections" (other section titles it relates to),
+  "learning_prerequisites" (what must be known first),
+  "subtopics" (2-4 subtopics or related concepts)
+- "additional_sections": only if you found fewer than 4 sections, any further
+  significant topics that should be added (otherwise an empty array)
+
+OUTPUT FORMAT:
+{{"sections": [{{"title": "Specific Topic Name (IN ENGLISH)", "key_topics": ["keyword1", "keyword2"]}}],
+ "enrichment": [{{"title": "Specific Topic Name (IN ENGLISH)", "importance": "core", "related_sections": [], "learning_prerequisites": [], "subtopics": []}}],
+ "additional_sections": []}}
+
+Return ONLY the JSON object. REMEMBER: ALL TITLES IN ENGLISH."""
+        
+        logger.debug("[SECTION EXTRACTION] Analyzing chunk %s/%s...", chunk_num, total_chunks)
+        response = self._call_ollama(prompt, timeout=150, json_mode=True, num_predict=2048)
+        result = self._extract_json_from_response(response) if response else None
+        
+        if isinstance(result, list):
+            # Model ignored the wrapper and returned the bare section list
+            result = {'sections': result}
+        if not isinstance(result, dict):
+            result = {}
+        
+        sections = result.get('sections')
+        if not isinstance(sections, list):
+            sections = []
+        sections = [s for s in sections if isinstance(s, dict)]
+        logger.debug("Found %s initial sections", len(sections))
+        
+        if sections:
+            self._apply_section_enrichment(sections, result.get('enrichment'))
+        
+        if len(sections) < 4 and result.get('additional_sections'):
+            self._add_gap_sections(sections, result.get('additional_sections'))
+        
+        # Return all found sections (up to 12 per chunk naturally)
+        return sections[:12]
+    
+    def _extract_sections_from_chunk_multipass(self, chunk: str, lesson_title: str, chunk_num: int, total_chunks: int) -> List[Dict]:
+        """Extract sections from a single chunk with ENHANCED multi-level analysis (3 LLM calls)"""
         
         # LEVEL 1: Identify major sections
         prompt_l1 = f"""You are an expert educational content analyst. Analyze this PART of a lesson and identify ALL distinct topics and sections.
@@ -300,22 +885,22 @@ CRITICAL INSTRUCTIONS:
 6. Include implicit topics, not just explicitly stated section headers
 7. Look for patterns: "Introduction to X", "Types of Y", "Process of Z", "Characteristics of W"
 
-OUTPUT FORMAT (JSON array):
-[
+OUTPUT FORMAT (JSON object):
+{{"sections": [
   {{"title": "Specific Topic Name (IN ENGLISH)", "key_topics": ["keyword1", "keyword2", "keyword3"]}},
   {{"title": "Another Topic (IN ENGLISH)", "key_topics": ["keywordA", "keywordB"]}}
-]
+]}}
 
-Return ONLY the JSON array with 5-12 sections. Find ALL distinct sections. REMEMBER: ALL TITLES IN ENGLISH."""
+Return ONLY the JSON object with 5-12 sections. Find ALL distinct sections. REMEMBER: ALL TITLES IN ENGLISH."""
         
-        print(f"[ContentParser] [SECTION EXTRACTION] Analyzing chunk {chunk_num}/{total_chunks}...")
-        response_l1 = self._call_ollama(prompt_l1, timeout=150)
-        sections = self._extract_json_from_response(response_l1) if response_l1 else []
+        logger.debug("[SECTION EXTRACTION] Analyzing chunk %s/%s...", chunk_num, total_chunks)
+        response_l1 = self._call_ollama(prompt_l1, timeout=150, json_mode=True)
+        sections = self._extract_json_list(response_l1, 'sections') if response_l1 else []
         
         if not isinstance(sections, list):
             sections = []
         
-        print(f"[ContentParser] Level 1 found {len(sections)} initial sections")
+        logger.debug("Level 1 found %s initial sections", len(sections))
         
         # LEVEL 2: Validate and enrich sections with context
         if len(sections) > 0:
@@ -326,7 +911,7 @@ Return ONLY the JSON array with 5-12 sections. Find ALL distinct sections. REMEM
 SECTIONS: {sections_str}
 
 CONTENT SNIPPET:
-{chunk[:1500]}
+{self._truncate_to_tokens(chunk, 400)}
 
 ---
 
@@ -336,34 +921,26 @@ For each section, determine:
 3. Learning_prerequisites: What must be known before understanding this
 4. Subtopics: 2-4 subtopics or related concepts within this section
 
-Return ONLY JSON array:
-[{{"title": "SectionName", "importance": "...", "related_sections": [...], "learning_prerequisites": [...], "subtopics": [...]}}]"""
+Return ONLY JSON:
+{{"sections": [{{"title": "SectionName", "importance": "...", "related_sections": [...], "learning_prerequisites": [...], "subtopics": [...]}}]}}"""
             
-            response_l2 = self._call_ollama(prompt_l2, timeout=120)
-            enriched = self._extract_json_from_response(response_l2) if response_l2 else {}
+            response_l2 = self._call_ollama(prompt_l2, timeout=120, json_mode=True, model=self.ollama_model_triage)
+            enriched = self._extract_json_list(response_l2, 'sections') if response_l2 else []
             
-            if isinstance(enriched, list):
-                for section in sections:
-                    for enrich_data in enriched:
-                        if enrich_data.get('title', '').lower() == section.get('title', '').lower():
-                            section['importance'] = enrich_data.get('importance', 'core')
-                            section['related_sections'] = enrich_data.get('related_sections', [])
-                            section['learning_prerequisites'] = enrich_data.get('learning_prerequisites', [])
-                            section['subtopics'] = enrich_data.get('subtopics', [])
-                            break
+            self._apply_section_enrichment(sections, enriched)
             
-            print(f"[ContentParser] Level 2 enriched sections with context")
+            logger.debug("Level 2 enriched sections with context")
         
         # LEVEL 3: Gap detection - look for missing sections
         if len(sections) < 4:
-            print(f"[ContentParser] Level 3 gap detection - found only {len(sections)} sections, looking for more...")
+            logger.debug("Level 3 gap detection - found only %s sections, looking for more...", len(sections))
             
             prompt_l3 = f"""This chunk appears to have limited sections. Are there any major topics or concepts NOT in this list?
 
 IDENTIFIED: {", ".join([s.get('title', '') for s in sections])}
 
 CONTENT:
-{chunk[:2000]}
+{self._truncate_to_tokens(chunk, 512)}
 
 ---
 
@@ -372,57 +949,97 @@ List any significant topics, concepts, or sections that should be added. Be thor
 Return ONLY JSON:
 {{"additional_sections": [{{\"title\": \"...\", \"key_topics\": [...]}}]}}"""
             
-            response_l3 = self._call_ollama(prompt_l3, timeout=120)
+            response_l3 = self._call_ollama(prompt_l3, timeout=120, json_mode=True, model=self.ollama_model_triage)
             additional = self._extract_json_from_response(response_l3) if response_l3 else {}
             
             if isinstance(additional, dict) and additional.get('additional_sections'):
-                for add_section in additional.get('additional_sections', [])[:3]:
-                    if add_section.get('title'):
-                        sections.append(add_section)
-                
-                print(f"[ContentParser] Level 3 added {len(additional.get('additional_sections', []))} missing sections")
+                self._add_gap_sections(sections, additional.get('additional_sections'))
         
         # Return all found sections (up to 12 per chunk naturally)
         return sections[:12]
     
+    def _apply_section_enrichment(self, sections: List[Dict], enriched: Any) -> None:
+        """Copy importance/related/prerequisite/subtopic data onto matching sections"""
+        if not isinstance(enriched, list):
+            return
+        for section in sections:
+            for enrich_data in enriched:
+                if not isinstance(enrich_data, dict):
+                    continue
+                if enrich_data.get('title', '').lower() == section.get('title', '').lower():
+                    section['importance'] = enrich_data.get('importance', 'core')
+                    section['related_sections'] = enrich_data.get('related_sections', [])
+                    section['learning_prerequisites'] = enrich_data.get('learning_prerequisites', [])
+                    section['subtopics'] = enrich_data.get('subtopics', [])
+                    break
+    
+    def _add_gap_sections(self, sections: List[Dict], additional: Any) -> None:
+        """Append up to 3 gap-fill sections returned by the model"""
+        if not isinstance(additional, list):
+            return
+        for add_section in additional[:3]:
+            if isinstance(add_section, dict) and add_section.get('title'):
+                sections.append(add_section)
+        
+        logger.debug("Level 3 added %s missing sections", len(additional))
+    
     def _merge_similar_sections(self, sections: List[Dict]) -> List[Dict]:
-        """Merge sections that are too similar to avoid duplication"""
+        """
+        Merge sections that are too similar to avoid duplication.
+        
+        Overlap counts are computed sparsely: every title word / topic keeps a
+        posting list of the sections that contain it, and only sections that
+        share at least one posting are ever compared. Pairs with no shared
+        token score 0 and could never merge, so skipping them is exact.
+        """
         if not sections:
             return []
         
+        # Lowercased token sets computed once per section; tokens are interned
+        # so the posting-list dict lookups below compare by identity
+        prepped = [
+            (
+                section,
+                {sys.intern(w) for w in section.get('title', '').lower().split()},
+                {sys.intern(t.lower()) for t in section.get('key_topics', [])},
+            )
+            for section in sections
+        ]
+        title_words = [title for _, title, _ in prepped]
+        topic_sets = [topics for _, _, topics in prepped]
+        
+        # Sparse co-occurrence: overlap[i][j] = shared token count for i < j
+        title_overlap = self._count_pairwise_overlap(title_words)
+        topic_overlap = self._count_pairwise_overlap(topic_sets)
+        
         merged = []
         used = set()
         
-        for i, section in enumerate(sections):
+        for i, (section, title, topics) in enumerate(prepped):
             if i in used:
                 continue
             
-            title = section.get('title', '').lower()
-            topics = set(t.lower() for t in section.get('key_topics', []))
-            
             # Find similar sections to merge with
             similar_topics = list(section.get('key_topics', []))
             
-            for j, other in enumerate(sections[i+1:], start=i+1):
+            title_row = title_overlap.get(i, {})
+            topic_row = topic_overlap.get(i, {})
+            for j in sorted(title_row.keys() | topic_row.keys()):
                 if j in used:
                     continue
                 
-                other_title = other.get('title', '').lower()
-                other_topics = set(t.lower() for t in other.get('key_topics', []))
+                other, other_title, other_topics = prepped[j]
                 
                 # Check multiple similarity metrics
                 # 1. Title word overlap
-                title_words = set(title.split())
-                other_title_words = set(other_title.split())
-                
                 title_similarity = 0.0
-                if len(title_words) > 0 and len(other_title_words) > 0:
-                    title_similarity = len(title_words.intersection(other_title_words)) / max(len(title_words), len(other_title_words))
+                if len(title) > 0 and len(other_title) > 0:
+                    title_similarity = title_row.get(j, 0) / max(len(title), len(other_title))
                 
                 # 2. Topic overlap (if any topics are the same, likely duplicates)
                 topic_similarity = 0.0
                 if len(topics) > 0 and len(other_topics) > 0:
-                    topic_similarity = len(topics.intersection(other_topics)) / min(len(topics), len(other_topics))
+                    topic_similarity = topic_row.get(j, 0) / min(len(topics), len(other_topics))
                 
                 # 3. Combined score (title similarity matters more)
                 combined_score = (title_similarity * 0.7) + (topic_similarity * 0.3)
@@ -433,8 +1050,8 @@ Return ONLY JSON:
                 if should_merge:
                     used.add(j)
                     similar_topics.extend(other.get('key_topics', []))
-                    print(f"[ContentParser] Merging similar sections (score={combined_score:.2f}):")
-                    print(f"  - '{section.get('title')}' + '{other.get('title')}'")
+                    logger.debug("Merging similar sections (score=%.2f): '%s' + '%s'",
+                                 combined_score, section.get('title'), other.get('title'))
             
             # Remove duplicate topics
             unique_topics = list(dict.fromkeys(similar_topics))
@@ -444,9 +1061,34 @@ Return ONLY JSON:
                 'key_topics': unique_topics[:10]  # Limit topics
             })
         
-        print(f"[ContentParser] After merging: {len(merged)} sections (was {len(sections)})")
+        logger.debug("After merging: %s sections (was %s)", len(merged), len(sections))
         return merged
     
+    @staticmethod
+    def _count_pairwise_overlap(token_sets: List[set]) -> Dict[int, Dict[int, int]]:
+        """
+        Count shared tokens for every pair of sets that share at least one.
+        
+        Equivalent to the upper triangle of X @ X.T for a binary token matrix X,
+        built from posting lists instead of comparing all N^2 pairs.
+        
+        Returns:
+            {i: {j: shared_count}} for i < j
+        """
+        postings: Dict[str, List[int]] = {}
+        for idx, tokens in enumerate(token_sets):
+            for token in tokens:
+                postings.setdefault(token, []).append(idx)
+        
+        overlap: Dict[int, Counter] = defaultdict(Counter)
+        for members in postings.values():
+            # Posting lists are built in index order, so a < b below.
+            # Counter.update counts the tail in C, keeping the inner loop
+            # out of the interpreter.
+            for pos in range(len(members) - 1):
+                overlap[members[pos]].update(members[pos + 1:])
+        return overlap
+    
     def _extract_comprehensive_sections(self, content: str, lesson_title: str) -> List[Dict]:
         """Fallback: Extract sections with comprehensive prompt"""
         
@@ -455,7 +1097,7 @@ Return ONLY JSON:
 LESSON: {lesson_title}
 
 CONTENT:
-{content[:6000]}
+{self._truncate_to_tokens(content, 1600)}
 
 FIND AND LIST all distinct topics and sections. Include:
 1. Major topic areas
@@ -469,44 +1111,101 @@ CRITICAL: **ALL SECTION TITLES MUST BE IN ENGLISH**
 - Use clear English titles for all sections
 - Examples: "Definition of Processes" NOT "Pojam Procesa", "Process Elements" NOT "Elementi Procesa"
 
-JSON array format:
-[
+JSON format:
+{{"sections": [
   {{"title": "Specific Topic Name (IN ENGLISH)", "key_topics": ["keyword1", "keyword2", "keyword3"]}},
   {{"title": "Another Topic (IN ENGLISH)", "key_topics": ["keywordA", "keywordB"]}}
-]
+]}}
 
-Return ONLY the JSON array with 5-15 natural sections (only include if meaningful). ALL TITLES IN ENGLISH."""
+Return ONLY the JSON object with 5-15 natural sections (only include if meaningful). ALL TITLES IN ENGLISH."""
         
-        response = self._call_ollama(prompt, timeout=120)
+        response = self._call_ollama(prompt, timeout=120, json_mode=True)
         
         if not response:
             return [{"title": lesson_title, "key_topics": []}]
         
-        sections = self._extract_json_from_response(response)
-        if isinstance(sections, list) and len(sections) > 0:
+        sections = self._extract_json_list(response, 'sections')
+        if len(sections) > 0:
             return sections[:15]  # Allow up to 15 sections naturally
         
         return [{"title": lesson_title, "key_topics": []}]
     
     def _extract_json_from_response(self, response: str) -> Any:
-        """Extract JSON from LLM response with detailed logging"""
+        """
+        Extract JSON from LLM response with detailed logging
+        
+        Calls made with json_mode return bare JSON and parse with a single
+        loads (orjson when installed). Otherwise (or if the model appended stray tokens) every
+        '[' / '{' is tried with raw_decode until one decodes.
+        """
+        if not response:
+            logger.warning("No JSON found in empty response")
+            return None
+        
         try:
-            # Try to find JSON in the response
-            json_match = re.search(r'\[.*\]|\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                result = json.loads(json_str)
-                print(f"[ContentParser] Successfully extracted JSON: {type(result).__name__}")
-                return result
-            else:
-                print(f"[ContentParser] WARNING: No JSON found in response. Response preview: {response[:200]}")
-        except json.JSONDecodeError as e:
-            print(f"[ContentParser] JSON parse error: {e}")
-            print(f"[ContentParser] Response preview: {response[:300]}")
+            result = _json_loads(response)
+            logger.debug("Successfully extracted JSON: %s", type(result).__name__)
+            return result
+        except ValueError:
+            pass
+        
+        last_error = None
+        for match in _JSON_START.finditer(response):
+            try:
+                result, _ = _JSON_DECODER.raw_decode(response, match.start())
+            except json.JSONDecodeError as e:
+                if last_error is None:
+                    last_error = e
+                continue
+            logger.debug("Successfully extracted JSON: %s", type(result).__name__)
+            return result
+        
+        if last_error is not None:
+            logger.warning("JSON parse error: %s. Response preview: %s", last_error, response[:300])
+        else:
+            logger.warning("No JSON found in response. Response preview: %s", response[:200])
         
         return None
     
-    def _extract_section_content(self, full_content: str, keywords: str, section_title: str) -> str:
+    def _extract_json_list(self, response: str, key: Optional[str] = None) -> List[Any]:
+        """
+        Extract a JSON array from a response.
+        
+        JSON mode always yields an object, so a list is usually wrapped as
+        {"<key>": [...]}. Falls back to the first list-valued field, or wraps
+        a single item object in a list.
+        """
+        result = self._extract_json_from_response(response)
+        if isinstance(result, list):
+            return result
+        if not isinstance(result, dict):
+            return []
+        if key and isinstance(result.get(key), list):
+            return result[key]
+        for value in result.values():
+            if isinstance(value, list):
+                return value
+        if result.get('title') or result.get('source'):
+            return [result]
+        return []
+    
+    def _build_line_index(self, content: str) -> Tuple[List[str], Dict[str, Set[int]]]:
+        """
+        Build a line-level inverted index of the lesson content.
+        
+        Returns:
+            (lines, index) where index maps each lowercase word to the set
+            of line numbers it appears on
+        """
+        lines = content.split('\n')
+        index = defaultdict(set)
+        for line_no, line in enumerate(lines):
+            for word in set(_INDEX_WORD_RE.findall(line.lower())):
+                index[word].add(line_no)
+        return lines, index
+    
+    def _extract_section_content(self, full_content: str, keywords: str, section_title: str,
+                                 line_index: Optional[Tuple[List[str], Dict[str, Set[int]]]] = None) -> str:
         """
         Extract relevant content for a section based on keywords
         
@@ -514,27 +1213,134 @@ Return ONLY the JSON array with 5-15 natural sections (only include if meaningfu
             full_content: Full lesson content
             keywords: Keywords to search for
             section_title: Title of the section
+            line_index: Optional (lines, index) from _build_line_index; built on demand if omitted
             
         Returns:
             Extracted section content
         """
-        # Simple approach: find content around keywords
-        lines = full_content.split('\n')
-        keyword_list = keywords.lower().split()
-        
-        relevant_lines = []
-        for line in lines:
-            line_lower = line.lower()
-            if any(kw in line_lower for kw in keyword_list) or section_title.lower() in line_lower:
-                relevant_lines.append(line)
+        lines, index = line_index if line_index is not None else self._build_line_index(full_content)
+        
+        # Lines containing any keyword (whole-word match via the index)
+        matches = set()
+        for kw in set(_INDEX_WORD_RE.findall(keywords.lower())):
+            postings = index.get(kw)
+            if postings:
+                matches |= postings
+        
+        # Lines containing the full title: intersect the title words' postings,
+        # then confirm the phrase with a substring check on the few survivors
+        title_lower = section_title.lower()
+        title_words = _INDEX_WORD_RE.findall(title_lower)
+        if title_words:
+            postings = [index.get(word, set()) for word in title_words]
+            candidates = set.intersection(*postings) if all(postings) else set()
+            matches |= {i for i in candidates if title_lower in lines[i].lower()}
         
         # If we found matching lines, use them. Otherwise use first part
-        if relevant_lines:
-            return '\n'.join(relevant_lines[:50])  # Limit to 50 lines
+        if matches:
+            selected = sorted(matches)[:50]  # Limit to 50 lines
+            if len(selected) == 1:
+                return lines[selected[0]]
+            return '\n'.join(itemgetter(*selected)(lines))
         
-        return full_content[:1500]  # Fallback: use first 1500 chars
+        return self._truncate_to_tokens(full_content, 400)  # Fallback: use first ~1500 chars
+    
+    def extract_learning_objects_batch(self, sections: List[Tuple[str, str]], lesson_title: str,
+                                       simple: bool = False) -> List[List[Dict]]:
+        """
+        Extract learning objects for several sections concurrently.
+        
+        Args:
+            sections: (section_content, section_title) per section
+            lesson_title: Title of the lesson the sections belong to
+            simple: Use the short single-prompt fallback extractor
+        
+        Returns:
+            One learning object list per section, in input order
+        """
+        if not sections:
+            return []
+        
+        extract = self._extract_learning_objects_simple if simple else self._extract_learning_objects
+        with ThreadPoolExecutor(max_workers=min(OLLAMA_NUM_PARALLEL, len(sections))) as executor:
+            return list(executor.map(
+                lambda section: extract(section[0], section[1], lesson_title), sections
+            ))
     
     def _extract_learning_objects(self, section_content: str, section_title: str, lesson_title: str) -> List[Dict]:
+        """
+        Extract educational learning objects for one section.
+        
+        Core objects, their relationship data and any missed concepts are
+        requested in ONE JSON-mode call. The legacy three-pass path is kept
+        behind QUALITY_MODE_EXTRA_PASSES.
+        """
+        if QUALITY_MODE_EXTRA_PASSES:
+            return self._extract_learning_objects_multipass(section_content, section_title, lesson_title)
+        
+        content_preview = self._truncate_to_tokens(section_content, 800).strip()
+        
+        logger.debug("Extracting learning objects from: %s", section_title)
+        prompt = f"""You are an expert educational content analyst. Extract ALL key learning objects from this section.
+
+LESSON: {lesson_title}
+SECTION: {section_title}
+
+CONTENT:
+{content_preview}
+
+---
+
+EXTRACTION GUIDELINES:
+1. Identify EVERY distinct concept, term, process, or principle mentioned
+2. Extract only UNIQUE, VALUABLE objects - NO forced or duplicate concepts
+3. Include: definitions, key concepts, processes, principles, examples, components
+4. Look for implicit concepts, not just explicitly stated ones
+5. Quality over quantity - better 4 excellent objects than 10 mediocre ones
+6. ALL OUTPUT MUST BE IN ENGLISH (translate if needed)
+
+Return ONE JSON object with three keys:
+- "objects": every learning object, each with
+  title (3-8 words), type (one of concept, definition, process, principle,
+  component, example, technique, structure), description (2-4 sentences),
+  key_points (2-4 facts), keywords (3-6 terms)
+- "relationships": one entry per object (same title) with prerequisites,
+  related_concepts, learning_outcomes, common_misconceptions,
+  real_world_applications
+- "missing_concepts": after re-reading the content, any important concept
+  NOT already in "objects" (title, description, type), or an empty array
+
+OUTPUT FORMAT:
+{{"objects": [{{"title": "...", "type": "...", "description": "...", "key_points": [], "keywords": []}}],
+ "relationships": [{{"title": "...", "prerequisites": [], "related_concepts": [], "learning_outcomes": [], "common_misconceptions": [], "real_world_applications": []}}],
+ "missing_concepts": []}}
+
+Return ONLY the JSON object."""
+        
+        response = self._call_ollama(prompt, timeout=180, json_mode=True, num_predict=2048)
+        result = self._extract_json_from_response(response) if response else None
+        
+        if isinstance(result, list):
+            # Model ignored the wrapper and returned the bare object list
+            result = {'objects': result}
+        if not isinstance(result, dict):
+            result = {}
+        
+        objects = result.get('objects')
+        if not isinstance(objects, list):
+            objects = []
+        objects = [o for o in objects if isinstance(o, dict)]
+        logger.debug("Found %s initial objects", len(objects))
+        
+        if objects:
+            self._apply_lo_relationships(objects, result.get('relationships'))
+        
+        if len(objects) > 2:
+            self._add_missing_concepts(objects, result.get('missing_concepts'))
+        
+        return self._validate_learning_objects(objects)
+    
+    def _extract_learning_objects_multipass(self, section_content: str, section_title: str, lesson_title: str) -> List[Dict]:
         """
         Extract educational learning objects with ENHANCED QUALITY multi-pass analysis.
         
@@ -543,10 +1349,9 @@ Return ONLY the JSON array with 5-15 natural sections (only include if meaningfu
         2. Relationship analysis: Find connections and prerequisites
         3. Quality refinement: Ensure completeness and accuracy
         """
-        content_preview = section_content[:3000].strip()  # Increased from 2000
+        content_preview = self._truncate_to_tokens(section_content, 800).strip()
         
         # PASS 1: Primary extraction with comprehensive prompt
-        print(f"[ContentParser] [PASS 1] Extracting core learning objects from: {section_title}")
         prompt_pass1 = f"""You are an expert educational content analyst. Extract ALL key learning objects from this section.
 
 LESSON: {lesson_title}
@@ -572,19 +1377,19 @@ For each object, provide:
 - key_points: 2-4 important facts or characteristics
 - keywords: 3-6 related search terms (IN ENGLISH)
 
-Return ONLY a valid JSON array with ALL distinct important objects (natural number, not forced):
-[{{"title": "...", "type": "...", "description": "...", "key_points": [...], "keywords": [...]}}]"""
+Return ONLY a valid JSON object with ALL distinct important objects (natural number, not forced):
+{{"objects": [{{"title": "...", "type": "...", "description": "...", "key_points": [...], "keywords": [...]}}]}}"""
         
-        response_pass1 = self._call_ollama(prompt_pass1, timeout=180)
-        objects_pass1 = self._extract_json_from_response(response_pass1) if response_pass1 else []
+        response_pass1 = self._call_ollama(prompt_pass1, timeout=180, json_mode=True)
+        objects_pass1 = self._extract_json_list(response_pass1, 'objects') if response_pass1 else []
         
         if not isinstance(objects_pass1, list):
             objects_pass1 = []
         
-        print(f"[ContentParser] [PASS 1] Found {len(objects_pass1)} initial objects")
+        logger.debug("[PASS 1] Found %s initial objects", len(objects_pass1))
         
         # PASS 2: Relationship and context analysis
-        print(f"[ContentParser] [PASS 2] Analyzing relationships and prerequisites...")
+        logger.debug("[PASS 2] Analyzing relationships and prerequisites...")
         if len(objects_pass1) > 0:
             titles_str = ", ".join([obj.get('title', '') for obj in objects_pass1[:10]])
             
@@ -593,7 +1398,7 @@ Return ONLY a valid JSON array with ALL distinct important objects (natural numb
 EXTRACTED CONCEPTS: {titles_str}
 
 SECTION CONTENT:
-{content_preview[:2000]}
+{self._truncate_to_tokens(content_preview, 512)}
 
 ---
 
@@ -604,28 +1409,19 @@ For each concept listed, add:
 4. Common_misconceptions: Typical student misunderstandings (if applicable)
 5. Real_world_applications: Practical uses or examples (if applicable)
 
-Return ONLY a JSON array with enhanced details:
-[{{"title": "ConceptName", "prerequisites": [...], "related_concepts": [...], "learning_outcomes": [...], "common_misconceptions": [...], "real_world_applications": [...]}}]"""
+Return ONLY a JSON object with enhanced details:
+{{"concepts": [{{"title": "ConceptName", "prerequisites": [...], "related_concepts": [...], "learning_outcomes": [...], "common_misconceptions": [...], "real_world_applications": [...]}}]}}"""
             
-            response_pass2 = self._call_ollama(prompt_pass2, timeout=180)
-            relationships = self._extract_json_from_response(response_pass2) if response_pass2 else {}
+            response_pass2 = self._call_ollama(prompt_pass2, timeout=180, json_mode=True)
+            relationships = self._extract_json_list(response_pass2, 'concepts') if response_pass2 else []
             
             # Merge relationship data into objects
-            if isinstance(relationships, list):
-                for obj in objects_pass1:
-                    for rel_data in relationships:
-                        if rel_data.get('title', '').lower() == obj.get('title', '').lower():
-                            obj['prerequisites'] = rel_data.get('prerequisites', [])
-                            obj['related_concepts'] = rel_data.get('related_concepts', [])
-                            obj['learning_outcomes'] = rel_data.get('learning_outcomes', [])
-                            obj['common_misconceptions'] = rel_data.get('common_misconceptions', [])
-                            obj['real_world_applications'] = rel_data.get('real_world_applications', [])
-                            break
-        
-        print(f"[ContentParser] [PASS 2] Enhanced with relationship data")
+            self._apply_lo_relationships(objects_pass1, relationships)
+        
+        logger.debug("[PASS 2] Enhanced with relationship data")
         
         # PASS 3: Quality check and gap filling
-        print(f"[ContentParser] [PASS 3] Quality verification and gap analysis...")
+        logger.debug("[PASS 3] Quality verification and gap analysis...")
         
         if len(objects_pass1) > 2:
             # Ask AI to identify any missing concepts
@@ -634,7 +1430,7 @@ Return ONLY a JSON array with enhanced details:
 EXTRACTED: {", ".join([obj.get('title', '') for obj in objects_pass1[:8]])}
 
 ORIGINAL CONTENT:
-{content_preview[:2500]}
+{self._truncate_to_tokens(content_preview, 640)}
 
 ---
 
@@ -644,27 +1440,55 @@ List any MISSING key concepts that should be included.
 Return ONLY a JSON object with missing concepts (or empty array if complete):
 {{"missing_concepts": [{{\"title\": \"...\", \"description\": \"...\", \"type\": \"...\"}}]}}"""
             
-            response_pass3 = self._call_ollama(prompt_pass3, timeout=150)
+            response_pass3 = self._call_ollama(prompt_pass3, timeout=150, json_mode=True, model=self.ollama_model_triage)
             missing = self._extract_json_from_response(response_pass3) if response_pass3 else {}
             
-            if isinstance(missing, dict) and missing.get('missing_concepts'):
-                for missing_obj in missing.get('missing_concepts', [])[:3]:  # Add up to 3 missing
-                    if missing_obj.get('title'):
-                        objects_pass1.append({
-                            'title': missing_obj.get('title', 'Unknown')[:150],
-                            'type': missing_obj.get('type', 'concept'),
-                            'description': missing_obj.get('description', '')[:600],
-                            'key_points': [],
-                            'keywords': []
-                        })
-            
-            print(f"[ContentParser] [PASS 3] Added {len(missing.get('missing_concepts', []))} missing concepts")
+            if isinstance(missing, dict):
+                self._add_missing_concepts(objects_pass1, missing.get('missing_concepts'))
+        
+        return self._validate_learning_objects(objects_pass1)
+    
+    def _apply_lo_relationships(self, objects: List[Dict], relationships: Any) -> None:
+        """Copy prerequisite/related/outcome data onto matching learning objects"""
+        if not isinstance(relationships, list):
+            return
+        for obj in objects:
+            for rel_data in relationships:
+                if not isinstance(rel_data, dict):
+                    continue
+                if rel_data.get('title', '').lower() == obj.get('title', '').lower():
+                    obj['prerequisites'] = rel_data.get('prerequisites', [])
+                    obj['related_concepts'] = rel_data.get('related_concepts', [])
+                    obj['learning_outcomes'] = rel_data.get('learning_outcomes', [])
+                    obj['common_misconceptions'] = rel_data.get('common_misconceptions', [])
+                    obj['real_world_applications'] = rel_data.get('real_world_applications', [])
+                    break
+    
+    def _add_missing_concepts(self, objects: List[Dict], missing: Any) -> None:
+        """Append up to 3 gap-fill concepts returned by the model"""
+        if not isinstance(missing, list) or not missing:
+            return
+        for missing_obj in missing[:3]:  # Add up to 3 missing
+            if isinstance(missing_obj, dict) and missing_obj.get('title'):
+                objects.append({
+                    'title': missing_obj.get('title', 'Unknown')[:150],
+                    'type': missing_obj.get('type', 'concept'),
+                    'description': missing_obj.get('description', '')[:600],
+                    'key_points': [],
+                    'keywords': []
+                })
         
+        logger.debug("[PASS 3] Added %s missing concepts", len(missing))
+    
+    def _validate_learning_objects(self, objects: List[Dict]) -> List[Dict]:
+        """Drop untitled/duplicate objects and normalize fields"""
         # Validate and clean all objects
         validated_objects = []
         seen_titles = set()
         
-        for obj in objects_pass1:
+        for obj in objects:
+            if not isinstance(obj, dict):
+                continue
             if not obj.get('title'):
                 continue
             
@@ -689,12 +1513,12 @@ Return ONLY a JSON object with missing concepts (or empty array if complete):
         if len(validated_objects) > 12:
             validated_objects = validated_objects[:12]
         
-        print(f"[ContentParser] [FINAL] Extracted {len(validated_objects)} high-quality learning objects (quality-focused extraction)")
+        logger.debug("[FINAL] Extracted %s high-quality learning objects (quality-focused extraction)", len(validated_objects))
         return validated_objects
     
     def _extract_learning_objects_simple(self, section_content: str, section_title: str, lesson_title: str) -> List[Dict]:
         """Simpler fallback for learning object extraction"""
-        content_preview = section_content[:1500].strip()
+        content_preview = self._truncate_to_tokens(section_content, 400).strip()
         
         prompt = f"""Extract 5-8 key concepts from this educational content.
 
@@ -710,14 +1534,14 @@ For each concept provide (JSON array):
 - description: 2-3 sentence explanation (MUST BE IN ENGLISH)
 - keywords: 3-4 related terms (MUST BE IN ENGLISH)
 
-Extract 5-8 distinct concepts. Return ONLY JSON array."""
+Extract 5-8 distinct concepts. Return ONLY a JSON object: {{"objects": [...]}}"""
         
-        response = self._call_ollama(prompt, timeout=120)
+        response = self._call_ollama(prompt, timeout=120, json_mode=True)
         if not response:
             return []
         
-        objects = self._extract_json_from_response(response)
-        if isinstance(objects, list):
+        objects = self._extract_json_list(response, 'objects')
+        if objects:
             return [{'title': o.get('title', ''), 'type': o.get('type', 'concept'), 
                      'description': o.get('description', ''), 'key_points': o.get('key_points', []), 
                      'keywords': o.get('keywords', [])} for o in objects if o.get('title')][:8]
@@ -731,174 +1555,247 @@ Extract 5-8 distinct concepts. Return ONLY JSON array."""
         IMPROVED: Better fallback if AI extraction fails or times out.
         """
         if not learning_objects:
-            print("[ContentParser] No learning objects to relate")
+            logger.info("No learning objects to relate")
             return []
         
-        # Build descriptions for ALL learning objects
-        lo_descriptions = []
-        all_lo_titles = []
-        
-        for lo in learning_objects:
-            title = lo.get("title", lo.get("name", ""))
-            desc = lo.get("description", "")[:80]
-            type_str = lo.get("type", lo.get("object_type", "concept"))
-            lo_descriptions.append(f"- {title} ({type_str}): {desc}")
-            all_lo_titles.append(title)
+        rows = tuple(
+            (lo.get("title", lo.get("name", "")),
+             lo.get("type", lo.get("object_type", "concept")),
+             lo.get("description", ""))
+            for lo in learning_objects
+        )
+        all_lo_titles = [title for title, _, _ in rows]
+        
+        # One or two objects allow at most a single edge - not worth an LLM call
+        if len(learning_objects) <= 2:
+            logger.info("Only %s learning objects, using fallback relationships", len(learning_objects))
+            return self._generate_smart_fallback_relationships(all_lo_titles, learning_objects)
+        
+        lo_context = self._format_lo_context(rows)
+        
+        # Each relationship is validated the moment its JSON object has
+        # streamed in, so validation overlaps with generation
+        title_index = self._build_title_index(all_lo_titles)
+        
+        if QUALITY_MODE_EXTRA_PASSES:
+            unique_rels, failed_passes = self._extract_relationships_multipass(lo_context, all_lo_titles, title_index)
+        else:
+            logger.info("Extracting relationships between %s learning objects...", len(all_lo_titles))
+            prompt = _RELATIONSHIP_CONSOLIDATED_TEMPLATE.format(lo_context=lo_context, n=len(all_lo_titles))
+            raw, valid = self._run_relationship_pass(prompt, all_lo_titles, title_index) or ([], [])
+            failed_passes = 0 if raw else 1
+            logger.info("Total raw relationships: %s", len(raw))
+            
+            unique_rels = []
+            seen = set()
+            for rel in valid:
+                key = (rel.get('source'), rel.get('target'), rel.get('type'))
+                if key not in seen:
+                    seen.add(key)
+                    unique_rels.append(rel)
+            unique_rels.extend(self._derive_meta_relationships(unique_rels))
+        
+        logger.info("Valid unique relationships: %s", len(unique_rels))
+        
+        if len(unique_rels) < 5 or failed_passes >= 2:
+            logger.info("Few relationships found, adding smart fallback...")
+            fallback = self._generate_smart_fallback_relationships(all_lo_titles, learning_objects)
+            unique_rels.extend(fallback)
         
-        lo_context = "\n".join(lo_descriptions[:50])
+        return unique_rels
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _format_lo_context(rows: Tuple[Tuple[str, str, str], ...]) -> str:
+        """Prompt listing of the first 50 (title, type, description) rows"""
+        return "\n".join(f"- {title} ({type_str}): {desc[:80]}" for title, type_str, desc in rows[:50])
+    
+    def _extract_relationships_multipass(self, lo_context: str, all_lo_titles: List[str],
+                                         title_index: Tuple[Set[str], Dict[str, str]]) -> Tuple[List[Dict], int]:
+        """
+        Legacy relationship extraction: specialist passes per relation family
+        plus an LLM meta pass (QUALITY_MODE_EXTRA_PASSES).
         
-        print("[ContentParser] === MULTI-PASS RELATIONSHIP EXTRACTION (High Quality Mode) ===")
-        print(f"[ContentParser] Analyzing {len(all_lo_titles)} learning objects across 5 specialized passes...")
+        Returns:
+            (relationships, failed_passes) - validated relationships
+            deduplicated across passes, and how many passes failed
+        """
+        logger.info("=== MULTI-PASS RELATIONSHIP EXTRACTION (High Quality Mode) ===")
+        logger.info("Analyzing %s learning objects across 4 specialized passes...", len(all_lo_titles))
         
         all_relationships = []
         
         # ============= PASS 1: HIERARCHICAL TAXONOMY =============
-        print("[ContentParser] [PASS 1] Extracting hierarchical relationships...")
-        prompt_p1 = f"""SPECIALIST TASK: Find HIERARCHICAL and TAXONOMIC relationships ONLY.
-
-LEARNING OBJECTS ({len(all_lo_titles)}):
-{lo_context}
-
-Find relationships where one concept is TYPE, PART, or CATEGORY of another:
-- part_of: A is component/part of B
-- is_type_of: A is a type/kind of B  
-- is_example_of: A exemplifies B
-- specialization_of: A is more specific than B
-
-For EACH pair with hierarchy, output: source, target, type, description
-Be EXHAUSTIVE. Find ALL hierarchical links.
-
-JSON ONLY:
-[{{"source": "...", "target": "...", "type": "part_of", "description": "..."}}]"""
-        
-        r1 = self._call_ollama(prompt_p1, timeout=1200)
-        rels1 = self._extract_json_from_response(r1) if r1 else []
-        if isinstance(rels1, list):
-            all_relationships.extend(rels1)
-            print(f"[ContentParser] [PASS 1] ✓ Found {len(rels1)} hierarchical relationships")
+        logger.debug("[PASS 1] Extracting hierarchical relationships...")
+        prompt_p1 = _RELATIONSHIP_PASS_TEMPLATES[1].format(lo_context=lo_context, n=len(all_lo_titles))
         
         # ============= PASS 2: PREREQUISITES & ENABLING =============
-        print("[ContentParser] [PASS 2] Extracting prerequisite relationships...")
-        prompt_p2 = f"""SPECIALIST TASK: Find PREREQUISITE, ENABLING, and BUILDING relationships.
-
-LEARNING OBJECTS:
-{lo_context}
-
-Find dependencies showing learning order:
-- prerequisite: A must be learned before B
-- builds_upon: B extends/elaborates A
-- enables: A makes B possible or easier
-- foundation_for: A is foundational for B
-
-Think: What knowledge comes first? What builds on what? What enables what?
-
-JSON ONLY:
-[{{"source": "...", "target": "...", "type": "prerequisite", "description": "..."}}]"""
-        
-        r2 = self._call_ollama(prompt_p2, timeout=1200)
-        rels2 = self._extract_json_from_response(r2) if r2 else []
-        if isinstance(rels2, list):
-            all_relationships.extend(rels2)
-            print(f"[ContentParser] [PASS 2] ✓ Found {len(rels2)} prerequisite relationships")
-        
-        # ============= PASS 3: SEMANTIC RELATIONSHIPS =============
-        print("[ContentParser] [PASS 3] Extracting semantic relationships...")
-        prompt_p3 = f"""SPECIALIST TASK: Find SEMANTIC and FUNCTIONAL relationships.
-
-LEARNING OBJECTS:
-{lo_context}
-
-Find connections:
-- relates_to: Concepts that naturally go together
-- contrasts_with: Opposite or different approaches
-- implements: How a concept is used/applied
-- uses: What a concept depends on
-- defines: Relationship to terminology
-- is_mechanism_of: How it works in broader context
-
-Be creative finding semantic links between all concepts.
-
-JSON ONLY:
-[{{"source": "...", "target": "...", "type": "relates_to", "description": "..."}}]"""
-        
-        r3 = self._call_ollama(prompt_p3, timeout=1200)
-        rels3 = self._extract_json_from_response(r3) if r3 else []
-        if isinstance(rels3, list):
-            all_relationships.extend(rels3)
-            print(f"[ContentParser] [PASS 3] ✓ Found {len(rels3)} semantic relationships")
-        
-        # ============= PASS 4: CROSS-SECTION INTEGRATION =============
-        print("[ContentParser] [PASS 4] Extracting cross-section relationships...")
-        prompt_p4 = f"""SPECIALIST TASK: Find relationships ACROSS topics (integration points).
-
-LEARNING OBJECTS:
-{lo_context}
-
-Find connections between distant concepts:
-- How general concepts apply in specific domains
-- Concepts appearing in multiple contexts  
-- Integration points spanning topics
-- Applied uses of theoretical concepts
-
-Look for creative semantic bridges.
-
-JSON ONLY:
-[{{"source": "...", "target": "...", "type": "relates_to", "description": "..."}}]"""
-        
-        r4 = self._call_ollama(prompt_p4, timeout=1200)
-        rels4 = self._extract_json_from_response(r4) if r4 else []
-        if isinstance(rels4, list):
-            all_relationships.extend(rels4)
-            print(f"[ContentParser] [PASS 4] ✓ Found {len(rels4)} cross-section relationships")
-        
-        # ============= PASS 5: META-RELATIONSHIPS =============
-        print("[ContentParser] [PASS 5] Extracting meta-relationships...")
-        rel_sample = []
-        for rel in all_relationships[:20]:
-            rel_sample.append(f"{rel.get('source', '')} --[{rel.get('type', '')}]--> {rel.get('target', '')}")
-        sample_str = "\n".join(rel_sample) if rel_sample else "No relationships yet"
-        
-        prompt_p5 = f"""SPECIALIST TASK: Find META-RELATIONSHIPS (relationships between relationships).
-
-Sample relationships found:
-{sample_str}
-
-Find patterns like:
-- If A "prerequisite" B AND B "enables" C → create: prerequisite "leads_into" enables
-- Concept HUBS (connect many others)
-- Relationship chains and dependencies
-- Conceptual bridges
-
-JSON ONLY:
-[{{"source": "...", "target": "...", "type": "meta_relationship", "description": "..."}}]"""
+        prompt_p2 = _RELATIONSHIP_PASS_TEMPLATES[2].format(lo_context=lo_context, n=len(all_lo_titles))
+        
+        # ============= PASS 3: SEMANTIC + CROSS-SECTION RELATIONSHIPS =============
+        prompt_p3 = _RELATIONSHIP_PASS_TEMPLATES[3].format(lo_context=lo_context, n=len(all_lo_titles))
+        
+        def run_pass(prompt):
+            return self._run_relationship_pass(prompt, all_lo_titles, title_index)
+        
+        # Passes 1 and 3 always run, concurrently (bounded by the Ollama slot
+        # semaphore in _call_ollama). When pass 1 alone comes back dense, the
+        # prerequisite and meta passes add little and are skipped.
+        dense_at = max(20, self.relation_density_threshold * len(all_lo_titles))
+        logger.debug("[PASS 1-3] Extracting relationships concurrently...")
+        with ThreadPoolExecutor(max_workers=min(OLLAMA_NUM_PARALLEL, 3)) as executor:
+            future_p1 = executor.submit(run_pass, prompt_p1)
+            future_p3 = executor.submit(run_pass, prompt_p3)
+            result_p1 = future_p1.result()
+            dense = result_p1 is not None and len(result_p1[1]) >= dense_at
+            if dense:
+                logger.debug("[PASS 2] Skipped - pass 1 already found %s relationships", len(result_p1[1]))
+                future_p2 = None
+            else:
+                future_p2 = executor.submit(run_pass, prompt_p2)
+            
+            pass_results = [(1, "hierarchical", result_p1)]
+            if future_p2 is not None:
+                pass_results.append((2, "prerequisite", future_p2.result()))
+            pass_results.append((3, "semantic/cross-section", future_p3.result()))
         
-        r5 = self._call_ollama(prompt_p5, timeout=1200)
-        rels5 = self._extract_json_from_response(r5) if r5 else []
-        if isinstance(rels5, list):
-            all_relationships.extend(rels5)
-            print(f"[ContentParser] [PASS 5] ✓ Found {len(rels5)} meta-relationships")
+        # Collected in pass order so results don't depend on completion order;
+        # duplicates across passes are dropped as each pass is appended
+        seen = set()
+        unique_rels = []
         
-        print(f"[ContentParser] Total raw relationships: {len(all_relationships)}")
+        def collect(valid):
+            for rel in valid:
+                key = (rel.get('source'), rel.get('target'), rel.get('type'))
+                if key not in seen:
+                    seen.add(key)
+                    unique_rels.append(rel)
+        
+        failed_passes = 0
+        for pass_num, kind, result in pass_results:
+            if result is None:
+                failed_passes += 1
+                logger.warning("[PASS %s] %s pass failed", pass_num, kind)
+                continue
+            raw, valid = result
+            if raw:
+                all_relationships.extend(raw)
+                collect(valid)
+                logger.debug("[PASS %s] ✓ Found %s %s relationships", pass_num, len(raw), kind)
+        
+        # ============= PASS 4: META-RELATIONSHIPS =============
+        # Needs a few real relationships to reason about; otherwise the
+        # prompt has nothing to work with and only burns a long call
+        if failed_passes >= 2:
+            logger.debug("[PASS 4] Skipping meta-relationships (%s passes failed)", failed_passes)
+        elif dense:
+            logger.debug("[PASS 4] Skipping meta-relationships (pass 1 was dense)")
+        elif len(all_relationships) < 3:
+            logger.debug("[PASS 4] Skipping meta-relationships (only %s relationships so far)",
+                         len(all_relationships))
+        else:
+            logger.debug("[PASS 4] Extracting meta-relationships...")
+            rel_sample = []
+            for rel in all_relationships[:20]:
+                rel_sample.append(f"{rel.get('source', '')} --[{rel.get('type', '')}]--> {rel.get('target', '')}")
+            sample_str = "\n".join(rel_sample)
+            
+            prompt_p4 = _RELATIONSHIP_PASS_TEMPLATES[4].format(sample_str=sample_str)
+            
+            raw4, valid4 = self._run_relationship_pass(prompt_p4, all_lo_titles, title_index) or ([], [])
+            if raw4:
+                all_relationships.extend(raw4)
+                collect(valid4)
+                logger.debug("[PASS 4] ✓ Found %s meta-relationships", len(raw4))
         
-        valid_relationships = self._validate_relationships(all_relationships, all_lo_titles)
+        logger.info("Total raw relationships: %s", len(all_relationships))
         
-        # Deduplicate
-        seen = set()
-        unique_rels = []
-        for rel in valid_relationships:
-            key = (rel.get('source'), rel.get('target'), rel.get('type'))
-            if key not in seen:
-                seen.add(key)
-                unique_rels.append(rel)
+        return unique_rels, failed_passes
+    
+    def _run_relationship_pass(self, prompt: str, all_lo_titles: List[str],
+                               title_index: Tuple[Set[str], Dict[str, str]]) -> Optional[Tuple[List[Dict], List[Dict]]]:
+        """
+        Run one relationship-extraction prompt, validating streamed items as they arrive.
         
-        print(f"[ContentParser] Valid unique relationships: {len(unique_rels)}")
+        Items repeated verbatim within the pass are dropped before validation.
+        A stalled call is retried once, then given up on so a single stuck
+        pass can't hold the whole extraction.
         
-        if len(unique_rels) < 5:
-            print("[ContentParser] Few relationships found, adding smart fallback...")
-            fallback = self._generate_smart_fallback_relationships(all_lo_titles, learning_objects)
-            unique_rels.extend(fallback)
+        Returns:
+            (raw, valid) - the distinct relationship objects the model
+            produced, and the ones that matched learning object titles -
+            or None if the call failed
+        """
+        raw = []
+        valid = []
+        seen_raw = set()
+        
+        def on_item(item):
+            if isinstance(item, dict):
+                key = (str(item.get('source')), str(item.get('target')), str(item.get('type')))
+                if key in seen_raw:
+                    return
+                seen_raw.add(key)
+            raw.append(item)
+            valid.extend(self._validate_relationships([item], all_lo_titles, title_index=title_index))
+        
+        response = self._call_ollama(prompt, timeout=180, json_mode=True, on_item=on_item,
+                                     retries=1, max_duration=240)
+        if response is None:
+            return None
+        if not raw:
+            # Not a streamed array (e.g. a single relationship object) - parse it whole
+            for item in self._extract_json_list(response, 'relationships'):
+                on_item(item)
+        return raw, valid
+    
+    @staticmethod
+    def _derive_meta_relationships(relationships: List[Dict], max_chains: int = 20) -> List[Dict]:
+        """
+        Derive meta-relationships from the relationship graph without an LLM call.
         
-        return unique_rels
+        Two-step learning-order chains (A -> B -> C over prerequisite-like
+        types) become `leads_into` edges A -> C unless A and C are already
+        linked. Hubs (more than 3 incoming edges) are logged.
+        """
+        linked = set()
+        in_degree = Counter()
+        successors = defaultdict(list)
+        for rel in relationships:
+            source, target = rel.get('source'), rel.get('target')
+            linked.add((source, target))
+            in_degree[target] += 1
+            if rel.get('type') in _ORDERING_RELATIONSHIP_TYPES:
+                successors[source].append(target)
+        
+        hubs = [title for title, count in in_degree.most_common() if count > 3]
+        if hubs:
+            logger.debug("Concept hubs: %s", ", ".join(hubs))
+        
+        derived = []
+        for source, middles in successors.items():
+            for middle in middles:
+                for target in successors.get(middle, ()):
+                    if target == source or (source, target) in linked:
+                        continue
+                    linked.add((source, target))
+                    derived.append({
+                        "source": source,
+                        "target": target,
+                        "type": "leads_into",
+                        "description": f"{source} leads into {target} via {middle}"
+                    })
+                    if len(derived) >= max_chains:
+                        return derived
+        return derived
+    
+    @staticmethod
+    def _group_by_type(learning_objects: List[Dict]) -> Dict[str, List[str]]:
+        """Learning object titles grouped by lowercased type, in input order"""
+        type_groups = defaultdict(list)
+        for lo in learning_objects:
+            type_groups[lo.get('type', lo.get('object_type', 'concept')).lower()].append(lo.get('title', ''))
+        return type_groups
     
     def _generate_smart_fallback_relationships(self, all_lo_titles: List[str], learning_objects: List[Dict]) -> List[Dict]:
         """
@@ -908,15 +1805,7 @@ JSON ONLY:
         relationships = []
         
         # Strategy 1: Type-based hierarchies
-        type_groups = {}
-        for lo in learning_objects:
-            obj_type = lo.get('type', lo.get('object_type', 'concept')).lower()
-            if obj_type not in type_groups:
-                type_groups[obj_type] = []
-            type_groups[obj_type].append(lo['title'])
-        
-        # Create type hierarchies
-        for obj_type, titles in type_groups.items():
+        for obj_type, titles in self._group_by_type(learning_objects).items():
             if len(titles) > 1:
                 # First is general, others are specific
                 general = titles[0]
@@ -940,27 +1829,32 @@ JSON ONLY:
                     "description": f"{source} should be learned before {target}"
                 })
         
-        # Strategy 3: Keyword-based relationships
-        for i, lo1 in enumerate(learning_objects):
-            keywords1 = set(lo1.get('keywords', []))
-            if not keywords1:
-                continue
-            for j in range(i + 1, min(i + 4, len(learning_objects))):
-                lo2 = learning_objects[j]
-                keywords2 = set(lo2.get('keywords', []))
-                # If they share keywords, they're related
-                if keywords1 & keywords2:
-                    title1 = lo1['title']
-                    title2 = lo2['title']
-                    if title1 != title2:
-                        relationships.append({
-                            "source": title1,
-                            "target": title2,
-                            "type": "relates_to",
-                            "description": f"Both relate to: {', '.join(list(keywords1 & keywords2)[:3])}"
-                        })
+        # Strategy 3: Keyword-based relationships. Shared-keyword counts for
+        # every pair come from one sparse co-occurrence pass (K @ K.T) rather
+        # than comparing keyword sets pair by pair; each object keeps its
+        # strongest few partners so the fallback stays readable.
+        keyword_lists = [
+            [kw for kw in (lo.get('keywords') or []) if isinstance(kw, str)]
+            for lo in learning_objects
+        ]
+        keyword_sets = [set(keywords) for keywords in keyword_lists]
+        shared_counts = self._count_pairwise_overlap(keyword_sets)
+        
+        for i in sorted(shared_counts):
+            partners = sorted(shared_counts[i].items(), key=lambda item: (-item[1], item[0]))[:3]
+            for j, _ in partners:
+                title1 = learning_objects[i]['title']
+                title2 = learning_objects[j]['title']
+                if title1 != title2:
+                    shared = [kw for kw in keyword_lists[i] if kw in keyword_sets[j]]
+                    relationships.append({
+                        "source": title1,
+                        "target": title2,
+                        "type": "relates_to",
+                        "description": f"Both relate to: {', '.join(shared[:3])}"
+                    })
         
-        print(f"[ContentParser] Generated {len(relationships)} smart fallback relationships")
+        logger.info("Generated %s smart fallback relationships", len(relationships))
         return relationships
     
     def _generate_fallback_relationships(self, all_lo_titles: List[str], learning_objects: List[Dict]) -> List[Dict]:
@@ -969,6 +1863,8 @@ JSON ONLY:
         Based on learning object types and ordering.
         """
         relationships = []
+        # (source, target) pairs already emitted, for O(1) existence checks
+        seen = set()
         
         # Strategy 1: Create prerequisites based on ordering
         for i in range(len(all_lo_titles) - 1):
@@ -981,17 +1877,11 @@ JSON ONLY:
                     "type": "prerequisite",
                     "description": f"{source} is typically learned before {target}"
                 })
+                seen.add((source, target))
         
-        # Strategy 2: Group by type and create hierarchies
-        type_groups = {}
-        for lo in learning_objects:
-            obj_type = lo.get('type', lo.get('object_type', 'concept')).lower()
-            if obj_type not in type_groups:
-                type_groups[obj_type] = []
-            type_groups[obj_type].append(lo.get('title', ''))
-        
+        # Strategy 2: Group by type and create hierarchies.
         # For each type group with multiple items, create part_of relationships
-        for obj_type, titles in type_groups.items():
+        for obj_type, titles in self._group_by_type(learning_objects).items():
             if len(titles) > 1:
                 # The first one is the parent/general concept
                 parent = titles[0]
@@ -1003,6 +1893,7 @@ JSON ONLY:
                             "type": "part_of",
                             "description": f"{child} is part of or related to {parent}"
                         })
+                        seen.add((child, parent))
         
         # Strategy 3: Create related_to for adjacent concepts
         for i in range(len(all_lo_titles)):
@@ -1011,55 +1902,67 @@ JSON ONLY:
                 target = all_lo_titles[j]
                 if source and target and source != target:
                     # Check if this relationship doesn't already exist
-                    exists = any(r['source'] == source and r['target'] == target for r in relationships)
-                    if not exists:
+                    if (source, target) not in seen:
                         relationships.append({
                             "source": source,
                             "target": target,
                             "type": "related_to",
                             "description": f"{source} is related to {target}"
                         })
+                        seen.add((source, target))
         
-        print(f"[ContentParser] Generated {len(relationships)} fallback relationships")
+        logger.info("Generated %s fallback relationships", len(relationships))
         return relationships
     
-    def _validate_relationships(self, relationships: List[Dict], all_lo_titles: List[str]) -> List[Dict]:
-        """Validate relationships and match against learning object titles"""
-        valid_relationships = []
-        title_set = set(all_lo_titles)
-        
-        # Create normalized mapping
+    @staticmethod
+    def _build_title_index(all_lo_titles: List[str]) -> Tuple[Set[str], Dict[str, str]]:
+        """Exact title set + normalized (stripped, lowercased) -> original title map"""
         normalized_to_original = {}
         for title in all_lo_titles:
-            normalized = title.strip().lower()
-            normalized_to_original[normalized] = title
+            normalized_to_original[title.strip().lower()] = title
+        return set(all_lo_titles), normalized_to_original
+    
+    def _validate_relationships(self, relationships: List[Dict], all_lo_titles: List[str],
+                                title_index: Optional[Tuple[Set[str], Dict[str, str]]] = None) -> List[Dict]:
+        """
+        Validate relationships and match against learning object titles
         
-        def clean_title(title):
-            """Remove type metadata like (concept), (definition), etc"""
-            cleaned = re.sub(r'\s*\([^)]*\)\s*$', '', title).strip()
-            return cleaned
+        Args:
+            relationships: Raw relationships from the model
+            all_lo_titles: Titles of the lesson's learning objects
+            title_index: Optional precomputed _build_title_index(all_lo_titles)
+        """
+        valid_relationships = []
+        title_set, normalized_to_original = title_index or self._build_title_index(all_lo_titles)
         
         for rel in relationships:
-            source = rel.get("source", "").strip()
-            target = rel.get("target", "").strip()
+            if not isinstance(rel, dict):
+                continue
+            source = str(rel.get("source") or "").strip()
+            target = str(rel.get("target") or "").strip()
+            
+            # Remove type metadata like (concept), (definition), etc
+            source_clean = _clean_title(source)
+            target_clean = _clean_title(target)
             
-            source_clean = clean_title(source)
-            target_clean = clean_title(target)
+            # Self-loops can never be valid, whichever way they match
+            if source_clean == target_clean:
+                continue
             
             # Try exact match first
-            if source_clean in title_set and target_clean in title_set and source_clean != target_clean:
+            if source_clean in title_set and target_clean in title_set:
                 rel["source"] = source_clean
                 rel["target"] = target_clean
                 valid_relationships.append(rel)
             else:
                 # Try fuzzy matching (normalized comparison)
-                source_normalized = source_clean.lower()
-                target_normalized = target_clean.lower()
+                source_original = normalized_to_original.get(source_clean.lower())
+                target_original = normalized_to_original.get(target_clean.lower())
                 
-                if source_normalized in normalized_to_original and target_normalized in normalized_to_original:
-                    rel["source"] = normalized_to_original[source_normalized]
-                    rel["target"] = normalized_to_original[target_normalized]
-                    if rel["source"] != rel["target"]:
+                if source_original is not None and target_original is not None:
+                    rel["source"] = source_original
+                    rel["target"] = target_original
+                    if source_original != target_original:
                         valid_relationships.append(rel)
         
         return valid_relationships
@@ -1074,13 +1977,25 @@ JSON ONLY:
             
         Returns:
             Summary text or None if generation fails
+        
+        Summaries are stored per (model, lesson title, content), so
+        re-ingesting or retrying an unchanged lesson skips the LLM even if
+        generation options have changed since.
         """
+        cache_key = ResponseCache.make_key(
+            self.ollama_model, content, {"kind": "lesson_summary", "lesson": lesson_title}
+        )
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Reusing cached summary for %s", lesson_title)
+            return cached
+        
         prompt = f"""Create a concise educational summary of this lesson.
 
 LESSON: {lesson_title}
 
 CONTENT:
-{content[:4000]}
+{self._truncate_to_tokens(content, 1024)}
 
 ---
 
@@ -1094,7 +2009,9 @@ Write in clear, academic English. Keep it concise but comprehensive."""
         response = self._call_ollama(prompt, timeout=120)
         
         if response and len(response) > 50:
-            return response.strip()
+            summary = response.strip()
+            response_cache.set(cache_key, summary)
+            return summary
         
         return None
 
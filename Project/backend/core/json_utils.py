@@ -0,0 +1,140 @@
+"""
+JSON Utilities Module
+Helpers for working with JSON produced token-by-token by an LLM
+"""
+
+import json
+from typing import Any, List, Optional
+
+
+class JsonCompletionTracker:
+    """
+    Incrementally tracks bracket depth of streamed text.
+
+    Feed text fragments as they arrive; `complete` flips to True as soon as
+    the first top-level JSON array/object closes, and `end` is the offset
+    just past the closing bracket in the fragment that closed it (anything
+    after it is trailing text). Brackets inside string literals (including
+    escaped quotes) are ignored. Each character is inspected exactly once,
+    so checking after every token stays O(n).
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.complete = False
+        self.end = None
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Consume `text`; return True once the top-level value has closed"""
+        if self.complete:
+            return True
+
+        for pos, ch in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                # Strings only matter once we're inside the JSON value
+                if self.started:
+                    self._in_string = True
+            elif ch in '[{':
+                self.started = True
+                self.depth += 1
+            elif ch in ']}':
+                if not self.started:
+                    continue
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+                    self.end = pos + 1
+                    return True
+
+        return False
+
+
+class JsonArrayItemParser:
+    """
+    Incrementally yields the object items of the first JSON array in a stream.
+
+    Works for a bare array (`[{...}, {...}]`) and for the wrapped form JSON
+    mode produces (`{"relationships": [{...}, {...}]}`): whichever array
+    opens first is the one whose items are emitted. Each item is decoded as
+    soon as its closing brace arrives, so callers can start working on
+    early items while the model is still generating later ones.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = []
+        self._base = 0  # absolute offset of the first buffered character
+        self._pos = 0
+        self._depth = 0
+        self._array_depth = None
+        self._item_start = None
+        self._in_string = False
+        self._escaped = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        """Consume `text`; return the items completed by it (possibly none)"""
+        items = []
+        if self.done or not text:
+            return items
+
+        self._buffer.append(text)
+        for ch in text:
+            pos = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in '[{':
+                self._depth += 1
+                if ch == '[' and self._array_depth is None:
+                    self._array_depth = self._depth
+                elif (ch == '{' and self._array_depth is not None
+                      and self._depth == self._array_depth + 1):
+                    self._item_start = pos
+            elif ch in ']}':
+                if (ch == '}' and self._item_start is not None
+                        and self._depth == self._array_depth + 1):
+                    item = self._decode(self._item_start, pos + 1)
+                    if item is not None:
+                        items.append(item)
+                    self._item_start = None
+                elif ch == ']' and self._depth == self._array_depth:
+                    self.done = True
+                    break
+                self._depth -= 1
+
+        return items
+
+    def _decode(self, start: int, end: int) -> Optional[Any]:
+        """Decode the absolute range [start, end) and drop text before `end`"""
+        text = "".join(self._buffer)
+        item_text = text[start - self._base:end - self._base]
+        # Everything up to the item's end has been consumed
+        self._buffer = [text[end - self._base:]]
+        self._base = end
+        try:
+            return self._decoder.decode(item_text)
+        except ValueError:
+            return None
@@ -9,16 +9,477 @@ MAXIMUM QUALITY VERSION:
 - No concern for API costs - running locally
 """
 
+import atexit
+import io
 import json
 import re
 import requests
+from requests.adapters import HTTPAdapter
 import hashlib
 import random
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from itertools import islice
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Set
+from typing import Callable, Dict, Iterable, List, Any, Optional, Set, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json module
+    orjson = None
 
 # Single source of truth for Ollama URL/model lives in backend/config.py
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
+from config import (
+    OLLAMA_BASE_URL, OLLAMA_QUIZ_MODEL, OLLAMA_QUIZ_MODEL_SHARED, OLLAMA_QUIZ_KEEP_ALIVE,
+    OLLAMA_NUM_CTX, OLLAMA_NUM_PARALLEL,
+)
+from .json_utils import JsonCompletionTracker
+from .response_cache import ResponseCache
+
+
+def _build_ollama_session() -> requests.Session:
+    """Keep-alive session with one pooled connection per concurrent request"""
+    session = requests.Session()
+    pool_size = max(8, OLLAMA_NUM_PARALLEL)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Close the pooled keep-alive connections cleanly on interpreter exit
+    atexit.register(session.close)
+    return session
+
+
+def _keep_alive_pinned(keep_alive: Any) -> bool:
+    """True for a keep_alive that never unloads (negative seconds or duration)"""
+    if isinstance(keep_alive, (int, float)):
+        return keep_alive < 0
+    return str(keep_alive).startswith('-')
+
+
+def _join_capped(lines: Iterable[str], limit: int) -> str:
+    """
+    Equivalent to "\n".join(lines)[:limit], but stops pulling lines once
+    `limit` characters have been written, so the rest of a large lesson is
+    never formatted or concatenated.
+    """
+    buf = io.StringIO()
+    written = 0
+    for i, line in enumerate(lines):
+        if i:
+            buf.write("\n")
+            written += 1
+        buf.write(line)
+        written += len(line)
+        if written >= limit:
+            break
+    return buf.getvalue()[:limit]
+
+
+# orjson's decode error subclasses json.JSONDecodeError, so callers can keep
+# catching the stdlib exception
+_json_loads = orjson.loads if orjson is not None else json.loads
+_json_dumps = orjson.dumps if orjson is not None else (lambda obj: json.dumps(obj).encode('utf-8'))
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Decodes the first JSON value at an offset and ignores whatever follows
+_JSON_DECODER = json.JSONDecoder()
+
+
+# Anything that is neither a word character nor whitespace (Unicode-aware,
+# so curly quotes and dashes are stripped too)
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
+# Letter prefix the model puts on options: "A) ", "b) ", ...
+_OPTION_PREFIX_RE = re.compile(r'^[A-Da-d]\)\s*')
+
+# Ollama tags that pull unquantized weights (bare tags default to Q4)
+_FULL_PRECISION_TAG_RE = re.compile(r'[-:](?:fp16|f16|bf16|fp32|f32)\b', re.I)
+
+# String fields every generated question must carry
+_QUESTION_TEXT_FIELDS = ('question', 'correct_answer', 'explanation')
+
+
+def _is_valid_question(data: Any) -> bool:
+    """
+    Shape check for one model question: the text fields are strings (the
+    question non-empty) and options is a list of exactly four non-empty
+    strings, as _QUESTION_FORMAT requires and the A-D letters
+    _shuffle_options assigns expect. Malformed replies (e.g. from a server
+    that ignored the schema) are rejected here instead of being stored as
+    a broken quiz entry.
+    """
+    if not isinstance(data, dict):
+        return False
+    if not all(isinstance(data.get(field), str) for field in _QUESTION_TEXT_FIELDS):
+        return False
+    options = data.get('options')
+    return (
+        bool(data['question'].strip())
+        and isinstance(options, list)
+        and len(options) == 4
+        and all(isinstance(opt, str) and opt for opt in options)
+    )
+
+
+# JSON schemas passed as Ollama's `format` (0.5+): decoding is constrained
+# to exactly this shape, so the model can't spend tokens on anything else
+_QUESTION_FORMAT = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "maxLength": 300},
+        "options": {
+            "type": "array",
+            "items": {"type": "string"},
+            "minItems": 4,
+            "maxItems": 4,
+        },
+        "correct_answer": {"type": "string"},
+        "explanation": {"type": "string", "maxLength": 250},
+    },
+    "required": ["question", "options", "correct_answer", "explanation"],
+}
+
+_QUESTION_BATCH_FORMAT = {
+    "type": "object",
+    "properties": {
+        "questions": {"type": "array", "items": _QUESTION_FORMAT},
+    },
+    "required": ["questions"],
+}
+
+# Uniqueness is checked against at most this many recently registered
+# questions; older ones age out so the similarity scan stays bounded
+_DEDUP_WINDOW = 200
+
+# Generation cap per requested question. A question, four options and
+# an explanation fit in ~250 tokens; the cap only cuts off runaway output
+_TOKENS_PER_QUESTION = 512
+
+# A single-question call still running after this many seconds (about twice
+# the usual reply time) gets a duplicate; whichever finishes first is used
+_HEDGE_AFTER_SECONDS = 20
+
+# A question reply that hasn't opened its JSON object by this many
+# characters is the model rambling; the stream is abandoned
+_MAX_PREAMBLE_CHARS = 2000
+
+# System prompt of every question call. It is the same for all lessons and
+# levels so it is always part of the prompt prefix Ollama can reuse (the
+# lesson title is in each prompt)
+_SYSTEM_PROMPT = (
+    "You write multiple-choice quiz questions classified by the SOLO taxonomy. "
+    "Use only the lesson material you are given and reply in English."
+)
+
+# Bloom's taxonomy level recorded for questions of each SOLO level
+_BLOOM_LEVELS = {
+    'unistructural': 'remember',
+    'multistructural': 'understand',
+    'relational': 'analyze',
+    'extended_abstract': 'create',
+}
+
+
+# SOLO level prompts, filled in by the matching _<level>_prompt method.
+# Built once at import; only the per-call fields are formatted in.
+_UNISTRUCTURAL_PROMPT_TEMPLATE = """Create a UNISTRUCTURAL level question about '{lesson_title}'.
+
+LEARNING OBJECT{plural}:
+{lo_content}
+
+UNISTRUCTURAL LEVEL DEFINITION:
+At this stage, the learner gets to know just a single relevant aspect of a task or subject; the student gets a basic understanding of a concept or task. Therefore, a student is able to make easy and apparent connections, but he or she does not have any idea how significant that information be or not. In addition, the students' response indicates a concrete understanding of the task, but it focuses on only one relevant aspect.
+
+TASK: Create a question that tests knowledge of ONE specific fact/concept. Student should identify or name a single element directly stated in the content.
+
+QUESTION VARIETY - IMPORTANT:
+**DO NOT** start with "Which of the following" - this is overused and boring!
+Use varied question formats such as:
+- "What is the primary purpose of [X]?"
+- "[X] is defined as..."
+- "The term [X] refers to..."
+- "In the context of [topic], what does [X] mean?"
+- "What characterizes [X]?"
+- "How is [X] typically described?"
+- "The main function of [X] is..."
+- Direct definition questions: "[X] can be best described as..."
+
+CRITICAL INSTRUCTIONS FOR DISTRACTORS:
+- **DO NOT** create obviously wrong options that can be eliminated by common sense
+- **DO** create plausible but INCORRECT options that:
+  * Are related to the topic but refer to WRONG specifics
+  * Sound similar to correct answer but are incorrect variants
+  * Common misconceptions that students might hold
+  * Related but different concepts from the content
+- Make students actually think about the specific detail, not guess
+
+Requirements:
+- Focus on ONE isolated aspect only
+- No connections to other concepts required
+- ALL TEXT IN ENGLISH
+- Question < 250 chars
+- 4 MC options (A-D), one correct
+- 3 distractors must be PLAUSIBLE and require reading comprehension to eliminate
+- Explanation < 250 chars
+
+{json_instruction}"""
+
+_MULTISTRUCTURAL_PROMPT_TEMPLATE = """Create a MULTISTRUCTURAL level question about '{lesson_title}'.
+
+SECTION{plural}: {section_title}
+
+CONTENT:
+{content}{ontology_section}
+
+MULTISTRUCTURAL LEVEL DEFINITION:
+At this stage, students gain an understanding of numerous relevant independent aspects. Despite understanding the relationship between different aspects, its relationship to the whole remains unclear. Suppose the teacher is teaching about several topics and ideas, the students can make varied connections, but they fail to understand the significance of the whole. The students' responses are based on relevant aspects, but their responses are handled independently.
+
+TASK: Create a question that tests knowledge of MULTIPLE separate facts/features. Student should list or identify several independent elements WITHOUT explaining how they connect.
+
+QUESTION VARIETY - IMPORTANT:
+**DO NOT** start with "Which of the following" - this is overused and boring!
+Use varied question formats such as:
+- "What are the key components of [X]?"
+- "Name the main elements involved in [X]."
+- "[Topic] consists of several parts. These include..."
+- "The main aspects of [X] are..."
+- "Identify the core features of [X]."
+- "What elements make up [X]?"
+- "List the primary characteristics of [X]."
+- "The building blocks of [X] include..."
+
+CRITICAL INSTRUCTIONS FOR DISTRACTORS:
+- **DO NOT** create obviously wrong options that can be eliminated by common sense
+- **DO** create plausible but INCORRECT combinations that:
+  * Mix some correct items with 1-2 WRONG items
+  * Include correct items in wrong contexts
+  * Reorder/rearrange items incorrectly
+  * Include related but not-mentioned aspects from content
+  * Common student misconceptions about the topic
+- Make students verify EACH item, not just recognize keywords
+
+Requirements:
+- Multiple items or aspects, but handled independently
+- Don't require showing relationships between items
+- ALL TEXT IN ENGLISH
+- Question < 250 chars
+- 4 MC options (A-D), one correct
+- 3 distractors must combine PLAUSIBLE elements that seem correct at first glance
+- Explanation < 250 chars
+
+{json_instruction}"""
+
+_RELATIONAL_PROMPT_TEMPLATE = """Create a RELATIONAL level question about '{lesson_title}'.
+
+CONTENT:
+{combined_content}{ontology_section}{summary_section}
+
+RELATIONAL LEVEL DEFINITION:
+This stage relates to aspects of knowledge combining to form a structure. By this stage, the student is able to understand the importance of different parts in relation to the whole. They are able to connect concepts and ideas, so it provides a coherent knowledge of the whole thing. Moreover, the students' response indicates an understanding of the task by combining all the parts, and they can demonstrate how each part contributes to the whole.
+
+TASK: Create a question that tests understanding of HOW parts CONNECT and work TOGETHER. Use both the detailed content, domain ontology AND the summary to identify key relationships. Student should explain relationships, patterns, or cause-effect between elements. Shows deep integrated understanding.
+
+QUESTION VARIETY - IMPORTANT:
+**DO NOT** start with "Which of the following" - this is overused and boring!
+Use varied question formats such as:
+- "How does [X] relate to [Y]?"
+- "What is the relationship between [X] and [Y]?"
+- "Why does [X] affect [Y] in this way?"
+- "Explain how [X] contributes to [Y]."
+- "The connection between [X] and [Y] can be described as..."
+- "How do [X] and [Y] work together to achieve [Z]?"
+- "What role does [X] play in the context of [Y]?"
+- "In what way does [X] influence [Y]?"
+- "The interaction between [X] and [Y] results in..."
+
+CRITICAL INSTRUCTIONS FOR DISTRACTORS:
+- **DO NOT** create obviously wrong options that can be eliminated without thinking
+- **DO** create CHALLENGING distractors that:
+  * Seem logical if you only understand PART of the relationship
+  * Require understanding the FULL integrated picture to reject
+  * Include partially correct connections (correct concepts, wrong relationship)
+  * Reverse causes and effects (plausible but backwards)
+  * Connect concepts that ARE related but in wrong ways
+  * Address a DIFFERENT relationship that also exists in the content
+- Distractors should reflect REAL misconceptions about how things relate
+
+Requirements:
+- Ask about relationships, connections, or cause-effect WITHIN the content
+- Use the summary to understand the broader context and key themes
+- Require understanding of how parts fit together into a coherent whole
+- Student must show how different elements relate to each other
+- ALL TEXT IN ENGLISH
+- Question < 250 chars
+- 4 MC options (A-D), one correct
+- 3 distractors must be CHALLENGING and reflect real misconceptions
+- Explanation < 250 chars
+
+{json_instruction}"""
+
+# The extended-abstract instructions don't depend on the lesson, so they
+# come first: Ollama reuses the KV cache for a prompt prefix it has already
+# evaluated, and every extended-abstract call (for any lesson) starts with
+# the same text. Lesson material and the output format follow.
+_EXTENDED_ABSTRACT_STATIC_TEMPLATE = """Create an EXTENDED ABSTRACT level question{combining}.
+
+EXTENDED ABSTRACT LEVEL:
+- Student transfers and generalises principles beyond what was taught
+- Applies them to a new scenario or proposes new ideas from them
+
+TASK: Create a question that requires:
+- Understanding core principles from {scope}
+- {approach}
+
+STAY GROUNDED IN THE MATERIALS:
+- Every concept in the question and options MUST come from the provided lesson content; no outside theories or frameworks
+- A "new context" means a NEW APPLICATION of the SAME concepts
+
+QUESTION VARIETY: **DO NOT** start with "Which of the following". Vary the format, e.g.:
+- "How can the principles of [X from lesson 1] be applied to improve [Y from lesson 2]?"
+- "A developer needs to [scenario]. Using concepts from [both topics], the best approach would be..."
+- "When combining [concept A] with [concept B], what outcome should be expected?"
+- "To achieve [goal], how would [concept from lesson 1] work together with [concept from lesson 2]?"
+
+Requirements:
+- {requirement}
+- 3 TRICKY distractors from the materials, never obviously wrong: misapplying a principle, {partial_application}, a plausible chain to a wrong conclusion, or a misconception about how the concepts interact
+- ALL TEXT IN ENGLISH
+- Question < 300 chars
+- 4 MC options (A-D), one correct
+- Explanation < 250 chars, {explanation_focus}"""
+
+# Lesson-specific tail that follows the static prefix
+_EXTENDED_ABSTRACT_TAIL_TEMPLATE = """
+
+PRIMARY TOPIC ({lesson_title}) CONCEPTS:
+{concepts_text}{concepts_secondary_text}{summary_section}
+
+{combine_instruction}
+
+{json_instruction}"""
+
+# Wording of the extended-abstract prompt with and without a second lesson
+_EXTENDED_ABSTRACT_VARIANTS = {
+    # Combining two lessons
+    True: {
+        'combining': ' combining 2 lessons',
+        'scope': 'both topics',
+        'approach': 'Synthesizing concepts from BOTH lessons to solve a problem or explain a scenario',
+        'partial_application': 'using concepts from only one of the two lessons',
+        'requirement': 'Question MUST require knowledge of BOTH lessons to answer correctly',
+        'explanation_focus': 'showing how concepts from both lessons combine',
+    },
+    # Applying a single lesson
+    False: {
+        'combining': '',
+        'scope': 'the lesson',
+        'approach': 'Applying lesson principles to a new but related scenario',
+        'partial_application': 'applying the principle only partially',
+        'requirement': 'Question must apply lesson concepts to a practical scenario',
+        'explanation_focus': 'explaining the application',
+    },
+}
+
+# Rendered once per variant at import
+_EXTENDED_ABSTRACT_STATIC_PREFIX = {
+    combined: _EXTENDED_ABSTRACT_STATIC_TEMPLATE.format(**wording)
+    for combined, wording in _EXTENDED_ABSTRACT_VARIANTS.items()
+}
+
+# Closing instruction with and without a second lesson
+_EXTENDED_ABSTRACT_COMBINE_INSTRUCTIONS = {
+    True: """CRITICAL - COMBINE CONCEPTS FROM EXACTLY THESE 2 TOPICS:
+You MUST create a question that connects and synthesizes concepts from BOTH '{lesson_title}' AND '{secondary_title}'.
+The question should show how these two topics relate to each other, influence each other, or can be applied together.
+
+**STRICT GROUNDING RULE**: Use ONLY concepts, terms, and ideas that appear in the provided materials above.
+DO NOT introduce external concepts, theories, or examples that are not mentioned in the lesson content.
+The synthesis must be between concepts FROM THESE TWO LESSONS ONLY.
+
+Example: If lesson 1 covers "Unit Testing" and lesson 2 covers "Angular Components", ask how unit testing principles apply to Angular component testing - combining BOTH topics using concepts FROM the materials.""",
+    False: """Create a question that applies the principles from this lesson to a practical scenario.
+**STRICT GROUNDING RULE**: Use ONLY concepts and terms that appear in the provided content.
+DO NOT introduce external concepts not mentioned in the lesson.""",
+}
+
+# Full extended-abstract prompt per variant, built once: the static prefix
+# and combine instruction are joined in so a call only formats lesson fields
+_EXTENDED_ABSTRACT_PROMPT_TEMPLATES = {
+    combined: (
+        _EXTENDED_ABSTRACT_STATIC_PREFIX[combined]
+        + _EXTENDED_ABSTRACT_TAIL_TEMPLATE.replace(
+            '{combine_instruction}', _EXTENDED_ABSTRACT_COMBINE_INSTRUCTIONS[combined]
+        )
+    )
+    for combined in _EXTENDED_ABSTRACT_VARIANTS
+}
+
+
+def _release_once(semaphore: threading.BoundedSemaphore) -> Callable[[], None]:
+    """A release() for one acquired slot of `semaphore` that is safe to call twice"""
+    lock = threading.Lock()
+    released = []
+    
+    def release():
+        with lock:
+            if released:
+                return
+            released.append(True)
+        semaphore.release()
+    return release
+
+
+def _abort_responses(responses: List[requests.Response]) -> None:
+    """
+    Close streaming responses that another thread may be reading.
+    HTTPResponse.shutdown() (urllib3 2.3+) wakes a reader blocked on the
+    socket first; without it close() waits for that read to return.
+    """
+    for response in responses:
+        shutdown = getattr(response.raw, 'shutdown', None)
+        if shutdown is not None:
+            try:
+                shutdown()
+            except (RuntimeError, ValueError, OSError):
+                pass  # already released to the pool or closed
+        response.close()
+
+
+class _HedgeStreams:
+    """
+    The open Ollama responses of one hedged request, each with the release
+    of the parallel slot its call holds. close() frees every slot at once
+    and aborts the responses in the background, so neither the winner nor
+    the next request waits for a losing call to notice; a call that only
+    gets its response after close() must drop it (attach returns False).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self.closed = False
+
+    def attach(self, response: requests.Response, release: Callable[[], None]) -> bool:
+        """Track `response` and its slot; False if the hedge is already decided"""
+        with self._lock:
+            if self.closed:
+                return False
+            self._entries.append((response, release))
+            return True
+
+    def close(self) -> None:
+        """Release every attached call's slot and abort its response"""
+        with self._lock:
+            self.closed = True
+            entries, self._entries = self._entries, []
+        for _, release in entries:
+            release()
+        if entries:
+            threading.Thread(
+                target=_abort_responses, args=([response for response, _ in entries],),
+                daemon=True
+            ).start()
 
 
 class SoloQuizGeneratorLocal:
@@ -32,43 +493,133 @@ class SoloQuizGeneratorLocal:
     - Does multiple passes to ensure question diversity
     """
     
+    # Shared by every instance (QuestionService builds one per request), so
+    # connections to Ollama are reused across quiz generations
+    _http = _build_ollama_session()
+    # Requests in flight to Ollama from every instance, capped at the
+    # server's parallel slots; a hedge duplicate only runs in a free slot
+    _slots = threading.BoundedSemaphore(OLLAMA_NUM_PARALLEL)
+    # The model is preloaded once per process, not per generator instance
+    _warmup_started = False
+    
     def __init__(self):
-        """Initialize the quiz generator with Ollama configuration"""
+        """
+        Initialize the quiz generator with Ollama configuration.
+
+        Expects a quantized model tag (OLLAMA_QUIZ_MODEL, e.g.
+        qwen2.5:14b-instruct-q4_K_M or a q5_K_M variant). Prefill is memory
+        bound, so an FP16 model runs every call here 2-3x slower.
+        """
         self.ollama_base_url = OLLAMA_BASE_URL
-        self.ollama_model = OLLAMA_MODEL
+        self.ollama_model = OLLAMA_QUIZ_MODEL
         self.provider = "ollama_local"
         
-        print(f"[QuizGenerator-Local] Initialized with Ollama (14B model)")
+        print(f"[QuizGenerator-Local] Initialized with Ollama ({self.ollama_model})")
+        if _FULL_PRECISION_TAG_RE.search(self.ollama_model):
+            print("[QuizGenerator-Local] NOTE: full-precision model tag; a "
+                  "q4_K_M/q5_K_M tag generates much faster")
         print(f"[QuizGenerator-Local] Mode: MAXIMUM QUALITY (no API cost concerns)")
         
         # Test connection
         if not self._test_ollama_connection():
             print("[QuizGenerator-Local] WARNING: Could not connect to Ollama server!")
             print(f"[QuizGenerator-Local] Make sure Ollama is running on {self.ollama_base_url}")
+        elif not SoloQuizGeneratorLocal._warmup_started:
+            SoloQuizGeneratorLocal._warmup_started = True
+            threading.Thread(target=self._warm_up, daemon=True).start()
+            if _keep_alive_pinned(OLLAMA_QUIZ_KEEP_ALIVE) and not OLLAMA_QUIZ_MODEL_SHARED:
+                # Runs before the session's own atexit close (LIFO); a model
+                # shared with ContentParser is left to OLLAMA_KEEP_ALIVE
+                atexit.register(self._unload_model)
         
         self.api_exhausted = False
         self._content_summary_cache = {}
         
         # Track generated questions to avoid duplicates
+        # (bounded to the last _DEDUP_WINDOW; the set mirrors the hash deque)
         self._generated_question_hashes: Set[str] = set()
-        self._generated_question_texts: List[str] = []
+        self._generated_hash_window: deque = deque(maxlen=_DEDUP_WINDOW)
+        self._generated_question_texts: deque = deque(maxlen=_DEDUP_WINDOW)
+        # Word sets of the registered questions, built once at registration
+        self._generated_token_sets: deque = deque(maxlen=_DEDUP_WINDOW)
+        
+        # Ontology relationships for the current generation session, indexed
+        # by source/target title, and formatted contexts per title set
+        self.ontology_relationships: List[Dict[str, Any]] = []
+        self._rel_indices_by_title: Dict[str, List[int]] = {}
+        self._ontology_ctx_cache: Dict[frozenset, str] = {}
+        
+        # Selected sections and flattened learning objects per (lesson,
+        # section filter); every attempt at every level reuses the same lists
+        self._section_view_cache: Dict[Tuple[int, Optional[Tuple[int, ...]]], Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+        self._flat_lo_cache: Dict[Tuple[int, Optional[Tuple[int, ...]]], Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+        # Extended-abstract concept lines per lesson
+        self._lesson_concepts_cache: Dict[int, Tuple[Dict[str, Any], str]] = {}
+        
+        # Sampled replies are only reused within one generation run: the
+        # nonce goes into every seed, so the next run samples fresh questions
+        # instead of replaying (and re-saving) the previous run's
+        self._run_nonce = secrets.token_hex(8)
+        self._run_responses: Dict[str, str] = {}
+        self._run_responses_lock = threading.Lock()
     
     def _test_ollama_connection(self) -> bool:
         """Test if Ollama server is responding"""
         try:
-            response = requests.get(f"{self.ollama_base_url}/api/tags", timeout=5)
+            response = self._http.get(f"{self.ollama_base_url}/api/tags", timeout=5)
             return response.status_code == 200
         except Exception as e:
             print(f"[QuizGenerator-Local] Connection test failed: {e}")
             return False
     
+    def _warm_up(self) -> None:
+        """
+        Load the model in the background so the first question doesn't pay
+        the cold start. An empty prompt only loads the model; num_ctx matches
+        _call_ollama so the loaded runner is reused as-is.
+        """
+        try:
+            response = self._http.post(
+                f"{self.ollama_base_url}/api/generate",
+                data=_json_dumps({
+                    "model": self.ollama_model,
+                    "prompt": "",
+                    "stream": False,
+                    "keep_alive": OLLAMA_QUIZ_KEEP_ALIVE,
+                    "options": {"num_ctx": OLLAMA_NUM_CTX},
+                }),
+                headers=_JSON_HEADERS,
+                timeout=300
+            )
+            if response.status_code == 200:
+                print(f"[QuizGenerator-Local] Model {self.ollama_model} loaded")
+            else:
+                print(f"[QuizGenerator-Local] Warm-up failed: {response.status_code}")
+        except Exception as e:
+            print(f"[QuizGenerator-Local] Warm-up failed: {e}")
+    
+    def _unload_model(self) -> None:
+        """
+        Release a pinned model (OLLAMA_QUIZ_KEEP_ALIVE=-1) when the process
+        exits; registered with atexit alongside the warm-up, only for a quiz
+        model ContentParser doesn't share.
+        """
+        try:
+            self._http.post(
+                f"{self.ollama_base_url}/api/generate",
+                data=_json_dumps({"model": self.ollama_model, "keep_alive": 0}),
+                headers=_JSON_HEADERS,
+                timeout=5
+            )
+        except Exception:
+            pass
+    
     def _get_question_hash(self, question_text: str) -> str:
         """Generate a hash for question deduplication"""
-        # Normalize the question text
-        normalized = question_text.lower().strip()
-        # Remove punctuation for better matching
-        normalized = re.sub(r'[^\w\s]', '', normalized)
-        return hashlib.md5(normalized.encode()).hexdigest()
+        # Normalize the question text; remove punctuation for better matching
+        normalized = _PUNCTUATION_RE.sub('', question_text.lower().strip())
+        # Only compared within one session - no need for a cryptographic digest
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
     
     def _is_question_unique(self, question_text: str, similarity_threshold: float = 0.7) -> bool:
         """
@@ -85,14 +636,24 @@ class SoloQuizGeneratorLocal:
             return False
         
         # Check word overlap with existing questions
-        new_words = set(question_text.lower().split())
-        for existing in self._generated_question_texts:
-            existing_words = set(existing.lower().split())
-            if len(new_words) == 0 or len(existing_words) == 0:
+        new_words = frozenset(question_text.lower().split())
+        if not new_words:
+            return True
+        
+        new_len = len(new_words)
+        for existing_words in self._generated_token_sets:
+            if not existing_words:
+                continue
+            
+            # overlap <= min(len) bounds the similarity by min/max, so a
+            # question of very different length can't match - skip the
+            # set intersection for it
+            existing_len = len(existing_words)
+            max_len = max(new_len, existing_len)
+            if min(new_len, existing_len) <= similarity_threshold * max_len:
                 continue
             
-            overlap = len(new_words.intersection(existing_words))
-            max_len = max(len(new_words), len(existing_words))
+            overlap = len(new_words & existing_words)
             similarity = overlap / max_len
             
             if similarity > similarity_threshold:
@@ -103,47 +664,201 @@ class SoloQuizGeneratorLocal:
     
     def _register_question(self, question_text: str):
         """Register a question as generated to avoid future duplicates"""
-        self._generated_question_hashes.add(self._get_question_hash(question_text))
+        q_hash = self._get_question_hash(question_text)
+        if len(self._generated_hash_window) == self._generated_hash_window.maxlen:
+            self._generated_question_hashes.discard(self._generated_hash_window[0])
+        self._generated_hash_window.append(q_hash)
+        self._generated_question_hashes.add(q_hash)
         self._generated_question_texts.append(question_text)
+        self._generated_token_sets.append(frozenset(question_text.lower().split()))
+    
+    @staticmethod
+    def _sampling_seed(prompt: str, variant: int, nonce: str = '') -> int:
+        """Ollama seed for a (prompt, variant) pair within the run `nonce`"""
+        digest = hashlib.blake2b(f"{nonce}\x00{variant}\x00{prompt}".encode('utf-8'), digest_size=4).digest()
+        return int.from_bytes(digest, 'big') & 0x7FFFFFFF
     
-    def _call_ollama(self, prompt: str, timeout: int = 300) -> Optional[str]:
+    def _call_ollama(self, prompt: str, timeout: int = 300, variant: int = 0,
+                     expect_json: bool = True, system: str = None,
+                     num_predict: int = None,
+                     schema: Dict[str, Any] = None,
+                     streams: _HedgeStreams = None,
+                     slot_release: Callable[[], None] = None) -> Optional[str]:
         """
-        Call Ollama API with the 14B model
+        Call Ollama API with the quiz model
         
         Args:
             prompt: The prompt to send to the model
             timeout: Timeout in seconds
+            variant: Attempt number; retries of the same prompt use a
+                different sampling seed so they can produce a new question
+            expect_json: The reply is a JSON value; stop reading once it closes
+            system: Optional system prompt placed before `prompt`
+            num_predict: Optional cap on generated tokens
+            schema: Optional JSON schema the reply must match (JSON
+                replies only); without one any JSON object is accepted
+            streams: Hedge group the response is attached to, so the
+                winning call can close it (see _call_ollama_hedged)
+            slot_release: Release of a _slots slot the caller already
+                holds for this call (see _release_once); by default the
+                call takes one itself
             
         Returns:
             Generated text or None on error
+        
+        Sampling stays at temperature 0.7 with a seed derived from
+        (prompt, variant) and the current run's nonce: a repeated request
+        within one generate_solo_questions run is answered from the run's
+        own cache, while the next run samples new questions. Sampled
+        replies are never written to the persistent response cache.
+        
+        The response is streamed. JSON replies are cut off as soon as the
+        top-level value is complete (Ollama stops generating when the client
+        disconnects), and abandoned if no JSON has started after
+        _MAX_PREAMBLE_CHARS.
+        
+        Ollama reuses the KV cache for the longest prompt prefix it has
+        already evaluated, as long as the model isn't reloaded. Question
+        calls therefore start with the same system prompt, and
+        num_ctx matches ContentParser's so switching between parsing and
+        quiz generation doesn't reload the model with a new context size.
         """
+        options = {
+            "temperature": 0.7,
+            "seed": self._sampling_seed(prompt, variant, self._run_nonce),
+            "num_ctx": OLLAMA_NUM_CTX,
+        }
+        if num_predict:
+            options["num_predict"] = num_predict
+        json_format = (schema or "json") if expect_json else None
+        if expect_json:
+            # Nothing useful follows the JSON object
+            options["stop"] = ["\n\n\n"]
+        cache_key = ResponseCache.make_key(
+            self.ollama_model,
+            f"{system}\x00{prompt}" if system else prompt,
+            {**options, "format": json_format} if expect_json else options
+        )
+        with self._run_responses_lock:
+            cached = self._run_responses.get(cache_key)
+        if cached is not None:
+            print(f"[QuizGenerator-Local] Cache hit ({len(cached)} chars)")
+            return cached
+        
+        if slot_release is None:
+            self._slots.acquire()
+            slot_release = _release_once(self._slots)
         try:
             url = f"{self.ollama_base_url}/api/generate"
             payload = {
                 "model": self.ollama_model,
                 "prompt": prompt,
-                "stream": False,
-                "temperature": 0.7,
+                "stream": True,
+                # Keep the model loaded between questions and generations
+                "keep_alive": OLLAMA_QUIZ_KEEP_ALIVE,
+                # Sampling keys are only honoured inside "options"
+                "options": options,
             }
+            if system:
+                payload["system"] = system
+            if expect_json:
+                # Grammar-constrained decoding: the reply is always a bare
+                # JSON object (of `schema`'s shape when given), with no
+                # prose or code fences around it
+                payload["format"] = json_format
             
             print(f"[QuizGenerator-Local] Calling Ollama ({len(prompt)} chars prompt)...")
-            response = requests.post(url, json=payload, timeout=timeout)
-            
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get("response", "")
-                print(f"[QuizGenerator-Local] Ollama returned {len(result)} chars")
-                return result
-            else:
-                print(f"[QuizGenerator-Local] Ollama error: {response.status_code}")
-                return None
+            with self._http.post(
+                url, data=_json_dumps(payload), headers=_JSON_HEADERS, timeout=timeout, stream=True
+            ) as response:
+                if response.status_code != 200:
+                    print(f"[QuizGenerator-Local] Ollama error: {response.status_code}")
+                    return None
+                if streams is not None and not streams.attach(response, slot_release):
+                    return None  # the other hedged call already answered
                 
+                tracker = JsonCompletionTracker() if expect_json else None
+                parts = []
+                length = 0
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = _json_loads(line)
+                    if chunk.get("error"):
+                        print(f"[QuizGenerator-Local] Ollama error: {chunk['error']}")
+                        return None
+                    token = chunk.get("response", "")
+                    parts.append(token)
+                    length += len(token)
+                    if tracker is not None:
+                        if tracker.feed(token):
+                            # Drop whatever shared the closing token
+                            parts[-1] = token[:tracker.end]
+                            break
+                        if not tracker.started and length > _MAX_PREAMBLE_CHARS:
+                            print(f"[QuizGenerator-Local] No JSON after {length} chars, abandoning response")
+                            return None
+                    if chunk.get("done"):
+                        break
+            
+            if streams is not None and streams.closed:
+                return None  # aborted by the hedge; `parts` may be cut short
+            result = "".join(parts)
+            print(f"[QuizGenerator-Local] Ollama returned {len(result)} chars")
+            if result:
+                with self._run_responses_lock:
+                    self._run_responses[cache_key] = result
+            return result
+            
         except requests.Timeout:
             print(f"[QuizGenerator-Local] Ollama request timed out after {timeout}s")
             return None
         except Exception as e:
-            print(f"[QuizGenerator-Local] Ollama error: {e}")
+            if streams is None or not streams.closed:
+                print(f"[QuizGenerator-Local] Ollama error: {e}")
             return None
+        finally:
+            slot_release()
+    
+    def _call_ollama_hedged(self, prompt: str, hedge_after: float = _HEDGE_AFTER_SECONDS,
+                            **kwargs) -> Optional[str]:
+        """
+        _call_ollama with a speculative duplicate for stalled requests.
+        
+        If the first call hasn't returned after `hedge_after` seconds and
+        one of Ollama's parallel slots is free, the same request is issued
+        again and the first non-empty reply wins; the other call's slot is
+        freed and its response closed, which stops its generation in Ollama. The prompt prefix is
+        already in the KV cache, so the duplicate costs little more than its
+        decode. With every slot busy there is no duplicate: it would only
+        queue behind the requests it competes with.
+        """
+        streams = _HedgeStreams()
+        
+        def duplicate(release):
+            try:
+                return self._call_ollama(prompt, streams=streams, slot_release=release, **kwargs)
+            finally:
+                release()
+        
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            futures = [pool.submit(self._call_ollama, prompt, streams=streams, **kwargs)]
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                if self._slots.acquire(blocking=False):
+                    print(f"[QuizGenerator-Local] No reply after {hedge_after}s, re-issuing request")
+                    futures.append(pool.submit(duplicate, _release_once(self._slots)))
+                else:
+                    print(f"[QuizGenerator-Local] No reply after {hedge_after}s, no free slot to re-issue it")
+            for future in as_completed(futures):
+                result = future.result()
+                if result:
+                    return result
+            return None
+        finally:
+            streams.close()
+            pool.shutdown(wait=False)
     
     def generate_solo_questions(
         self,
@@ -172,6 +887,16 @@ class SoloQuizGeneratorLocal:
         
         # Store ontology relationships for use in all question generators
         self.ontology_relationships = ontology_relationships or []
+        self._rel_indices_by_title = {}
+        for index, rel in enumerate(self.ontology_relationships):
+            for title in {rel.get('source_title', ''), rel.get('target_title', '')}:
+                self._rel_indices_by_title.setdefault(title, []).append(index)
+        self._ontology_ctx_cache = {}
+        self._section_view_cache = {}
+        self._flat_lo_cache = {}
+        self._lesson_concepts_cache = {}
+        self._run_nonce = secrets.token_hex(8)
+        self._run_responses.clear()
         if self.ontology_relationships:
             print(f"[SOLO-Local] ✓ Using {len(self.ontology_relationships)} ontology relationships to enhance questions")
         
@@ -181,7 +906,9 @@ class SoloQuizGeneratorLocal:
         
         # Reset question tracking for this generation session
         self._generated_question_hashes.clear()
+        self._generated_hash_window.clear()
         self._generated_question_texts.clear()
+        self._generated_token_sets.clear()
         
         generated_questions = []
         primary_lesson = lessons_data[0] if lessons_data else None
@@ -192,59 +919,150 @@ class SoloQuizGeneratorLocal:
         # Skip content summary generation to save memory
         content_summary = ""
         
+        # Attempts are sent to Ollama in waves, all of a wave's calls
+        # concurrently. Uniqueness is then checked serially in (level, attempt)
+        # order and a level stops accepting once it is full.
+        # The first wave asks for all of a level's questions in one call
+        # (every level concurrently); later waves generate one question per
+        # call. A wave asks every level for what it still needs, then fills
+        # any idle parallel slots with extra attempts for the levels that are
+        # short; surplus unique questions are discarded. The extras cost no
+        # wall-clock time and often save a whole retry round trip.
+        max_attempts = questions_per_level * 2  # Allow up to 2x attempts for uniqueness
+        level_questions = {level: 0 for level in solo_levels}
+        attempts = {level: 0 for level in solo_levels}
+        level_order = {level: index for index, level in enumerate(level_questions)}
+        
         for level in solo_levels:
             print(f"\n[SOLO-Local] Generating {questions_per_level} {level} questions...")
-            
-            level_questions = 0
-            max_attempts = questions_per_level * 2  # Allow up to 2x attempts for uniqueness
-            attempts = 0
-            
-            while level_questions < questions_per_level and attempts < max_attempts:
-                attempts += 1
+        
+        def accept(level, question):
+            if level_questions[level] >= questions_per_level:
+                return  # over-provisioned surplus
+            if question and self._is_question_unique(question.get('question_text', '')):
+                question['solo_level'] = level
+                generated_questions.append(question)
+                self._register_question(question.get('question_text', ''))
+                level_questions[level] += 1
+                print(f"[SOLO-Local] ✓ Generated {level} question {level_questions[level]}/{questions_per_level}")
+            elif question:
+                print(f"[SOLO-Local] ✗ Question rejected (not unique), retrying...")
+        
+        with ThreadPoolExecutor(max_workers=OLLAMA_NUM_PARALLEL) as executor:
+            if questions_per_level > 1:
+                batches = {
+                    executor.submit(
+                        self._generate_level_batch, level, lessons_data, section_ids,
+                        content_summary, 0, questions_per_level
+                    ): level
+                    for level in level_questions
+                }
+                # A level whose batch is unusable falls back to one call per
+                # question straight away, while other levels' batches are
+                # still generating
+                fallbacks = {}
+                for future in as_completed(batches):
+                    level = batches[future]
+                    if not future.result():
+                        print(f"[SOLO-Local] {level} batch unusable, falling back to one question per call")
+                        fallbacks[level] = [
+                            executor.submit(
+                                self._generate_level_question, level, lessons_data, section_ids,
+                                content_summary, lo_offset
+                            )
+                            for lo_offset in range(questions_per_level)
+                        ]
                 
-                try:
-                    # Use different learning object for each attempt to encourage diversity
-                    lo_offset = attempts - 1
-                    
-                    if level == 'unistructural':
-                        question = self._generate_unistructural_question(
-                            primary_lesson, section_ids, content_summary, lo_offset
-                        )
-                    elif level == 'multistructural':
-                        question = self._generate_multistructural_question(
-                            primary_lesson, section_ids, content_summary, lo_offset
-                        )
-                    elif level == 'relational':
-                        question = self._generate_relational_question(
-                            primary_lesson, section_ids, content_summary
-                        )
-                    elif level == 'extended_abstract':
-                        # For extended abstract, use both lessons if available
-                        secondary_lesson = lessons_data[1] if len(lessons_data) > 1 else None
-                        question = self._generate_extended_abstract_question(
-                            primary_lesson, content_summary, secondary_lesson
-                        )
+                # Accept in level order so results don't depend on timing
+                for future, level in batches.items():
+                    # The batch (or its fallback) used up this many learning-object offsets
+                    attempts[level] = questions_per_level
+                    if level in fallbacks:
+                        for fallback in fallbacks[level]:
+                            accept(level, fallback.result())
                     else:
-                        question = None
-                    
-                    if question and self._is_question_unique(question.get('question_text', '')):
-                        question['solo_level'] = level
-                        generated_questions.append(question)
-                        self._register_question(question.get('question_text', ''))
-                        level_questions += 1
-                        print(f"[SOLO-Local] ✓ Generated {level} question {level_questions}/{questions_per_level}")
-                    elif question:
-                        print(f"[SOLO-Local] ✗ Question rejected (not unique), retrying...")
-                    
-                except Exception as e:
-                    print(f"[SOLO-Local] Error generating {level} question: {e}")
+                        for question in future.result():
+                            accept(level, question)
             
-            if level_questions < questions_per_level:
-                print(f"[SOLO-Local] Generated {level_questions}/{questions_per_level} {level} questions")
+            while True:
+                wave = []
+                for level in level_questions:
+                    needed = min(questions_per_level - level_questions[level], max_attempts - attempts[level])
+                    for _ in range(max(0, needed)):
+                        # Use different learning object for each attempt to encourage diversity
+                        wave.append((level, attempts[level]))
+                        attempts[level] += 1
+                if not wave:
+                    break
+                
+                # Over-provision into idle slots, round-robin over short levels
+                short_levels = [
+                    level for level in level_questions
+                    if level_questions[level] < questions_per_level
+                ]
+                while len(wave) < OLLAMA_NUM_PARALLEL:
+                    extra = [level for level in short_levels if attempts[level] < max_attempts]
+                    if not extra:
+                        break
+                    for level in extra[:OLLAMA_NUM_PARALLEL - len(wave)]:
+                        wave.append((level, attempts[level]))
+                        attempts[level] += 1
+                wave.sort(key=lambda item: (level_order[item[0]], item[1]))
+                
+                futures = [
+                    executor.submit(
+                        self._generate_level_question, level, lessons_data, section_ids, content_summary, lo_offset
+                    )
+                    for level, lo_offset in wave
+                ]
+                
+                for (level, _), future in zip(wave, futures):
+                    accept(level, future.result())
+        
+        for level, count in level_questions.items():
+            if count < questions_per_level:
+                print(f"[SOLO-Local] Generated {count}/{questions_per_level} {level} questions")
+        
+        # Waves interleave levels; keep the output grouped by requested level
+        generated_questions.sort(key=lambda q: level_order[q['solo_level']])
         
         print(f"\n[SOLO-Local] Total questions generated: {len(generated_questions)}")
         return generated_questions
     
+    def _generate_level_question(
+        self,
+        level: str,
+        lessons_data: List[Dict[str, Any]],
+        section_ids: List[int],
+        content_summary: str,
+        lo_offset: int
+    ) -> Optional[Dict[str, Any]]:
+        """Generate one candidate question for a SOLO level (None on failure)"""
+        primary_lesson = lessons_data[0]
+        try:
+            if level == 'unistructural':
+                return self._generate_unistructural_question(
+                    primary_lesson, section_ids, content_summary, lo_offset
+                )
+            elif level == 'multistructural':
+                return self._generate_multistructural_question(
+                    primary_lesson, section_ids, content_summary, lo_offset
+                )
+            elif level == 'relational':
+                return self._generate_relational_question(
+                    primary_lesson, section_ids, content_summary, variant=lo_offset
+                )
+            elif level == 'extended_abstract':
+                # For extended abstract, use both lessons if available
+                secondary_lesson = lessons_data[1] if len(lessons_data) > 1 else None
+                return self._generate_extended_abstract_question(
+                    primary_lesson, content_summary, secondary_lesson, variant=lo_offset
+                )
+            return None
+        except Exception as e:
+            print(f"[SOLO-Local] Error generating {level} question: {e}")
+            return None
+    
     def _build_ontology_context(self, learning_objects: List[Dict] = None) -> str:
         """
         Build ontology context from domain relationships.
@@ -253,54 +1071,114 @@ class SoloQuizGeneratorLocal:
         if not self.ontology_relationships:
             return ""
         
+        # Every attempt for the same section asks for the same context
+        lo_titles = frozenset(lo.get('title', '') for lo in learning_objects or ())
+        cached = self._ontology_ctx_cache.get(lo_titles)
+        if cached is not None:
+            return cached
+        
         # Filter relationships relevant to the learning objects if provided
+        # (original order preserved, via the per-title index)
         relevant_rels = self.ontology_relationships
-        if learning_objects:
-            lo_titles = {lo.get('title', '') for lo in learning_objects}
-            relevant_rels = [
-                r for r in self.ontology_relationships
-                if r.get('source_title', '') in lo_titles or r.get('target_title', '') in lo_titles
-            ]
+        if lo_titles:
+            indices = set()
+            for title in lo_titles:
+                indices.update(self._rel_indices_by_title.get(title, ()))
+            relevant_rels = [self.ontology_relationships[index] for index in sorted(indices)]
         
         if not relevant_rels:
+            self._ontology_ctx_cache[lo_titles] = ""
             return ""
         
-        # Build a formatted ontology context
-        ontology_lines = ["DOMAIN ONTOLOGY (concept relationships):"]
+        context = "\n".join(self._iter_ontology_lines(relevant_rels))
+        self._ontology_ctx_cache[lo_titles] = context
+        return context
+    
+    @staticmethod
+    def _iter_ontology_lines(relevant_rels: List[Dict[str, Any]]) -> Iterable[str]:
+        """Yield the lines of the formatted ontology context for `relevant_rels`"""
+        yield "DOMAIN ONTOLOGY (concept relationships):"
         
         # Group by relationship type
         rels_by_type = {}
         for rel in relevant_rels[:20]:  # Limit to top 20 to keep it concise
-            rel_type = rel.get('relationship_type', 'related_to')
-            if rel_type not in rels_by_type:
-                rels_by_type[rel_type] = []
-            rels_by_type[rel_type].append(rel)
+            rels_by_type.setdefault(rel.get('relationship_type', 'related_to'), []).append(rel)
         
         # Format relationships
-        for rel_type, rels in sorted(rels_by_type.items()):
-            ontology_lines.append(f"\n{rel_type.upper().replace('_', ' ')}:")
-            for rel in rels[:5]:  # Max 5 per type
-                source = rel.get('source_title', '')
-                target = rel.get('target_title', '')
+        for rel_type in sorted(rels_by_type):
+            yield f"\n{rel_type.upper().replace('_', ' ')}:"
+            for rel in rels_by_type[rel_type][:5]:  # Max 5 per type
+                yield f"  • {rel.get('source_title', '')} → {rel.get('target_title', '')}"
                 desc = rel.get('description', '')
-                ontology_lines.append(f"  • {source} → {target}")
                 if desc:
-                    ontology_lines.append(f"    ({desc[:80]})")
-        
-        return "\n".join(ontology_lines)
+                    yield f"    ({desc[:80]})"
+    
+    def _selected_sections(
+        self,
+        lesson: Dict[str, Any],
+        section_ids: List[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        The lesson's sections restricted to `section_ids` (all when empty),
+        in lesson order. Cached like _flatten_learning_objects.
+        """
+        sections = lesson.get('sections', [])
+        if not section_ids:
+            return sections
+        
+        key = (id(lesson), tuple(section_ids))
+        cached = self._section_view_cache.get(key)
+        if cached is not None and cached[0] is lesson:
+            return cached[1]
+        
+        wanted = set(section_ids)
+        selected = [s for s in sections if s.get('id') in wanted]
+        self._section_view_cache[key] = (lesson, selected)
+        return selected
+    
+    def _flatten_learning_objects(
+        self,
+        lesson: Dict[str, Any],
+        section_ids: List[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        All learning objects of the lesson's (selected) sections, normalized
+        to the fields the prompts use. Cached per lesson and section filter
+        for the current generation session; callers must not mutate it.
+        """
+        key = (id(lesson), tuple(section_ids) if section_ids else None)
+        cached = self._flat_lo_cache.get(key)
+        # The lesson itself is stored alongside so its id can't be reused
+        if cached is not None and cached[0] is lesson:
+            return cached[1]
+        
+        sections = self._selected_sections(lesson, section_ids)
+        learning_objects = [
+            {
+                'title': lo.get('title', ''),
+                'description': lo.get('description', ''),
+                'type': lo.get('type', 'concept'),
+                'keywords': lo.get('keywords', []),
+                'key_points': lo.get('key_points', [])
+            }
+            for section in sections
+            for lo in section.get('learning_objects', [])
+        ]
+        self._flat_lo_cache[key] = (lesson, learning_objects)
+        return learning_objects
     
     def _generate_content_summary(self, lesson: Dict[str, Any]) -> str:
         """Generate a summary of the lesson content for higher-order questions"""
         lesson_title = lesson.get('title', 'Lesson')
         
-        # Collect all content
-        all_content = []
-        for section in lesson.get('sections', []):
-            all_content.append(f"## {section.get('title', '')}")
-            for lo in section.get('learning_objects', []):
-                all_content.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:200]}")
+        # Collect content lazily; only the first 3000 chars are used
+        def all_content():
+            for section in lesson.get('sections', []):
+                yield f"## {section.get('title', '')}"
+                for lo in section.get('learning_objects', []):
+                    yield f"- {lo.get('title', '')}: {lo.get('description', '')[:200]}"
         
-        content_text = "\n".join(all_content)[:3000]
+        content_text = _join_capped(all_content(), 3000)
         
         prompt = f"""Summarize the key concepts, themes, and relationships in this educational content.
 
@@ -317,9 +1195,35 @@ Write a 3-4 paragraph summary focusing on:
 Be concise but comprehensive."""
         
         print("[SOLO-Local] Generating content summary for higher-order questions...")
-        summary = self._call_ollama(prompt, timeout=120)
+        summary = self._call_ollama(prompt, timeout=120, expect_json=False)
         return summary or ""
     
+    def _question_from_prompt(
+        self,
+        prompt: Optional[str],
+        level: str,
+        variant: int = 0,
+        timeout: int = 300,
+        hedged: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Ask for the single question `prompt` describes and convert the reply
+        for SOLO `level`; the shared tail of every _generate_<level>_question
+        (None without a prompt or a usable reply).
+        """
+        if not prompt:
+            return None
+        
+        call = self._call_ollama_hedged if hedged else self._call_ollama
+        response = call(
+            prompt, timeout=timeout, variant=variant, system=_SYSTEM_PROMPT,
+            num_predict=_TOKENS_PER_QUESTION, schema=_QUESTION_FORMAT
+        )
+        if not response:
+            return None
+        
+        return self._question_from_data(self._parse_question_response(response), _BLOOM_LEVELS[level])
+    
     def _generate_unistructural_question(
         self,
         lesson: Dict[str, Any],
@@ -332,105 +1236,44 @@ Be concise but comprehensive."""
         
         Uses comprehensive SOLO taxonomy definitions and detailed distractor guidance.
         """
-        
+        prompt = self._unistructural_prompt(lesson, section_ids, content_summary, lo_offset)
+        return self._question_from_prompt(prompt, 'unistructural', lo_offset)
+    
+    def _unistructural_prompt(
+        self,
+        lesson: Dict[str, Any],
+        section_ids: List[int] = None,
+        content_summary: str = "",
+        lo_offset: int = 0,
+        count: int = 1
+    ) -> Optional[str]:
+        """Build the UNISTRUCTURAL prompt asking for `count` questions (None if no material)"""
         lesson_title = lesson.get('title', 'Lesson')
-        sections = lesson.get('sections', [])
-        
-        if section_ids:
-            sections = [s for s in sections if s.get('id') in section_ids]
-        
-        # Collect all learning objects
-        learning_objects = []
-        for section in sections:
-            for lo in section.get('learning_objects', []):
-                learning_objects.append({
-                    'title': lo.get('title', ''),
-                    'description': lo.get('description', ''),
-                    'type': lo.get('type', 'concept'),
-                    'keywords': lo.get('keywords', []),
-                    'key_points': lo.get('key_points', [])
-                })
+        learning_objects = self._flatten_learning_objects(lesson, section_ids)
         
         if not learning_objects:
             return None
         
-        # Pick a learning object based on offset for diversity
-        lo_index = lo_offset % len(learning_objects)
-        lo = learning_objects[lo_index]
+        # Pick learning objects based on offset for diversity (one per question)
+        picked = [
+            learning_objects[(lo_offset + k) % len(learning_objects)]
+            for k in range(min(count, len(learning_objects)))
+        ]
         
-        # Build rich content from the learning object
-        lo_content = f"""Title: {lo['title']}
+        # Build rich content from the learning object(s)
+        lo_content = "\n\n".join(f"""Title: {lo['title']}
 Type: {lo['type']}
 Description: {lo['description']}
 Keywords: {', '.join(lo.get('keywords', []))}
-Key Points: {'; '.join(lo.get('key_points', [])[:3])}"""
+Key Points: {'; '.join(lo.get('key_points', [])[:3])}""" for lo in picked)
         
         # Comprehensive prompt from quiz_generator.py
-        prompt = f"""Create a UNISTRUCTURAL level question about '{lesson_title}'.
-
-LEARNING OBJECT:
-{lo_content}
-
-UNISTRUCTURAL LEVEL DEFINITION:
-At this stage, the learner gets to know just a single relevant aspect of a task or subject; the student gets a basic understanding of a concept or task. Therefore, a student is able to make easy and apparent connections, but he or she does not have any idea how significant that information be or not. In addition, the students' response indicates a concrete understanding of the task, but it focuses on only one relevant aspect.
-
-TASK: Create a question that tests knowledge of ONE specific fact/concept. Student should identify or name a single element directly stated in the content.
-
-QUESTION VARIETY - IMPORTANT:
-**DO NOT** start with "Which of the following" - this is overused and boring!
-Use varied question formats such as:
-- "What is the primary purpose of [X]?"
-- "[X] is defined as..."
-- "The term [X] refers to..."
-- "In the context of [topic], what does [X] mean?"
-- "What characterizes [X]?"
-- "How is [X] typically described?"
-- "The main function of [X] is..."
-- Direct definition questions: "[X] can be best described as..."
-
-CRITICAL INSTRUCTIONS FOR DISTRACTORS:
-- **DO NOT** create obviously wrong options that can be eliminated by common sense
-- **DO** create plausible but INCORRECT options that:
-  * Are related to the topic but refer to WRONG specifics
-  * Sound similar to correct answer but are incorrect variants
-  * Common misconceptions that students might hold
-  * Related but different concepts from the content
-- Example BAD distractor: "The moon is made of cheese" 
-- Example GOOD distractor: "Neptune" (instead of "Uranus") - students who didn't read carefully pick this
-- Make students actually think about the specific detail, not guess
-
-Requirements:
-- Focus on ONE isolated aspect only
-- No connections to other concepts required
-- ALL TEXT IN ENGLISH
-- Question < 250 chars
-- 4 MC options (A-D), one correct
-- 3 distractors must be PLAUSIBLE and require reading comprehension to eliminate
-- Explanation < 250 chars
-
-Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "A) ...", "explanation": "..."}}"""
-        
-        response = self._call_ollama(prompt, timeout=300)
-        if not response:
-            return None
-        
-        question_data = self._parse_question_response(response)
-        if question_data:
-            # Shuffle options to randomize correct answer position
-            question_data = self._shuffle_options(question_data)
-            return {
-                'question_text': question_data.get('question', ''),
-                'question_type': 'multiple_choice',
-                'options': question_data.get('options', []),
-                'correct_answer': question_data.get('correct_answer', ''),
-                'correct_option_index': self._find_correct_index(
-                    question_data.get('options', []),
-                    question_data.get('correct_answer', '')
-                ),
-                'explanation': question_data.get('explanation', ''),
-                'bloom_level': 'remember'
-            }
-        return None
+        return _UNISTRUCTURAL_PROMPT_TEMPLATE.format(
+            lesson_title=lesson_title,
+            plural='S' if len(picked) > 1 else '',
+            lo_content=lo_content,
+            json_instruction=self._json_instruction(count)
+        )
     
     def _generate_multistructural_question(
         self,
@@ -444,111 +1287,64 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
         
         Uses comprehensive SOLO taxonomy definitions and detailed distractor guidance.
         """
-        
+        prompt = self._multistructural_prompt(lesson, section_ids, content_summary, lo_offset)
+        return self._question_from_prompt(prompt, 'multistructural', lo_offset)
+    
+    def _multistructural_prompt(
+        self,
+        lesson: Dict[str, Any],
+        section_ids: List[int] = None,
+        content_summary: str = "",
+        lo_offset: int = 0,
+        count: int = 1
+    ) -> Optional[str]:
+        """Build the MULTISTRUCTURAL prompt asking for `count` questions (None if no material)"""
         lesson_title = lesson.get('title', 'Lesson')
-        sections = lesson.get('sections', [])
-        
-        if section_ids:
-            sections = [s for s in sections if s.get('id') in section_ids]
+        sections = self._selected_sections(lesson, section_ids)
         
         if not sections:
             return None
         
-        # Pick a section based on offset for diversity
-        section_index = lo_offset % len(sections)
-        section = sections[section_index]
+        # Pick sections based on offset for diversity (one per question)
+        picked = [sections[(lo_offset + k) % len(sections)] for k in range(min(count, len(sections)))]
         
-        section_title = section.get('title', '')
+        section_title = " | ".join(section.get('title', '') for section in picked)
         
-        # Build comprehensive content from all learning objects in section
+        # Build comprehensive content from all learning objects in the section(s)
         los_content = []
-        for lo in section.get('learning_objects', [])[:6]:
-            los_content.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:150]}")
-            if lo.get('key_points'):
-                for point in lo.get('key_points', [])[:2]:
-                    los_content.append(f"  • {point}")
+        picked_los = []
+        for section in picked:
+            if len(picked) > 1:
+                los_content.append(f"### {section.get('title', '')}")
+            for lo in section.get('learning_objects', [])[:6]:
+                los_content.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:150]}")
+                if lo.get('key_points'):
+                    for point in lo.get('key_points', [])[:2]:
+                        los_content.append(f"  • {point}")
+            picked_los.extend(section.get('learning_objects', []))
         
         content = "\n".join(los_content)
         
         # Add ontology context if available
-        ontology_context = self._build_ontology_context(section.get('learning_objects', []))
+        ontology_context = self._build_ontology_context(picked_los)
         ontology_section = f"\n\n{ontology_context}" if ontology_context else ""
         
         # Comprehensive prompt from quiz_generator.py
-        prompt = f"""Create a MULTISTRUCTURAL level question about '{lesson_title}'.
-
-SECTION: {section_title}
-
-CONTENT:
-{content}{ontology_section}
-
-MULTISTRUCTURAL LEVEL DEFINITION:
-At this stage, students gain an understanding of numerous relevant independent aspects. Despite understanding the relationship between different aspects, its relationship to the whole remains unclear. Suppose the teacher is teaching about several topics and ideas, the students can make varied connections, but they fail to understand the significance of the whole. The students' responses are based on relevant aspects, but their responses are handled independently.
-
-TASK: Create a question that tests knowledge of MULTIPLE separate facts/features. Student should list or identify several independent elements WITHOUT explaining how they connect.
-
-QUESTION VARIETY - IMPORTANT:
-**DO NOT** start with "Which of the following" - this is overused and boring!
-Use varied question formats such as:
-- "What are the key components of [X]?"
-- "Name the main elements involved in [X]."
-- "[Topic] consists of several parts. These include..."
-- "The main aspects of [X] are..."
-- "Identify the core features of [X]."
-- "What elements make up [X]?"
-- "List the primary characteristics of [X]."
-- "The building blocks of [X] include..."
-
-CRITICAL INSTRUCTIONS FOR DISTRACTORS:
-- **DO NOT** create obviously wrong options that can be eliminated by common sense
-- **DO** create plausible but INCORRECT combinations that:
-  * Mix some correct items with 1-2 WRONG items
-  * Include correct items in wrong contexts
-  * Reorder/rearrange items incorrectly
-  * Include related but not-mentioned aspects from content
-  * Common student misconceptions about the topic
-- Example BAD distractor: "Bananas, dinosaurs, computers" (obviously unrelated)
-- Example GOOD distractor: "DNA, RNA, proteins" (related to biology, but wrong combination for this specific question)
-- Make students verify EACH item, not just recognize keywords
-
-Requirements:
-- Multiple items or aspects, but handled independently
-- Don't require showing relationships between items
-- ALL TEXT IN ENGLISH
-- Question < 250 chars
-- 4 MC options (A-D), one correct
-- 3 distractors must combine PLAUSIBLE elements that seem correct at first glance
-- Explanation < 250 chars
-
-Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "A) ...", "explanation": "..."}}"""
-        
-        response = self._call_ollama(prompt, timeout=300)
-        if not response:
-            return None
-        
-        question_data = self._parse_question_response(response)
-        if question_data:
-            # Shuffle options to randomize correct answer position
-            question_data = self._shuffle_options(question_data)
-            return {
-                'question_text': question_data.get('question', ''),
-                'question_type': 'multiple_choice',
-                'options': question_data.get('options', []),
-                'correct_answer': question_data.get('correct_answer', ''),
-                'correct_option_index': self._find_correct_index(
-                    question_data.get('options', []),
-                    question_data.get('correct_answer', '')
-                ),
-                'explanation': question_data.get('explanation', ''),
-                'bloom_level': 'understand'
-            }
-        return None
+        return _MULTISTRUCTURAL_PROMPT_TEMPLATE.format(
+            lesson_title=lesson_title,
+            plural='S' if len(picked) > 1 else '',
+            section_title=section_title,
+            content=content,
+            ontology_section=ontology_section,
+            json_instruction=self._json_instruction(count)
+        )
     
     def _generate_relational_question(
         self,
         lesson: Dict[str, Any],
         section_ids: List[int] = None,
-        content_summary: str = ""
+        content_summary: str = "",
+        variant: int = 0
     ) -> Dict[str, Any]:
         """
         Generate RELATIONAL question from SECTIONS + LEARNING OBJECTS
@@ -556,117 +1352,58 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
         Uses comprehensive SOLO taxonomy definitions and detailed distractor guidance.
         Requires understanding of relationships between concepts.
         """
-        
+        prompt = self._relational_prompt(lesson, section_ids, content_summary)
+        return self._question_from_prompt(prompt, 'relational', variant)
+    
+    def _relational_prompt(
+        self,
+        lesson: Dict[str, Any],
+        section_ids: List[int] = None,
+        content_summary: str = "",
+        count: int = 1
+    ) -> Optional[str]:
+        """Build the RELATIONAL prompt asking for `count` questions (None if no material)"""
         lesson_title = lesson.get('title', 'Lesson')
-        sections = lesson.get('sections', [])
-        
-        if section_ids:
-            sections = [s for s in sections if s.get('id') in section_ids]
+        sections = self._selected_sections(lesson, section_ids)
         
         if not sections:
             return None
         
         # Build comprehensive content with relationships visible
-        content_parts = []
-        for section in sections[:4]:
-            section_title = section.get('title', '')
-            content_parts.append(f"### {section_title}")
-            for lo in section.get('learning_objects', [])[:5]:
-                content_parts.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:200]}")
-                # Include key points for more context
-                for point in lo.get('key_points', [])[:2]:
-                    content_parts.append(f"  • {point}")
-        
-        combined_content = "\n".join(content_parts)[:3000]
+        def content_parts():
+            for section in sections[:4]:
+                section_title = section.get('title', '')
+                yield f"### {section_title}"
+                for lo in section.get('learning_objects', [])[:5]:
+                    yield f"- {lo.get('title', '')}: {lo.get('description', '')[:200]}"
+                    # Include key points for more context
+                    for point in lo.get('key_points', [])[:2]:
+                        yield f"  • {point}"
+        
+        combined_content = _join_capped(content_parts(), 3000)
         
         # Add ontology relationships for structure understanding
-        ontology_context = self._build_ontology_context([
-            lo for section in sections for lo in section.get('learning_objects', [])
-        ])
+        ontology_context = self._build_ontology_context(
+            self._flatten_learning_objects(lesson, section_ids)
+        )
         ontology_section = f"\n\n{ontology_context}" if ontology_context else ""
         
-        # Add summary section for higher-order understanding
-        summary_section = ""
-        if content_summary:
-            summary_section = f"\n\nCONTENT SUMMARY (key themes and relationships):\n{content_summary[:1000]}\n"
-        
         # Comprehensive prompt from quiz_generator.py
-        prompt = f"""Create a RELATIONAL level question about '{lesson_title}'.
-
-CONTENT:
-{combined_content}{ontology_section}{summary_section}
-
-RELATIONAL LEVEL DEFINITION:
-This stage relates to aspects of knowledge combining to form a structure. By this stage, the student is able to understand the importance of different parts in relation to the whole. They are able to connect concepts and ideas, so it provides a coherent knowledge of the whole thing. Moreover, the students' response indicates an understanding of the task by combining all the parts, and they can demonstrate how each part contributes to the whole.
-
-TASK: Create a question that tests understanding of HOW parts CONNECT and work TOGETHER. Use both the detailed content, domain ontology AND the summary to identify key relationships. Student should explain relationships, patterns, or cause-effect between elements. Shows deep integrated understanding.
-
-QUESTION VARIETY - IMPORTANT:
-**DO NOT** start with "Which of the following" - this is overused and boring!
-Use varied question formats such as:
-- "How does [X] relate to [Y]?"
-- "What is the relationship between [X] and [Y]?"
-- "Why does [X] affect [Y] in this way?"
-- "Explain how [X] contributes to [Y]."
-- "The connection between [X] and [Y] can be described as..."
-- "How do [X] and [Y] work together to achieve [Z]?"
-- "What role does [X] play in the context of [Y]?"
-- "In what way does [X] influence [Y]?"
-- "The interaction between [X] and [Y] results in..."
-
-CRITICAL INSTRUCTIONS FOR DISTRACTORS:
-- **DO NOT** create obviously wrong options that can be eliminated without thinking
-- **DO** create CHALLENGING distractors that:
-  * Seem logical if you only understand PART of the relationship
-  * Require understanding the FULL integrated picture to reject
-  * Include partially correct connections (correct concepts, wrong relationship)
-  * Reverse causes and effects (plausible but backwards)
-  * Connect concepts that ARE related but in wrong ways
-  * Address a DIFFERENT relationship that also exists in the content
-- Example BAD distractor: "Because trees don't exist" (obviously wrong)
-- Example GOOD distractor: "Because temperature increases while gas pressure also increases" (confuses correlation with the actual causal mechanism)
-- Distractors should reflect REAL misconceptions about how things relate
-
-Requirements:
-- Ask about relationships, connections, or cause-effect WITHIN the content
-- Use the summary to understand the broader context and key themes
-- Require understanding of how parts fit together into a coherent whole
-- Student must show how different elements relate to each other
-- ALL TEXT IN ENGLISH
-- Question < 250 chars
-- 4 MC options (A-D), one correct
-- 3 distractors must be CHALLENGING and reflect real misconceptions
-- Explanation < 250 chars
-
-Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "A) ...", "explanation": "..."}}"""
-        
-        response = self._call_ollama(prompt, timeout=300)
-        if not response:
-            return None
-        
-        question_data = self._parse_question_response(response)
-        if question_data:
-            # Shuffle options to randomize correct answer position
-            question_data = self._shuffle_options(question_data)
-            return {
-                'question_text': question_data.get('question', ''),
-                'question_type': 'multiple_choice',
-                'options': question_data.get('options', []),
-                'correct_answer': question_data.get('correct_answer', ''),
-                'correct_option_index': self._find_correct_index(
-                    question_data.get('options', []),
-                    question_data.get('correct_answer', '')
-                ),
-                'explanation': question_data.get('explanation', ''),
-                'bloom_level': 'analyze'
-            }
-        return None
+        return _RELATIONAL_PROMPT_TEMPLATE.format(
+            lesson_title=lesson_title,
+            combined_content=combined_content,
+            ontology_section=ontology_section,
+            # Summary section for higher-order understanding
+            summary_section=self._summary_section(content_summary),
+            json_instruction=self._json_instruction(count)
+        )
     
     def _generate_extended_abstract_question(
         self,
         lesson: Dict[str, Any],
         content_summary: str = "",
-        secondary_lesson: Dict[str, Any] = None
+        secondary_lesson: Dict[str, Any] = None,
+        variant: int = 0
     ) -> Dict[str, Any]:
         """
         Generate EXTENDED ABSTRACT question requiring synthesis and cross-lesson application
@@ -675,155 +1412,190 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
         For maximum effectiveness, combines concepts from TWO lessons to test transfer of knowledge.
         Requires applying learned concepts to NEW situations that synthesize both topics.
         """
-        
+        prompt = self._extended_abstract_prompt(lesson, content_summary, secondary_lesson)
+        # Streamed, so the timeout bounds the gap between tokens rather than
+        # the whole reply; stalls are covered by the hedged duplicate
+        return self._question_from_prompt(
+            prompt, 'extended_abstract', variant, timeout=60, hedged=True
+        )
+    
+    def _lesson_concepts(self, lesson: Dict[str, Any]) -> str:
+        """
+        Key-concept lines of a lesson for extended-abstract prompts. Built
+        once per lesson for the current generation session: every pairing
+        and retry of the lesson reuses the same text.
+        """
+        cached = self._lesson_concepts_cache.get(id(lesson))
+        if cached is not None and cached[0] is lesson:
+            return cached[1]
+        
+        concepts = (
+            f"- {lo.get('title', '')}: {lo.get('description', '')[:150]}"
+            for section in lesson.get('sections', [])
+            for lo in section.get('learning_objects', [])[:4]
+        )
+        concepts_text = "\n".join(islice(concepts, 15))
+        self._lesson_concepts_cache[id(lesson)] = (lesson, concepts_text)
+        return concepts_text
+    
+    @staticmethod
+    def _summary_section(content_summary: str) -> str:
+        """Prompt block for the lesson summary (empty without one)"""
+        if not content_summary:
+            return ""
+        return f"\n\nCONTENT SUMMARY (key themes and relationships):\n{content_summary[:1000]}\n"
+    
+    def _extended_abstract_prompt(
+        self,
+        lesson: Dict[str, Any],
+        content_summary: str = "",
+        secondary_lesson: Dict[str, Any] = None,
+        count: int = 1
+    ) -> Optional[str]:
+        """Build the EXTENDED ABSTRACT prompt asking for `count` questions (None if no material)"""
         lesson_title = lesson.get('title', 'Lesson')
         
         # Get key concepts from primary lesson
-        concepts_primary = []
-        for section in lesson.get('sections', []):
-            section_title = section.get('title', '')
-            for lo in section.get('learning_objects', [])[:4]:
-                concepts_primary.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:150]}")
-        
-        concepts_text = "\n".join(concepts_primary[:15])
+        concepts_text = self._lesson_concepts(lesson)
         
         # Get concepts from secondary lesson if provided
         concepts_secondary_text = ""
         secondary_title = ""
         if secondary_lesson:
             secondary_title = secondary_lesson.get('title', 'Lesson 2')
-            concepts_secondary = []
-            for section in secondary_lesson.get('sections', []):
-                for lo in section.get('learning_objects', [])[:4]:
-                    concepts_secondary.append(f"- {lo.get('title', '')}: {lo.get('description', '')[:150]}")
-            secondary_concepts = "\n".join(concepts_secondary[:15])
+            secondary_concepts = self._lesson_concepts(secondary_lesson)
             concepts_secondary_text = f"\n\nSECONDARY TOPIC ({secondary_title}) CONCEPTS:\n{secondary_concepts}"
         
-        # Add summary section for higher-order understanding
-        summary_section = ""
-        if content_summary:
-            summary_section = f"\n\nCONTENT SUMMARY (key themes and relationships):\n{content_summary[:1000]}\n"
-        
-        # Comprehensive prompt with EXPLICIT INSTRUCTIONS for combining 2 lessons
-        if secondary_lesson:
-            combine_instruction = f"""CRITICAL - COMBINE CONCEPTS FROM EXACTLY THESE 2 TOPICS:
-You MUST create a question that connects and synthesizes concepts from BOTH '{lesson_title}' AND '{secondary_title}'.
-The question should show how these two topics relate to each other, influence each other, or can be applied together.
-
-**STRICT GROUNDING RULE**: Use ONLY concepts, terms, and ideas that appear in the provided materials above.
-DO NOT introduce external concepts, theories, or examples that are not mentioned in the lesson content.
-The synthesis must be between concepts FROM THESE TWO LESSONS ONLY.
-
-Example: If lesson 1 covers "Unit Testing" and lesson 2 covers "Angular Components", ask how unit testing principles apply to Angular component testing - combining BOTH topics using concepts FROM the materials."""
-        else:
-            combine_instruction = """Create a question that applies the principles from this lesson to a practical scenario.
-**STRICT GROUNDING RULE**: Use ONLY concepts and terms that appear in the provided content.
-DO NOT introduce external concepts not mentioned in the lesson."""
-        
-        prompt = f"""Create an EXTENDED ABSTRACT level question{' combining 2 lessons' if secondary_lesson else ''}.
-
-PRIMARY TOPIC ({lesson_title}) CONCEPTS:
-{concepts_text}{concepts_secondary_text}{summary_section}
-
-{combine_instruction}
-
-EXTENDED ABSTRACT LEVEL DEFINITION:
-By this level, students are able to make connections within the provided task, and they also create connections beyond that. They develop the ability to transfer and generalise the concepts and principles from one subject area into a particular domain. Therefore, the students' response indicates that they can conceptualise beyond the level of what has been taught. They are able to propose new concepts and ideas depending on their understanding of the task or subject taught.
-
-TASK: Create a question that requires:
-- Understanding core principles from {'both topics' if secondary_lesson else 'the lesson'}
-- {'Synthesizing concepts from BOTH lessons to solve a problem or explain a scenario' if secondary_lesson else 'Applying lesson principles to a new but related scenario'}
-- Student must demonstrate deep understanding by combining/applying knowledge
-
-**IMPORTANT - STAY GROUNDED IN THE MATERIALS**:
-- All concepts in the question and answers MUST come from the provided lesson content
-- DO NOT introduce new theories, frameworks, or concepts not in the materials
-- The "new context" means a NEW APPLICATION of the SAME concepts, not introducing NEW concepts
-- If combining 2 lessons, the question must use specific concepts from BOTH lessons
-
-QUESTION VARIETY - IMPORTANT:
-**DO NOT** start with "Which of the following" - this is overused and boring!
-Use varied question formats such as:
-- "How can the principles of [X from lesson 1] be applied to improve [Y from lesson 2]?"
-- "A developer needs to [scenario]. Using concepts from [both topics], the best approach would be..."
-- "When combining [concept A] with [concept B], what outcome should be expected?"
-- "Given a situation where [scenario using both topics], how should one proceed?"
-- "The integration of [X] and [Y] enables..."
-- "To achieve [goal], how would [concept from lesson 1] work together with [concept from lesson 2]?"
-
-CRITICAL INSTRUCTIONS FOR DISTRACTORS:
-- **DO NOT** create obviously wrong options
-- **DO** create TRICKY distractors that:
-  * Look correct if you misunderstand which principle applies
-  * Correctly apply a concept from ONE lesson but ignore the other
-  * {'Apply concepts from only one of the two lessons' if secondary_lesson else 'Partially apply the principle'}
-  * Follow logically but reach wrong conclusion
-  * Represent common misconceptions about how the concepts interact
-- Distractors should be SOPHISTICATED errors that test deep understanding
-- ALL distractors must use concepts FROM THE PROVIDED MATERIALS
-
-Requirements:
-- {'Question MUST require knowledge of BOTH lessons to answer correctly' if secondary_lesson else 'Question must apply lesson concepts to a practical scenario'}
-- All concepts in question and answers must come from the provided materials
-- Requires student to synthesize and apply knowledge (not just recall)
-- ALL TEXT IN ENGLISH
-- Question < 300 chars
-- 4 MC options (A-D), one correct
-- 3 distractors must be CHALLENGING but grounded in the lesson materials
-- Explanation < 250 chars, {'showing how concepts from both lessons combine' if secondary_lesson else 'explaining the application'}
-
-Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "A) ...", "explanation": "..."}}"""
-        
-        response = self._call_ollama(prompt, timeout=300)
-        if not response:
+        # Static instructions are pre-joined; only the lesson fields are filled
+        return _EXTENDED_ABSTRACT_PROMPT_TEMPLATES[bool(secondary_lesson)].format(
+            lesson_title=lesson_title,
+            secondary_title=secondary_title,
+            concepts_text=concepts_text,
+            concepts_secondary_text=concepts_secondary_text,
+            # Summary section for higher-order understanding
+            summary_section=self._summary_section(content_summary),
+            json_instruction=self._json_instruction(count)
+        )
+    
+    @staticmethod
+    def _json_instruction(count: int) -> str:
+        """Closing output instruction for a prompt asking for `count` questions"""
+        if count <= 1:
+            return 'Return ONLY JSON: {"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "A) ...", "explanation": "..."}'
+        return (
+            f"Create {count} DIFFERENT questions. Each must test a different fact, learning object "
+            "or relationship - no two questions may ask the same thing.\n\n"
+            'Return ONLY JSON: {"questions": [{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], '
+            f'"correct_answer": "A) ...", "explanation": "..."}}, ... ({count} items)]}}'
+        )
+    
+    def _question_from_data(self, question_data: Optional[Dict[str, Any]], bloom_level: str) -> Optional[Dict[str, Any]]:
+        """Turn one parsed model question into the stored question dict (None if malformed)"""
+        if not _is_valid_question(question_data):
             return None
+        # Shuffle options to randomize correct answer position; a valid
+        # question has four options, so the shuffle always records where
+        # the answer went
+        question_data = self._shuffle_options(question_data)
+        correct_index = question_data['correct_option_index']
+        return {
+            'question_text': question_data.get('question', ''),
+            'question_type': 'multiple_choice',
+            'options': question_data.get('options', []),
+            'correct_answer': question_data.get('correct_answer', ''),
+            'correct_option_index': correct_index,
+            'explanation': question_data.get('explanation', ''),
+            'bloom_level': bloom_level
+        }
+    
+    def _generate_level_batch(
+        self,
+        level: str,
+        lessons_data: List[Dict[str, Any]],
+        section_ids: List[int],
+        content_summary: str,
+        lo_offset: int,
+        count: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate `count` candidate questions for a SOLO level in ONE Ollama call.
         
-        question_data = self._parse_question_response(response)
-        if question_data:
-            # Shuffle options to randomize correct answer position
-            question_data = self._shuffle_options(question_data)
-            return {
-                'question_text': question_data.get('question', ''),
-                'question_type': 'multiple_choice',
-                'options': question_data.get('options', []),
-                'correct_answer': question_data.get('correct_answer', ''),
-                'correct_option_index': self._find_correct_index(
-                    question_data.get('options', []),
-                    question_data.get('correct_answer', '')
-                ),
-                'explanation': question_data.get('explanation', ''),
-                'bloom_level': 'create'
-            }
-        return None
+        The level's prompt (and its lesson context) is sent once with a request
+        for a JSON array. Returns an empty list if the reply is unusable, so the
+        caller can fall back to one call per question.
+        """
+        primary_lesson = lessons_data[0]
+        secondary_lesson = lessons_data[1] if len(lessons_data) > 1 else None
+        try:
+            if level == 'unistructural':
+                prompt = self._unistructural_prompt(primary_lesson, section_ids, content_summary, lo_offset, count=count)
+            elif level == 'multistructural':
+                prompt = self._multistructural_prompt(primary_lesson, section_ids, content_summary, lo_offset, count=count)
+            elif level == 'relational':
+                prompt = self._relational_prompt(primary_lesson, section_ids, content_summary, count=count)
+            elif level == 'extended_abstract':
+                prompt = self._extended_abstract_prompt(primary_lesson, content_summary, secondary_lesson, count=count)
+            else:
+                prompt = None
+            if not prompt:
+                return []
+            
+            response = self._call_ollama(
+                prompt, timeout=300, variant=lo_offset, system=_SYSTEM_PROMPT,
+                num_predict=_TOKENS_PER_QUESTION * count,
+                schema=_QUESTION_BATCH_FORMAT
+            )
+            if not response:
+                return []
+            
+            parsed = self._parse_question_response(response) or {}
+            items = parsed.get('questions') if isinstance(parsed, dict) else None
+            if not isinstance(items, list):
+                return []
+            
+            questions = []
+            for item in items[:count]:
+                question = self._question_from_data(item, _BLOOM_LEVELS[level])
+                if question:
+                    questions.append(question)
+            return questions
+        except Exception as e:
+            print(f"[SOLO-Local] Error generating {level} question batch: {e}")
+            return []
     
     def _parse_question_response(self, response: str) -> Optional[Dict[str, Any]]:
         """Parse API response to extract question data"""
+        # Schema-constrained replies are a bare object; a reply from a server
+        # that ignored the schema may need the object cut out of its prose
         try:
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            else:
-                return None
+            data = _json_loads(response)
+            if isinstance(data, dict):
+                return data
         except json.JSONDecodeError:
+            pass
+        start = response.find('{')
+        if start == -1:
             return None
+        # Usually prose just wraps a single object: hand that span to the
+        # fast decoder before falling back to a scan
+        end = response.rfind('}')
+        if end > start:
+            try:
+                data = _json_loads(response[start:end + 1])
+                if isinstance(data, dict):
+                    return data
+            except json.JSONDecodeError:
+                pass
+        # Decode straight from each '{' in turn: raw_decode stops at the end
+        # of the object, so prose around it (braces included) is ignored
+        while start != -1:
+            try:
+                data, _ = _JSON_DECODER.raw_decode(response, start)
+                return data
+            except json.JSONDecodeError:
+                start = response.find('{', start + 1)
+        return None
     
-    def _find_correct_index(self, options: List[str], correct_answer: str) -> int:
-        """Find the index of the correct answer in options list"""
-        if not options or not correct_answer:
-            return 0
-        
-        for i, opt in enumerate(options):
-            if opt == correct_answer:
-                return i
-        
-        # Try matching by letter prefix
-        correct_letter = correct_answer[0].upper() if correct_answer else 'A'
-        for i, opt in enumerate(options):
-            if opt.startswith(correct_letter):
-                return i
-        
-        return 0
-
     def _shuffle_options(self, question_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Shuffle the options to randomize correct answer position.
@@ -833,7 +1605,8 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
             question_data: Dict with 'options' and 'correct_answer' keys
             
         Returns:
-            Updated question_data with shuffled options and updated correct_answer
+            Updated question_data with shuffled options, updated correct_answer
+            and its position as correct_option_index
         """
         options = question_data.get('options', [])
         correct_answer = question_data.get('correct_answer', '')
@@ -847,11 +1620,11 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
         
         for opt in options:
             # Remove letter prefix like "A) ", "B) ", etc.
-            text = re.sub(r'^[A-Da-d]\)\s*', '', opt).strip()
+            text = _OPTION_PREFIX_RE.sub('', opt).strip()
             option_texts.append(text)
         
         # Find the correct answer text
-        correct_text = re.sub(r'^[A-Da-d]\)\s*', '', correct_answer).strip()
+        correct_text = _OPTION_PREFIX_RE.sub('', correct_answer).strip()
         
         # Shuffle the options
         random.shuffle(option_texts)
@@ -875,6 +1648,7 @@ Return ONLY JSON: {{"question": "...", "options": ["A) ...", "B) ...", "C) ...",
         # Update the question data
         question_data['options'] = new_options
         question_data['correct_answer'] = new_correct_answer
+        question_data['correct_option_index'] = new_correct_index
         
         return question_data
 
@@ -0,0 +1,150 @@
+"""
+Response Cache Module
+Persistent exact-match cache for Ollama prompt -> response pairs
+
+Keys are SHA-256 digests of (model, prompt, generation options), so a cached
+answer is only reused for a byte-identical request. Only deterministic calls
+(temperature=0 with a fixed seed) should be cached - sampled output would be
+frozen to whatever the first run happened to produce.
+
+In practice that means ContentParser only: the quiz generator samples its
+questions and keeps replies in a per-run in-memory cache, so nothing it
+produces is stored here and OLLAMA_CACHE_TTL does not affect quiz generation.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import OLLAMA_CACHE_ENABLED, OLLAMA_CACHE_PATH, OLLAMA_CACHE_MEMORY_SIZE, OLLAMA_CACHE_TTL
+
+
+class ResponseCache:
+    """
+    SQLite-backed key/value store for LLM responses.
+
+    A single connection is shared between threads and guarded by a lock;
+    SQLite is plenty fast for the handful of lookups a lesson parse makes.
+    The most recently used entries are also kept in an in-memory LRU so
+    repeated lookups within a process skip SQLite entirely.
+    With a `ttl` (seconds), entries older than that are treated as misses
+    and expired rows are purged when the cache is opened.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, memory_size: int = 256, ttl: int = 0):
+        """Open (or create) the cache database at `path`"""
+        self.path = path
+        self.enabled = enabled
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._memory = OrderedDict()
+
+        if not self.enabled:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "response TEXT NOT NULL, "
+                "created_at REAL DEFAULT (strftime('%s', 'now')))"
+            )
+            self._conn.commit()
+            self.purge_expired()
+        except sqlite3.Error as e:
+            print(f"[ResponseCache] Disabled - could not open {path}: {e}")
+            self.enabled = False
+            self._conn = None
+
+    @staticmethod
+    def make_key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key for a model/prompt/options triple"""
+        digest = hashlib.sha256()
+        digest.update(model.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(prompt.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for `key`, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._memory:
+                response, created_at = self._memory[key]
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    return response
+                del self._memory[key]
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or self._expired(row[1]):
+                return None
+            self._remember(key, row[0], row[1])
+        return row[0]
+
+    def set(self, key: str, response: str) -> None:
+        """Store `response` under `key` (overwrites any previous value)"""
+        if not self.enabled or not response:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                (key, response)
+            )
+            self._conn.commit()
+            self._remember(key, response, time.time())
+
+    def clear(self) -> None:
+        """Drop every cached response"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._memory.clear()
+
+    def purge_expired(self) -> None:
+        """Delete rows older than the TTL (no-op without one)"""
+        if not self.enabled or self.ttl <= 0:
+            return
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._conn.commit()
+            self._memory.clear()
+
+    def _expired(self, created_at: float) -> bool:
+        """Whether an entry written at `created_at` is past the TTL"""
+        return self.ttl > 0 and created_at < time.time() - self.ttl
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        """Put an entry in the in-memory LRU (caller holds the lock)"""
+        if self.memory_size <= 0:
+            return
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+# Create global instance
+response_cache = ResponseCache(
+    OLLAMA_CACHE_PATH,
+    enabled=OLLAMA_CACHE_ENABLED,
+    memory_size=OLLAMA_CACHE_MEMORY_SIZE,
+    ttl=OLLAMA_CACHE_TTL
+)
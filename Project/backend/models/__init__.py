@@ -7,6 +7,7 @@ from .models import (
     Base,
     engine,
     Session,
+    SessionFactory,
     SoloLevel,
     Course,
     Lesson,
@@ -27,6 +28,7 @@ __all__ = [
     'Base',
     'engine', 
     'Session',
+    'SessionFactory',
     'SoloLevel',
     'Course',
     'Lesson',
@@ -5,19 +5,91 @@ All database table definitions and relationships
 
 import os
 import enum
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON, Float
+import json
+from functools import lru_cache
+from sqlalchemy import create_engine, event, func, select, Column, Index, Integer, String, Text, DateTime, ForeignKey, Float
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import column_property, sessionmaker, scoped_session, relationship
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
 
 # Database path
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'quiz_database.db')
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-# Create engine and base
-engine = create_engine(DATABASE_URL, echo=False)
+# Create engine and base. Connections are pooled and may be used from any
+# Flask worker thread (each thread still gets its own session, see below).
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=QueuePool,
+    pool_size=10,
+    connect_args={"check_same_thread": False},
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning: WAL so readers never block on a writer
+    (and commits append to the log instead of rewriting pages), fsync only
+    at checkpoints, a wait instead of "database is locked" when two writers
+    collide, temp tables in memory, a 64 MB page cache and memory-mapped
+    reads of the database file"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
+
+@lru_cache(maxsize=4096)
+def _isoformat(value):
+    """ISO string for a timestamp (None stays None).
+
+    Keyed by the datetime itself, so it can't go stale: the same rows are
+    serialized on every list request and each timestamp is formatted once.
+    """
+    return value.isoformat() if value else None
+
+
+class JSONText(TypeDecorator):
+    """JSON stored as TEXT, encoded and decoded with orjson when available.
+
+    Same on-disk format as the previous JSON columns, so existing rows read
+    back unchanged; only the (de)serialization on every load/flush is faster.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if orjson is not None:
+            return orjson.dumps(value).decode('utf-8')
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.loads(value) if orjson is not None else json.loads(value)
+
+
 Base = declarative_base()
-Session = sessionmaker(bind=engine)
+# Objects keep their loaded state across commit, so the to_dict() that
+# follows nearly every create/update doesn't re-SELECT the row it just wrote
+SessionFactory = sessionmaker(bind=engine, expire_on_commit=False)
+# Thread-local registry: Session() returns the calling thread's session, so
+# repository calls reuse one Session object per thread instead of building
+# a new one each time. Session.remove() discards it (request teardown).
+Session = scoped_session(SessionFactory)
 
 
 class SoloLevel(enum.Enum):
@@ -36,8 +108,8 @@ class Course(Base):
     name = Column(String(255), nullable=False)
     code = Column(String(50), nullable=True)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relationships
     lessons = relationship("Lesson", back_populates="course", cascade="all, delete-orphan")
@@ -49,15 +121,17 @@ class Course(Base):
             'name': self.name,
             'code': self.code,
             'description': self.description,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'lesson_count': len(self.lessons) if self.lessons else 0
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at),
+            'lesson_count': self.lesson_count or 0
         }
 
 
 class Lesson(Base):
     """Lesson model - represents a PDF file/lesson"""
     __tablename__ = 'lessons'
+    # get_lessons_for_course filters by course and sorts by order_index
+    __table_args__ = (Index('ix_lessons_course_order', 'course_id', 'order_index'),)
     
     id = Column(Integer, primary_key=True)
     course_id = Column(Integer, ForeignKey('courses.id'), nullable=False)
@@ -67,8 +141,8 @@ class Lesson(Base):
     raw_content = Column(Text, nullable=True)
     summary = Column(Text, nullable=True)
     order_index = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relationships
     course = relationship("Course", back_populates="lessons")
@@ -82,9 +156,9 @@ class Lesson(Base):
             'filename': self.filename,
             'summary': self.summary,
             'order_index': self.order_index,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'section_count': len(self.sections) if self.sections else 0,
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at),
+            'section_count': self.section_count or 0,
             'translations': [t.to_dict() for t in self.lesson_translations] if hasattr(self, 'lesson_translations') else []
         }
         if include_content:
@@ -95,6 +169,8 @@ class Lesson(Base):
 class Section(Base):
     """Section model - major divisions within a lesson"""
     __tablename__ = 'sections'
+    # Sections are listed per lesson in order_index order
+    __table_args__ = (Index('ix_sections_lesson_order', 'lesson_id', 'order_index'),)
     
     id = Column(Integer, primary_key=True)
     lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=False)
@@ -104,7 +180,7 @@ class Section(Base):
     order_index = Column(Integer, default=0)
     start_page = Column(Integer, nullable=True)
     end_page = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
     
     # Relationships
     lesson = relationship("Lesson", back_populates="sections")
@@ -119,14 +195,10 @@ class Section(Base):
             'order_index': self.order_index,
             'start_page': self.start_page,
             'end_page': self.end_page,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'learning_object_count': 0,
+            'created_at': _isoformat(self.created_at),
+            'learning_object_count': self.learning_object_count or 0,
             'translations': [t.to_dict() for t in self.section_translations] if hasattr(self, 'section_translations') else []
         }
-        try:
-            result['learning_object_count'] = len(self.learning_objects) if self.learning_objects else 0
-        except Exception:
-            result['learning_object_count'] = 0
         if include_content:
             result['content'] = self.content
         return result
@@ -135,20 +207,22 @@ class Section(Base):
 class LearningObject(Base):
     """Learning Object model - smallest unit of knowledge"""
     __tablename__ = 'learning_objects'
+    # Learning objects are listed per section in order_index order
+    __table_args__ = (Index('ix_learning_objects_section_order', 'section_id', 'order_index'),)
     
     id = Column(Integer, primary_key=True)
     section_id = Column(Integer, ForeignKey('sections.id'), nullable=False)
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=True)
     description = Column(Text, nullable=True)
-    key_points = Column(JSON, nullable=True)
+    key_points = Column(JSONText, nullable=True)
     object_type = Column(String(50), nullable=True)
-    keywords = Column(JSON, nullable=True)
+    keywords = Column(JSONText, nullable=True)
     order_index = Column(Integer, default=0)
     is_ai_generated = Column(Integer, default=1)
     human_modified = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relationships
     section = relationship("Section", back_populates="learning_objects")
@@ -166,8 +240,8 @@ class LearningObject(Base):
             'order_index': self.order_index,
             'is_ai_generated': bool(getattr(self, 'is_ai_generated', 1)),
             'human_modified': bool(getattr(self, 'human_modified', 0)),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at),
             'translations': [t.to_dict() for t in self.learning_object_translations] if hasattr(self, 'learning_object_translations') else []
         }
 
@@ -177,11 +251,11 @@ class ConceptRelationship(Base):
     __tablename__ = 'concept_relationships'
     
     id = Column(Integer, primary_key=True)
-    source_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=False)
-    target_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=False)
+    source_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=False, index=True)
+    target_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=False, index=True)
     relationship_type = Column(String(50), nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
     
     # Relationships
     source = relationship("LearningObject", foreign_keys=[source_id])
@@ -194,7 +268,7 @@ class ConceptRelationship(Base):
             'target_id': self.target_id,
             'relationship_type': self.relationship_type,
             'description': self.description,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'created_at': _isoformat(self.created_at),
             'source_title': self.source.title if self.source else None,
             'target_title': self.target.title if self.target else None
         }
@@ -205,29 +279,29 @@ class Question(Base):
     __tablename__ = 'questions'
     
     id = Column(Integer, primary_key=True)
-    primary_lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=True)
-    secondary_lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=True)
-    section_id = Column(Integer, ForeignKey('sections.id'), nullable=True)
-    learning_object_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=True)
+    primary_lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=True, index=True)
+    secondary_lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=True, index=True)
+    section_id = Column(Integer, ForeignKey('sections.id'), nullable=True, index=True)
+    learning_object_id = Column(Integer, ForeignKey('learning_objects.id'), nullable=True, index=True)
     
     solo_level = Column(String(50), nullable=False)
     question_text = Column(Text, nullable=False)
     question_type = Column(String(50), default='multiple_choice')
     
-    options = Column(JSON, nullable=True)
+    options = Column(JSONText, nullable=True)
     correct_answer = Column(Text, nullable=True)
     correct_option_index = Column(Integer, nullable=True)
     
     explanation = Column(Text, nullable=True)
     difficulty = Column(Float, nullable=True)
     bloom_level = Column(String(50), nullable=True)
-    tags = Column(JSON, nullable=True)
+    tags = Column(JSONText, nullable=True)
     
     is_ai_generated = Column(Integer, default=1)
     human_modified = Column(Integer, default=0)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     used_count = Column(Integer, default=0)
     
     # Relationships
@@ -245,33 +319,47 @@ class Question(Base):
         except Exception:
             pass  # If translations can't be loaded, return empty list
         
+        return Question.build_dict(
+            self,
+            translations_list,
+            self.primary_lesson.title if self.primary_lesson else None,
+            self.secondary_lesson.title if self.secondary_lesson else None
+        )
+    
+    @staticmethod
+    def build_dict(source, translations, primary_lesson_title=None, secondary_lesson_title=None):
+        """
+        The to_dict shape from anything exposing the question columns as
+        attributes: a Question, or a Core row of the questions table (so
+        list endpoints can skip building ORM objects).
+        """
         result = {
-            'id': self.id,
-            'primary_lesson_id': self.primary_lesson_id,
-            'secondary_lesson_id': self.secondary_lesson_id,
-            'section_id': self.section_id,
-            'learning_object_id': self.learning_object_id,
-            'solo_level': self.solo_level,
-            'question_text': self.question_text,
-            'question_type': self.question_type,
-            'options': self.options,
-            'correct_answer': self.correct_answer,
-            'correct_option_index': self.correct_option_index,
-            'explanation': self.explanation,
-            'difficulty': self.difficulty,
-            'bloom_level': self.bloom_level,
-            'tags': self.tags,
-            'is_ai_generated': bool(getattr(self, 'is_ai_generated', 1)),
-            'human_modified': bool(getattr(self, 'human_modified', 0)),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'used_count': self.used_count,
-            'translations': translations_list
+            'id': source.id,
+            'primary_lesson_id': source.primary_lesson_id,
+            'secondary_lesson_id': source.secondary_lesson_id,
+            'section_id': source.section_id,
+            'learning_object_id': source.learning_object_id,
+            'solo_level': source.solo_level,
+            'question_text': source.question_text,
+            'question_type': source.question_type,
+            'options': source.options,
+            'correct_answer': source.correct_answer,
+            'correct_option_index': source.correct_option_index,
+            'explanation': source.explanation,
+            'difficulty': source.difficulty,
+            'bloom_level': source.bloom_level,
+            'tags': source.tags,
+            'is_ai_generated': bool(getattr(source, 'is_ai_generated', 1)),
+            'human_modified': bool(getattr(source, 'human_modified', 0)),
+            'created_at': _isoformat(source.created_at),
+            'updated_at': _isoformat(source.updated_at),
+            'used_count': source.used_count,
+            'translations': translations
         }
-        if self.primary_lesson:
-            result['primary_lesson_title'] = self.primary_lesson.title
-        if self.secondary_lesson:
-            result['secondary_lesson_title'] = self.secondary_lesson.title
+        if primary_lesson_title is not None:
+            result['primary_lesson_title'] = primary_lesson_title
+        if secondary_lesson_title is not None:
+            result['secondary_lesson_title'] = secondary_lesson_title
         return result
 
 
@@ -289,8 +377,8 @@ class Quiz(Base):
     shuffle_questions = Column(Integer, default=0)
     shuffle_options = Column(Integer, default=0)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relationships
     course = relationship("Course", back_populates="quizzes")
@@ -306,9 +394,9 @@ class Quiz(Base):
             'passing_score': self.passing_score,
             'shuffle_questions': bool(self.shuffle_questions),
             'shuffle_options': bool(self.shuffle_options),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'question_count': len(self.quiz_questions) if self.quiz_questions else 0
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at),
+            'question_count': self.question_count or 0
         }
         if include_questions:
             result['questions'] = [qq.question.to_dict() for qq in self.quiz_questions]
@@ -318,10 +406,12 @@ class Quiz(Base):
 class QuizQuestion(Base):
     """Association table between Quiz and Question with ordering"""
     __tablename__ = 'quiz_questions'
+    # Quiz questions are read per quiz in order_index order
+    __table_args__ = (Index('ix_quiz_questions_quiz_order', 'quiz_id', 'order_index'),)
     
     id = Column(Integer, primary_key=True)
     quiz_id = Column(Integer, ForeignKey('quizzes.id', ondelete='CASCADE'), nullable=False)
-    question_id = Column(Integer, ForeignKey('questions.id', ondelete='CASCADE'), nullable=False)
+    question_id = Column(Integer, ForeignKey('questions.id', ondelete='CASCADE'), nullable=False, index=True)
     order_index = Column(Integer, default=0)
     points = Column(Float, default=1.0)
     
@@ -330,6 +420,26 @@ class QuizQuestion(Base):
     question = relationship("Question", back_populates="quiz_questions")
 
 
+# Child counts for to_dict, computed by a correlated COUNT in the parent's own
+# SELECT instead of loading every child row just to take len() of it
+Course.lesson_count = column_property(
+    select(func.count(Lesson.id)).where(Lesson.course_id == Course.id)
+    .correlate_except(Lesson).scalar_subquery()
+)
+Lesson.section_count = column_property(
+    select(func.count(Section.id)).where(Section.lesson_id == Lesson.id)
+    .correlate_except(Section).scalar_subquery()
+)
+Section.learning_object_count = column_property(
+    select(func.count(LearningObject.id)).where(LearningObject.section_id == Section.id)
+    .correlate_except(LearningObject).scalar_subquery()
+)
+Quiz.question_count = column_property(
+    select(func.count(QuizQuestion.id)).where(QuizQuestion.quiz_id == Quiz.id)
+    .correlate_except(QuizQuestion).scalar_subquery()
+)
+
+
 class QuestionTranslation(Base):
     """Stores translations of questions in different languages"""
     __tablename__ = 'question_translations'
@@ -340,12 +450,12 @@ class QuestionTranslation(Base):
     language_name = Column(String(50), nullable=False)  # e.g., 'English', 'Serbian', 'French'
     
     translated_question_text = Column(Text, nullable=False)
-    translated_options = Column(JSON, nullable=True)  # Translated options for multiple choice
+    translated_options = Column(JSONText, nullable=True)  # Translated options for multiple choice
     translated_correct_answer = Column(Text, nullable=True)
     translated_explanation = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Relationships
     question = relationship("Question", backref="translations")
@@ -360,8 +470,8 @@ class QuestionTranslation(Base):
             'translated_options': self.translated_options,
             'translated_correct_answer': self.translated_correct_answer,
             'translated_explanation': self.translated_explanation,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
         }
 
 
@@ -377,8 +487,8 @@ class LessonTranslation(Base):
     translated_title = Column(String(255), nullable=False)
     translated_summary = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     lesson = relationship("Lesson", backref="lesson_translations")
     
@@ -390,8 +500,8 @@ class LessonTranslation(Base):
             'language_name': self.language_name,
             'translated_title': self.translated_title,
             'translated_summary': self.translated_summary,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
         }
 
 
@@ -408,8 +518,8 @@ class SectionTranslation(Base):
     translated_content = Column(Text, nullable=True)
     translated_summary = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     section = relationship("Section", backref="section_translations")
     
@@ -422,8 +532,8 @@ class SectionTranslation(Base):
             'translated_title': self.translated_title,
             'translated_content': self.translated_content,
             'translated_summary': self.translated_summary,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
         }
 
 
@@ -439,11 +549,11 @@ class LearningObjectTranslation(Base):
     translated_title = Column(String(255), nullable=False)
     translated_content = Column(Text, nullable=True)
     translated_description = Column(Text, nullable=True)
-    translated_key_points = Column(JSON, nullable=True)
-    translated_keywords = Column(JSON, nullable=True)
+    translated_key_points = Column(JSONText, nullable=True)
+    translated_keywords = Column(JSONText, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     learning_object = relationship("LearningObject", backref="learning_object_translations")
     
@@ -458,8 +568,8 @@ class LearningObjectTranslation(Base):
             'translated_description': self.translated_description,
             'translated_key_points': self.translated_key_points,
             'translated_keywords': self.translated_keywords,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
         }
 
 
@@ -475,8 +585,8 @@ class OntologyTranslation(Base):
     translated_relationship_type = Column(String(100), nullable=False)
     translated_description = Column(Text, nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     concept_relationship = relationship("ConceptRelationship", backref="ontology_translations")
     
@@ -488,6 +598,6 @@ class OntologyTranslation(Base):
             'language_name': self.language_name,
             'translated_relationship_type': self.translated_relationship_type,
             'translated_description': self.translated_description,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
         }
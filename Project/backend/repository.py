@@ -3,8 +3,8 @@ Database Repository
 All CRUD operations for the SOLO Quiz Generator database
 """
 
-from datetime import datetime
-from sqlalchemy.orm import joinedload
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import aliased, joinedload, raiseload, selectinload
 from models import (
     Base, engine, Session,
     Course, Lesson, Section, LearningObject, 
@@ -13,11 +13,30 @@ from models import (
     LearningObjectTranslation, OntologyTranslation
 )
 
+# Rows fetched per round when list endpoints read large result sets: each
+# batch is turned into dicts before the next is loaded, so the ORM objects
+# (or raw rows) for the whole result never sit in memory at once
+_YIELD_BATCH = 500
+
+
+def _list_load_options(*relationships):
+    """
+    Query options for a to_dict list endpoint: the relationships to_dict
+    reads are loaded with one IN-query each, and any other lazy load raises
+    instead of quietly issuing a query per row.
+    """
+    return [selectinload(rel) for rel in relationships] + [raiseload('*')]
+
 
 def init_database():
-    """Initialize the database, creating all tables"""
+    """Initialize the database, creating all tables and indexes"""
     from models.models import DB_PATH
     Base.metadata.create_all(engine)
+    # create_all only indexes tables it creates; add indexes declared since
+    # to an existing database (CREATE INDEX IF NOT EXISTS semantics)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     print(f"[DATABASE] Initialized at {DB_PATH}")
 
 
@@ -34,6 +53,17 @@ class DatabaseManager:
     def get_session(self):
         return self.Session()
     
+    @staticmethod
+    def _next_order_index(session, order_column, parent_column, parent_id):
+        """One past the highest order_index under a parent (0 for none).
+        
+        MAX is answered from the (parent, order_index) index and, unlike a
+        row count, never reuses a position after a deletion.
+        """
+        return session.query(
+            func.coalesce(func.max(order_column), -1) + 1
+        ).filter(parent_column == parent_id).scalar()
+    
     # ==================== COURSE OPERATIONS ====================
     
     def create_course(self, name, code=None, description=None):
@@ -49,7 +79,7 @@ class DatabaseManager:
     def get_all_courses(self):
         session = self.get_session()
         try:
-            courses = session.query(Course).all()
+            courses = session.query(Course).options(*_list_load_options()).all()
             return [c.to_dict() for c in courses]
         finally:
             session.close()
@@ -79,7 +109,9 @@ class DatabaseManager:
     def create_lesson(self, course_id, title, filename=None, file_path=None, raw_content=None):
         session = self.get_session()
         try:
-            max_order = session.query(Lesson).filter(Lesson.course_id == course_id).count()
+            max_order = self._next_order_index(
+                session, Lesson.order_index, Lesson.course_id, course_id
+            )
             lesson = Lesson(
                 course_id=course_id,
                 title=title,
@@ -97,7 +129,9 @@ class DatabaseManager:
     def get_lessons_for_course(self, course_id):
         session = self.get_session()
         try:
-            lessons = session.query(Lesson).filter(Lesson.course_id == course_id).order_by(Lesson.order_index).all()
+            lessons = session.query(Lesson).options(
+                *_list_load_options(Lesson.lesson_translations)
+            ).filter(Lesson.course_id == course_id).order_by(Lesson.order_index).all()
             return [l.to_dict() for l in lessons]
         finally:
             session.close()
@@ -113,7 +147,15 @@ class DatabaseManager:
     def get_lesson_with_sections(self, lesson_id):
         session = self.get_session()
         try:
-            lesson = session.query(Lesson).filter(Lesson.id == lesson_id).first()
+            # Sections, their learning objects and every translation list the
+            # to_dict methods read come in one IN-query per level, not per row
+            section_los = selectinload(Lesson.sections).selectinload(Section.learning_objects)
+            lesson = session.query(Lesson).options(
+                selectinload(Lesson.lesson_translations),
+                selectinload(Lesson.sections).selectinload(Section.section_translations),
+                section_los,
+                section_los.selectinload(LearningObject.learning_object_translations)
+            ).filter(Lesson.id == lesson_id).first()
             if not lesson:
                 return None
             
@@ -122,14 +164,7 @@ class DatabaseManager:
             
             for s in lesson.sections:
                 section_dict = s.to_dict(include_content=True)
-                try:
-                    learning_objects = session.query(LearningObject).filter(
-                        LearningObject.section_id == s.id
-                    ).all()
-                    section_dict['learning_objects'] = [lo.to_dict() for lo in learning_objects]
-                except Exception as e:
-                    print(f"[WARNING] Could not load learning objects for section {s.id}: {str(e)}")
-                    section_dict['learning_objects'] = []
+                section_dict['learning_objects'] = [lo.to_dict() for lo in s.learning_objects]
                 sections_list.append(section_dict)
             
             result['sections'] = sections_list
@@ -154,7 +189,9 @@ class DatabaseManager:
     def create_section(self, lesson_id, title, content=None, start_page=None, end_page=None):
         session = self.get_session()
         try:
-            max_order = session.query(Section).filter(Section.lesson_id == lesson_id).count()
+            max_order = self._next_order_index(
+                session, Section.order_index, Section.lesson_id, lesson_id
+            )
             section = Section(
                 lesson_id=lesson_id,
                 title=title,
@@ -172,7 +209,9 @@ class DatabaseManager:
     def get_sections_for_lesson(self, lesson_id):
         session = self.get_session()
         try:
-            sections = session.query(Section).filter(Section.lesson_id == lesson_id).order_by(Section.order_index).all()
+            sections = session.query(Section).options(
+                *_list_load_options(Section.section_translations)
+            ).filter(Section.lesson_id == lesson_id).order_by(Section.order_index).all()
             return [s.to_dict() for s in sections]
         finally:
             session.close()
@@ -180,7 +219,12 @@ class DatabaseManager:
     def get_section_with_learning_objects(self, section_id):
         session = self.get_session()
         try:
-            section = session.query(Section).filter(Section.id == section_id).first()
+            section = session.query(Section).options(
+                selectinload(Section.section_translations),
+                selectinload(Section.learning_objects).selectinload(
+                    LearningObject.learning_object_translations
+                )
+            ).filter(Section.id == section_id).first()
             if not section:
                 return None
             result = section.to_dict(include_content=True)
@@ -194,7 +238,9 @@ class DatabaseManager:
     def create_learning_object(self, section_id, title, content=None, object_type=None, keywords=None, is_ai_generated=True):
         session = self.get_session()
         try:
-            max_order = session.query(LearningObject).filter(LearningObject.section_id == section_id).count()
+            max_order = self._next_order_index(
+                session, LearningObject.order_index, LearningObject.section_id, section_id
+            )
             lo = LearningObject(
                 section_id=section_id,
                 title=title,
@@ -213,23 +259,27 @@ class DatabaseManager:
     def update_learning_object(self, lo_id, title=None, content=None, object_type=None, keywords=None, mark_as_human_modified=False):
         session = self.get_session()
         try:
-            lo = session.query(LearningObject).filter(LearningObject.id == lo_id).first()
-            if not lo:
-                return None
-            
-            if title is not None:
-                lo.title = title
-            if content is not None:
-                lo.content = content
-            if object_type is not None:
-                lo.object_type = object_type
-            if keywords is not None:
-                lo.keywords = keywords
+            values = {
+                key: value for key, value in (
+                    ('title', title), ('content', content),
+                    ('object_type', object_type), ('keywords', keywords)
+                ) if value is not None
+            }
             if mark_as_human_modified:
-                lo.human_modified = 1
-            lo.updated_at = datetime.utcnow()
-            
+                values['human_modified'] = 1
+            # Single UPDATE, no SELECT of the row first
+            result = session.execute(
+                update(LearningObject).where(LearningObject.id == lo_id)
+                .values(**values)
+            )
+            if not result.rowcount:
+                session.rollback()
+                return None
             session.commit()
+
+            lo = session.query(LearningObject).options(
+                *_list_load_options(LearningObject.learning_object_translations)
+            ).filter(LearningObject.id == lo_id).one()
             return lo.to_dict()
         finally:
             session.close()
@@ -249,7 +299,9 @@ class DatabaseManager:
     def get_learning_objects_for_section(self, section_id):
         session = self.get_session()
         try:
-            los = session.query(LearningObject).filter(LearningObject.section_id == section_id).order_by(LearningObject.order_index).all()
+            los = session.query(LearningObject).options(
+                *_list_load_options(LearningObject.learning_object_translations)
+            ).filter(LearningObject.section_id == section_id).order_by(LearningObject.order_index).all()
             return [lo.to_dict() for lo in los]
         finally:
             session.close()
@@ -274,15 +326,20 @@ class DatabaseManager:
     def get_relationships_for_lesson(self, lesson_id):
         session = self.get_session()
         try:
-            sections = session.query(Section).filter(Section.lesson_id == lesson_id).all()
-            section_ids = [s.id for s in sections]
-            los = session.query(LearningObject).filter(LearningObject.section_id.in_(section_ids)).all()
-            lo_ids = [lo.id for lo in los]
-            
-            rels = session.query(ConceptRelationship).filter(
-                ConceptRelationship.source_id.in_(lo_ids) | 
+            # The lesson's learning object ids stay a subquery, so the whole
+            # lookup is one statement with both endpoint titles joined in
+            lo_ids = select(LearningObject.id).join(
+                Section, LearningObject.section_id == Section.id
+            ).where(Section.lesson_id == lesson_id).scalar_subquery()
+
+            rels = session.query(ConceptRelationship).options(
+                joinedload(ConceptRelationship.source),
+                joinedload(ConceptRelationship.target),
+                raiseload('*')
+            ).filter(
+                ConceptRelationship.source_id.in_(lo_ids) |
                 ConceptRelationship.target_id.in_(lo_ids)
-            ).all()
+            ).yield_per(_YIELD_BATCH)
             return [r.to_dict() for r in rels]
         finally:
             session.close()
@@ -303,16 +360,21 @@ class DatabaseManager:
             session.close()
 
     def bulk_create_relationships(self, relationships_data):
+        rows = [
+            {
+                'source_id': r_data['source_id'],
+                'target_id': r_data['target_id'],
+                'relationship_type': r_data['relationship_type'],
+                'description': r_data.get('description')
+            }
+            for r_data in relationships_data
+        ]
+        if not rows:
+            return True
         session = self.get_session()
         try:
-            for r_data in relationships_data:
-                rel = ConceptRelationship(
-                    source_id=r_data['source_id'],
-                    target_id=r_data['target_id'],
-                    relationship_type=r_data['relationship_type'],
-                    description=r_data.get('description')
-                )
-                session.add(rel)
+            # One executemany INSERT instead of a unit-of-work flush per row
+            session.execute(insert(ConceptRelationship), rows)
             session.commit()
             return True
         except Exception as e:
@@ -356,21 +418,28 @@ class DatabaseManager:
     def update_question(self, question_id, **kwargs):
         session = self.get_session()
         try:
-            question = session.query(Question).filter(Question.id == question_id).first()
-            if not question:
-                return None
-            
             mark_human_modified = kwargs.pop('mark_human_modified', False)
             
-            for key, value in kwargs.items():
-                if hasattr(question, key) and value is not None:
-                    setattr(question, key, value)
-            
+            columns = Question.__table__.c
+            values = {
+                key: value for key, value in kwargs.items()
+                if key in columns and value is not None
+            }
             if mark_human_modified:
-                question.human_modified = 1
-            question.updated_at = datetime.utcnow()
-            
+                values['human_modified'] = 1
+            # Single UPDATE, no SELECT of the row first
+            result = session.execute(
+                update(Question).where(Question.id == question_id)
+                .values(**values)
+            )
+            if not result.rowcount:
+                session.rollback()
+                return None
             session.commit()
+
+            question = session.query(Question).options(
+                *self._question_load_options()
+            ).filter(Question.id == question_id).one()
             return question.to_dict()
         finally:
             session.close()
@@ -378,10 +447,10 @@ class DatabaseManager:
     def get_questions_by_lesson(self, lesson_id):
         session = self.get_session()
         try:
-            questions = session.query(Question).filter(
+            questions = session.query(Question).options(*self._question_load_options()).filter(
                 (Question.primary_lesson_id == lesson_id) | 
                 (Question.secondary_lesson_id == lesson_id)
-            ).all()
+            ).yield_per(_YIELD_BATCH)
             return [q.to_dict() for q in questions]
         finally:
             session.close()
@@ -389,7 +458,9 @@ class DatabaseManager:
     def get_questions_by_solo_level(self, solo_level, lesson_id=None):
         session = self.get_session()
         try:
-            query = session.query(Question).filter(Question.solo_level == solo_level)
+            query = session.query(Question).options(*self._question_load_options()).filter(
+                Question.solo_level == solo_level
+            )
             if lesson_id:
                 query = query.filter(
                     (Question.primary_lesson_id == lesson_id) | 
@@ -403,18 +474,58 @@ class DatabaseManager:
     def get_all_questions(self, course_id=None):
         session = self.get_session()
         try:
+            criteria = []
             if course_id:
-                lessons = session.query(Lesson).filter(Lesson.course_id == course_id).all()
-                lesson_ids = [l.id for l in lessons]
-                questions = session.query(Question).filter(
+                lesson_ids = select(Lesson.id).where(Lesson.course_id == course_id)
+                criteria.append(
                     (Question.primary_lesson_id.in_(lesson_ids)) | 
                     (Question.secondary_lesson_id.in_(lesson_ids))
-                ).all()
-            else:
-                questions = session.query(Question).all()
-            return [q.to_dict() for q in questions]
-        finally:
-            session.close()
+                )
+            return self._question_dicts(session, criteria)
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _question_load_options():
+        """Load options for listing Question.to_dict rows through the ORM"""
+        return _list_load_options(
+            Question.primary_lesson, Question.secondary_lesson, Question.translations
+        )
+    
+    def _question_dicts(self, session, criteria):
+        """
+        Question.to_dict for every question matching `criteria`, read as
+        plain rows: one query for the questions with their lesson titles and
+        one for their translations, with no ORM objects for the questions.
+        """
+        primary = aliased(Lesson)
+        secondary = aliased(Lesson)
+        rows = session.execute(
+            select(
+                Question.__table__,
+                primary.title.label('primary_lesson_title'),
+                secondary.title.label('secondary_lesson_title')
+            )
+            .outerjoin(primary, Question.primary_lesson_id == primary.id)
+            .outerjoin(secondary, Question.secondary_lesson_id == secondary.id)
+            .where(*criteria)
+            .order_by(Question.id)
+            .execution_options(yield_per=_YIELD_BATCH)
+        )
+        
+        translations = {}
+        for t in session.query(QuestionTranslation).join(
+            Question, QuestionTranslation.question_id == Question.id
+        ).filter(*criteria).order_by(QuestionTranslation.id):
+            translations.setdefault(t.question_id, []).append(t.to_dict())
+        
+        return [
+            Question.build_dict(
+                row, translations.get(row.id, []),
+                row.primary_lesson_title, row.secondary_lesson_title
+            )
+            for row in rows
+        ]
     
     def delete_question(self, question_id):
         session = self.get_session()
@@ -463,17 +574,29 @@ class DatabaseManager:
             session.close()
     
     def add_question_to_quiz(self, quiz_id, question_id, points=1.0):
+        return self.add_questions_to_quiz(quiz_id, [question_id], points=points)
+    
+    def add_questions_to_quiz(self, quiz_id, question_ids, points=1.0):
+        """
+        Append questions to a quiz in order, in one transaction: one
+        order_index lookup and one commit for the whole list instead of a
+        lookup + commit (and fsync) per question.
+        """
         session = self.get_session()
         try:
-            max_order = session.query(QuizQuestion).filter(QuizQuestion.quiz_id == quiz_id).count()
-            qq = QuizQuestion(
-                quiz_id=quiz_id,
-                question_id=question_id,
-                order_index=max_order,
-                points=points
-            )
-            session.add(qq)
-            session.commit()
+            with session.begin():
+                next_order = self._next_order_index(
+                    session, QuizQuestion.order_index, QuizQuestion.quiz_id, quiz_id
+                )
+                session.add_all([
+                    QuizQuestion(
+                        quiz_id=quiz_id,
+                        question_id=question_id,
+                        order_index=next_order + offset,
+                        points=points
+                    )
+                    for offset, question_id in enumerate(question_ids)
+                ])
             return True
         finally:
             session.close()
@@ -497,7 +620,9 @@ class DatabaseManager:
     def get_quizzes_for_course(self, course_id):
         session = self.get_session()
         try:
-            quizzes = session.query(Quiz).filter(Quiz.course_id == course_id).all()
+            quizzes = session.query(Quiz).options(
+                *_list_load_options()
+            ).filter(Quiz.course_id == course_id).all()
             return [q.to_dict() for q in quizzes]
         finally:
             session.close()
@@ -58,8 +58,7 @@ def create_quiz():
             shuffle_options=data.get('shuffle_options', False)
         )
 
-        for qid in data.get('question_ids', []):
-            db.add_question_to_quiz(quiz['id'], qid)
+        db.add_questions_to_quiz(quiz['id'], data.get('question_ids', []))
 
         updated_quiz = db.get_quiz(quiz['id'], include_questions=False)
         return jsonify({'quiz': updated_quiz}), 201
@@ -98,8 +97,7 @@ def add_questions_to_quiz(quiz_id):
         data = request.get_json()
         question_ids = data.get('question_ids', [])
 
-        for qid in question_ids:
-            db.add_question_to_quiz(quiz_id, qid)
+        db.add_questions_to_quiz(quiz_id, question_ids)
 
         return jsonify({'message': f'Added {len(question_ids)} questions to quiz'}), 200
     except Exception as e:
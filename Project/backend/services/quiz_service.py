@@ -36,9 +36,7 @@ class QuizService:
             if not quiz:
                 return {'error': 'Quiz not found', 'status': 404}
             
-            # Add each question to the quiz
-            for q_id in question_ids:
-                db.add_question_to_quiz(quiz_id, q_id)
+            db.add_questions_to_quiz(quiz_id, question_ids)
             
             # Return updated quiz
             updated_quiz = db.get_quiz_with_questions(quiz_id)